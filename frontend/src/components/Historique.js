@@ -1,6 +1,6 @@
-import React, { useState, useEffect } from 'react';
+import React, { useState, useEffect, useRef } from 'react';
 import { Container, Table, Alert, Spinner, Button, Modal, Form, Badge } from 'react-bootstrap';
-import { getMesRendezVous, modifierRendezVous, supprimerRendezVous } from '../services/api';
+import { getMesRendezVous, modifierRendezVous, supprimerRendezVous, nouvelleCleIdempotence } from '../services/api';
 import QRCode from 'react-qr-code';
 
 function Historique() {
@@ -13,6 +13,12 @@ function Historique() {
   const [formData, setFormData] = useState({});
   const [modifying, setModifying] = useState(false);
   const [suppriming, setSuppriming] = useState(false);
+  // Une clé par saisie : renvoyer la même modification ne l'applique qu'une fois
+  const cleIdempotence = useRef(nouvelleCleIdempotence());
+
+  useEffect(() => {
+    cleIdempotence.current = nouvelleCleIdempotence();
+  }, [formData]);
 
   const fetchRdvs = async () => {
     setLoading(true);
@@ -79,7 +85,7 @@ function Historique() {
     e.preventDefault();
     setModifying(true);
     try {
-      const response = await modifierRendezVous(selectedRdv.id, formData);
+      const response = await modifierRendezVous(selectedRdv.id, formData, cleIdempotence.current);
       if (response.error) {
         setError(response.error);
       } else {
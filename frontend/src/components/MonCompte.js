@@ -3,6 +3,7 @@ import { Container, Card, Row, Col, Alert, Spinner, Button, Modal, Form } from '
 
 const MonCompte = () => {
   const [userInfo, setUserInfo] = useState(null);
+  const [compteurs, setCompteurs] = useState(null);
   const [loading, setLoading] = useState(true);
   const [error, setError] = useState('');
   const [showPwdModal, setShowPwdModal] = useState(false);
@@ -22,8 +23,8 @@ const MonCompte = () => {
           return;
         }
 
-        // Récupérer les informations complètes du profil via l'API
-        const response = await fetch('/api/profil/', {
+        // Profil et compteurs de rendez-vous en une seule requête
+        const response = await fetch('/api/me/', {
           headers: {
             'Authorization': `Bearer ${token}`,
             'Content-Type': 'application/json',
@@ -32,7 +33,8 @@ const MonCompte = () => {
 
         if (response.ok) {
           const data = await response.json();
-          setUserInfo(data);
+          setUserInfo(data.profil);
+          setCompteurs(data.compteurs);
         } else {
           // Fallback: décoder le token JWT si l'API échoue
           const payload = JSON.parse(atob(token.split('.')[1]));
@@ -91,6 +93,9 @@ const MonCompte = () => {
       });
       const data = await response.json();
       if (response.ok) {
+        // Les anciens tokens sont révoqués par le changement de mot de passe
+        localStorage.setItem('token', data.access);
+        localStorage.setItem('refresh', data.refresh);
         setPwdSuccess('Mot de passe changé avec succès.');
         setPwdForm({ old_password: '', new_password: '', confirm_password: '' });
       } else {
@@ -177,6 +182,19 @@ const MonCompte = () => {
                   </div>
                 </div>
 
+                {compteurs && (
+                  <div className="mb-4">
+                    <h5 style={{ color: '#1A3761', fontWeight: 600, marginBottom: 20 }}>Mes rendez-vous</h5>
+                    <div className="d-flex justify-content-between text-center">
+                      <div><strong>{compteurs.total}</strong><div className="text-muted">Total</div></div>
+                      <div><strong>{compteurs.en_attente}</strong><div className="text-muted">En attente</div></div>
+                      <div><strong>{compteurs.valide}</strong><div className="text-muted">Validés</div></div>
+                      <div><strong>{compteurs.termine}</strong><div className="text-muted">Terminés</div></div>
+                      <div><strong>{compteurs.annule}</strong><div className="text-muted">Annulés</div></div>
+                    </div>
+                  </div>
+                )}
+
                 <div className="d-grid gap-2 mb-3">
                   <Button 
                     variant="outline-danger" 
@@ -1,7 +1,7 @@
-import React, { useState, useEffect } from 'react';
+import React, { useState, useEffect, useRef } from 'react';
 import { useNavigate } from 'react-router-dom';
 import { Container, Row, Col, Form, Button, Alert, Card } from 'react-bootstrap';
-import { rendezVousService } from '../services/api';
+import { rendezVousService, nouvelleCleIdempotence } from '../services/api';
 import QRCode from 'react-qr-code';
 import { format } from 'date-fns';
 import { fr } from 'date-fns/locale';
@@ -36,6 +36,10 @@ const RendezVousForm = ({ type = 'import' }) => {
   const [error, setError] = useState('');
   const [rendezVous, setRendezVous] = useState(null);
   const [creneauxPleins, setCreneauxPleins] = useState([]);
+  const [fileAttente, setFileAttente] = useState(null);
+  const [suggestions, setSuggestions] = useState([]);
+  // Même clé pour les nouvelles tentatives d'une même saisie (réseau mobile instable)
+  const cleIdempotence = useRef(nouvelleCleIdempotence());
 
   useEffect(() => {
     const token = localStorage.getItem('token');
@@ -55,23 +59,52 @@ const RendezVousForm = ({ type = 'import' }) => {
       setCreneauxPleins([]);
       return;
     }
-    // Remplacez l'URL par celle de votre backend
-    fetch(`/api/rdv/creneaux-pleins/?date=${formData.date_rdv}`)
-      .then(res => res.json())
-      .then(data => {
-        setCreneauxPleins(data);
-      })
-      .catch(() => setCreneauxPleins([]));
+    // Occupation en direct : instantané puis créneaux modifiés à chaque réservation
+    // ou annulation ; EventSource se reconnecte seul
+    let occupation = {};
+    const source = new EventSource(`/api/rdv/creneaux/flux/?date=${formData.date_rdv}`);
+    const appliquer = (instantane) => (e) => {
+      const data = JSON.parse(e.data);
+      occupation = instantane ? data.creneaux : { ...occupation, ...data.creneaux };
+      setCreneauxPleins(
+        Object.keys(occupation).filter(heure => occupation[heure] >= data.capacite).sort()
+      );
+    };
+    source.addEventListener('instantane', appliquer(true));
+    source.addEventListener('occupation', appliquer(false));
+    return () => source.close();
   }, [formData.date_rdv]);
 
   const handleInputChange = (e) => {
     const { name, value } = e.target;
+    cleIdempotence.current = nouvelleCleIdempotence();
     setFormData(prev => ({
       ...prev,
       [name]: value
     }));
   };
 
+  // Prochains créneaux réservables à partir de la date choisie
+  const proposerCreneaux = async () => {
+    try {
+      const data = await rendezVousService.getProchainsCreneaux({
+        plaque: formData.plaque_camion,
+        operation: type,
+        date: formData.date_rdv,
+      });
+      setSuggestions(data.creneaux);
+    } catch (err) {
+      setSuggestions([]);
+    }
+  };
+
+  const choisirCreneau = (creneau) => {
+    cleIdempotence.current = nouvelleCleIdempotence();
+    setFormData(prev => ({ ...prev, date_rdv: creneau.date, heure_rdv: creneau.heure }));
+    setSuggestions([]);
+    setError('');
+  };
+
   const validateForm = () => {
     const errors = [];
     if (!formData.cin.match(/^[A-Z]{1,2}\d{6}$/)) {
@@ -121,9 +154,15 @@ const RendezVousForm = ({ type = 'import' }) => {
         code_unique: '', // Sera généré par le backend
         user: null // Sera géré par le backend
       };
-      const response = await rendezVousService.createRendezVous(dataToSend);
+      const response = await rendezVousService.createRendezVous(
+        dataToSend,
+        cleIdempotence.current,
+        (position, attente) => setFileAttente(position ? { position, attente } : null)
+      );
+      cleIdempotence.current = nouvelleCleIdempotence();
       setRendezVous(response);
       setSuccess(true);
+      setSuggestions([]);
       setFormData({
         cin: '',
         plaque_camion: '',
@@ -135,6 +174,8 @@ const RendezVousForm = ({ type = 'import' }) => {
     } catch (err) {
       if (typeof err === 'object' && err.non_field_errors) {
         setError(err.non_field_errors.join('\n'));
+        // Camion déjà pris sur ce créneau : proposer les suivants
+        proposerCreneaux();
       } else if (typeof err === 'object') {
         const fieldErrors = Object.values(err).flat();
         setError(fieldErrors.join('\n'));
@@ -142,6 +183,7 @@ const RendezVousForm = ({ type = 'import' }) => {
         setError(err.toString());
       }
     } finally {
+      setFileAttente(null);
       setLoading(false);
     }
   };
@@ -194,6 +236,32 @@ const RendezVousForm = ({ type = 'import' }) => {
                   </Alert>
                 )}
 
+                {suggestions.length > 0 && (
+                  <Alert variant="warning">
+                    <strong>Prochains créneaux disponibles :</strong>
+                    <div className="d-flex flex-wrap gap-2 mt-2">
+                      {suggestions.map(creneau => (
+                        <Button
+                          key={`${creneau.date}-${creneau.heure}`}
+                          variant="outline-primary"
+                          size="sm"
+                          onClick={() => choisirCreneau(creneau)}
+                        >
+                          {format(new Date(`${creneau.date}T00:00`), 'EEE d MMM', { locale: fr })} {creneau.heure} - {creneau.fin}
+                        </Button>
+                      ))}
+                    </div>
+                  </Alert>
+                )}
+
+                {fileAttente && (
+                  <Alert variant="info">
+                    Forte affluence : vous êtes en position {fileAttente.position} dans la file
+                    d'attente (environ {fileAttente.attente} s). Gardez cette page ouverte,
+                    votre demande sera envoyée automatiquement.
+                  </Alert>
+                )}
+
                 {success && rendezVous && (
                   <div style={{ 
                     background: 'linear-gradient(135deg, #E6F7FB 0%, #D4F1F8 100%)', 
@@ -394,6 +462,9 @@ const RendezVousForm = ({ type = 'import' }) => {
                         <Form.Text className="text-muted">
                           Créneaux de 2h disponibles entre 6h00 et 22h00
                         </Form.Text>
+                        <Button variant="link" size="sm" className="px-0 d-block" onClick={proposerCreneaux}>
+                          Trouver le prochain créneau libre
+                        </Button>
                       </Form.Group>
                     </Col>
                   </Row>
@@ -1,6 +1,8 @@
 import axios from 'axios';
 
-const API_BASE_URL = 'http://localhost:8000';
+// Même origine que Django (build servi à la racine, proxy /api en développement) :
+// pas de requête CORS préalable avant chaque appel authentifié
+const API_BASE_URL = '';
 
 // Fonction pour renouveler le token
 const refreshToken = async () => {
@@ -33,8 +35,27 @@ const refreshToken = async () => {
   }
 };
 
+const pause = (secondes) => new Promise((resolve) => setTimeout(resolve, secondes * 1000));
+
+// Salle d'attente : consulte le ticket jusqu'à son tour et retourne le jeton
+// de passage ; suiviAttente(position, attenteEstimee) est appelé à chaque étape
+const attendreSonTour = async (fileAttente, suiviAttente) => {
+  const { jeton } = fileAttente;
+  let { position, attente_estimee: attente, consulter_dans: delai } = fileAttente;
+  for (;;) {
+    if (suiviAttente) suiviAttente(position, attente);
+    await pause(delai);
+    const response = await fetch(API_BASE_URL + `/api/file-attente/?jeton=${encodeURIComponent(jeton)}`);
+    const data = await response.json().catch(() => ({}));
+    if (!response.ok) throw data;
+    if (data.admis) return data.passage;
+    ({ position, attente_estimee: attente, consulter_dans: delai } = data);
+  }
+};
+
 // Fonction pour faire une requête avec renouvellement automatique du token
-const apiRequest = async (url, options = {}) => {
+// et passage par la salle d'attente si le serveur répond 503 avec un ticket
+const apiRequest = async (url, { suiviAttente, ...options } = {}) => {
   let token = localStorage.getItem('token');
   
   // Ajouter le token à l'en-tête Authorization
@@ -48,11 +69,23 @@ const apiRequest = async (url, options = {}) => {
   }
 
   try {
-    const response = await fetch(url, {
+    let response = await fetch(url, {
       ...options,
       headers,
     });
 
+    if (response.status === 503) {
+      const data = await response.clone().json().catch(() => ({}));
+      if (data.file_attente) {
+        headers['X-Salle-Attente'] = await attendreSonTour(data.file_attente, suiviAttente);
+        if (suiviAttente) suiviAttente(null);
+        response = await fetch(url, {
+          ...options,
+          headers,
+        });
+      }
+    }
+
     // Si la réponse est 401 (token expiré), essayer de le renouveler
     if (response.status === 401) {
       try {
@@ -100,16 +133,34 @@ const api = axios.create({
   },
 });
 
+// Clé Idempotency-Key : la garder pour réessayer la même saisie, le serveur
+// renvoie alors la réponse déjà obtenue au lieu de créer un doublon
+export const nouvelleCleIdempotence = () =>
+  (window.crypto && window.crypto.randomUUID)
+    ? window.crypto.randomUUID()
+    : `${Date.now()}-${Math.random().toString(16).slice(2)}`;
+
 // Service pour les rendez-vous
 export const rendezVousService = {
   // Créer un nouveau rendez-vous
-  createRendezVous: async (data) => {
+  createRendezVous: async (data, cleIdempotence = nouvelleCleIdempotence(), suiviAttente) => {
     return await apiRequest(API_BASE_URL + '/api/rendez-vous/', {
       method: 'POST',
+      headers: { 'Idempotency-Key': cleIdempotence },
       body: JSON.stringify(data),
+      suiviAttente,
     });
   },
 
+  // Premiers créneaux libres, hors créneaux complets et conflits du camion
+  getProchainsCreneaux: async ({ plaque, operation, date, n = 5 } = {}) => {
+    const params = new URLSearchParams({ n });
+    if (plaque) params.set('plaque', plaque);
+    if (operation) params.set('operation', operation);
+    if (date) params.set('date', date);
+    return await apiRequest(API_BASE_URL + `/api/rdv/prochains-creneaux/?${params}`);
+  },
+
   // Obtenir tous les rendez-vous
   getAllRendezVous: async () => {
     try {
@@ -219,10 +270,11 @@ export const getMesRendezVous = async () => {
   }
 };
 
-export const modifierRendezVous = async (id, data) => {
+export const modifierRendezVous = async (id, data, cleIdempotence = nouvelleCleIdempotence()) => {
   try {
     return await apiRequest(API_BASE_URL + `/api/modifier-rendez-vous/${id}/`, {
       method: 'PUT',
+      headers: { 'Idempotency-Key': cleIdempotence },
       body: JSON.stringify(data),
     });
   } catch (error) {
@@ -1,12 +1,63 @@
+const fs = require('fs');
 const path = require('path');
+const zlib = require('zlib');
 const HtmlWebpackPlugin = require('html-webpack-plugin');
 const webpack = require('webpack');
 
-module.exports = {
+const COMPRESSIBLES = /\.(js|css|html|svg|json|txt|map|ico)$/;
+
+// Copie public/ (sauf le gabarit index.html) et ajoute à chaque fichier
+// compressible ses variantes .gz et .br, servies par Django selon Accept-Encoding
+class PublicEtCompressionPlugin {
+  apply(compiler) {
+    const { RawSource } = compiler.webpack.sources;
+    const { Compilation } = compiler.webpack;
+    compiler.hooks.thisCompilation.tap('PublicEtCompression', (compilation) => {
+      compilation.hooks.processAssets.tap(
+        { name: 'PublicEtCompression', stage: Compilation.PROCESS_ASSETS_STAGE_ADDITIONAL },
+        () => {
+          const dossier = path.resolve(__dirname, 'public');
+          for (const nom of fs.readdirSync(dossier)) {
+            if (nom !== 'index.html' && !compilation.getAsset(nom)) {
+              compilation.emitAsset(nom, new RawSource(fs.readFileSync(path.join(dossier, nom))));
+            }
+          }
+        }
+      );
+      compilation.hooks.processAssets.tap(
+        { name: 'PublicEtCompression', stage: Compilation.PROCESS_ASSETS_STAGE_OPTIMIZE_TRANSFER },
+        (assets) => {
+          for (const nom of Object.keys(assets)) {
+            if (!COMPRESSIBLES.test(nom)) continue;
+            const contenu = assets[nom].buffer();
+            if (contenu.length < 1024) continue;
+            const variantes = {
+              '.gz': zlib.gzipSync(contenu, { level: 9 }),
+              '.br': zlib.brotliCompressSync(contenu, {
+                params: { [zlib.constants.BROTLI_PARAM_QUALITY]: zlib.constants.BROTLI_MAX_QUALITY },
+              }),
+            };
+            for (const [suffixe, compresse] of Object.entries(variantes)) {
+              if (compresse.length < contenu.length * 0.9) {
+                compilation.emitAsset(nom + suffixe, new RawSource(compresse));
+              }
+            }
+          }
+        }
+      );
+    });
+  }
+}
+
+module.exports = (env, argv) => ({
   entry: './src/index.js',
   output: {
     path: path.resolve(__dirname, 'dist'),
-    filename: 'bundle.js',
+    // En production, noms versionnés par le contenu : Django les sert avec un
+    // cache immuable (seul index.html est revalidé)
+    filename: argv.mode === 'production' ? 'assets/[name].[contenthash:12].js' : 'bundle.js',
+    chunkFilename: argv.mode === 'production' ? 'assets/[name].[contenthash:12].js' : '[name].js',
+    assetModuleFilename: 'assets/[name].[contenthash:12][ext]',
     publicPath: '/',
     clean: true,
   },
@@ -55,7 +106,8 @@ module.exports = {
     new webpack.ProvidePlugin({
       process: 'process/browser',
       Buffer: ['buffer', 'Buffer']
-    })
+    }),
+    ...(argv.mode === 'production' ? [new PublicEtCompressionPlugin()] : [])
   ],
   devServer: {
     static: {
@@ -68,4 +120,4 @@ module.exports = {
       '/api': 'http://127.0.0.1:8000'
     }
   }
-}; 
\ No newline at end of file
+});
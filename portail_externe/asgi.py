@@ -10,7 +10,12 @@ https://docs.djangoproject.com/en/4.2/howto/deployment/asgi/
 import os
 
 from django.core.asgi import get_asgi_application
+from django.urls import get_resolver
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'portail_externe.settings')
 
 application = get_asgi_application()
+
+# URLconf, vues, DRF et SimpleJWT chargés dès maintenant plutôt qu'à la première
+# requête : avec gunicorn --preload, les workers forkés en héritent tout chargé
+get_resolver().url_patterns
@@ -12,6 +12,10 @@ https://docs.djangoproject.com/en/4.2/ref/settings/
 
 from pathlib import Path
 import os
+import sys
+from decouple import config, Csv
+from corsheaders.defaults import default_headers
+from django.core.exceptions import ImproperlyConfigured
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -21,12 +25,12 @@ BASE_DIR = Path(__file__).resolve().parent.parent
 # See https://docs.djangoproject.com/en/4.2/howto/deployment/checklist/
 
 # SECURITY WARNING: keep the secret key used in production secret!
-SECRET_KEY = 'django-insecure-eq7sz99331d$*ltnlgfoa0d84+gd11k4)8e5!rk__36_$pk4lb'
+SECRET_KEY = config('SECRET_KEY', default='django-insecure-eq7sz99331d$*ltnlgfoa0d84+gd11k4)8e5!rk__36_$pk4lb')
 
 # SECURITY WARNING: don't run with debug turned on in production!
-DEBUG = True
+DEBUG = config('DEBUG', default=True, cast=bool)
 
-ALLOWED_HOSTS = ['localhost', '127.0.0.1']
+ALLOWED_HOSTS = config('ALLOWED_HOSTS', default='localhost,127.0.0.1', cast=Csv())
 
 
 # Application definition
@@ -44,6 +48,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'rendez_vous.middleware.InstrumentationMiddleware',
+    'rendez_vous.middleware.ProfilageMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
@@ -78,12 +84,41 @@ WSGI_APPLICATION = 'portail_externe.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/4.2/ref/settings/#databases
 
-DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+# DB_ENGINE=sqlite (défaut) ou postgresql
+
+DB_ENGINE = config('DB_ENGINE', default='sqlite')
+
+if DB_ENGINE == 'postgresql':
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.postgresql',
+            'NAME': config('DB_NAME', default='portail_externe'),
+            'USER': config('DB_USER', default='postgres'),
+            'PASSWORD': config('DB_PASSWORD', default=''),
+            'HOST': config('DB_HOST', default='localhost'),
+            'PORT': config('DB_PORT', default='5432'),
+            # Connexions persistantes, vérifiées avant chaque réutilisation
+            'CONN_MAX_AGE': config('DB_CONN_MAX_AGE', default=600, cast=int),
+            'CONN_HEALTH_CHECKS': True,
+        }
+    }
+else:
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': config('DB_NAME', default=str(BASE_DIR / 'db.sqlite3')),
+            'CONN_MAX_AGE': config('DB_CONN_MAX_AGE', default=0, cast=int),
+        }
     }
-}
+
+# PRAGMA appliqués à chaque nouvelle connexion SQLite (rendez_vous.signals) :
+# WAL laisse les lectures avancer pendant une écriture, busy_timeout fait
+# attendre les écritures concurrentes au lieu d'échouer avec "database is locked".
+SQLITE_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'busy_timeout': config('DB_SQLITE_BUSY_TIMEOUT', default=5000, cast=int),
+    'synchronous': 'NORMAL',
+} if config('DB_SQLITE_TUNING', default=True, cast=bool) else {}
 
 
 # Password validation
@@ -126,6 +161,15 @@ STATIC_ROOT = os.path.join(BASE_DIR, 'staticfiles')
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
+# Envoi des QR codes délégué au serveur web : 'x-accel-redirect' (nginx),
+# 'x-sendfile' (Apache, lighttpd) ou vide pour FileResponse
+MEDIA_SENDFILE = config('MEDIA_SENDFILE', default='')
+# Location interne nginx pointant sur MEDIA_ROOT
+MEDIA_SENDFILE_PREFIXE = config('MEDIA_SENDFILE_PREFIXE', default='/protected-media/')
+
+# Frontend React construit (cd frontend && npm run build), servi à la racine
+FRONTEND_DIST = config('FRONTEND_DIST', default=os.path.join(BASE_DIR, 'frontend', 'dist'))
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/4.2/ref/settings/#default-auto-field
 
@@ -144,6 +188,7 @@ CORS_ALLOWED_ORIGINS = [
 ]
 
 CORS_ALLOW_CREDENTIALS = True
+CORS_ALLOW_HEADERS = (*default_headers, 'idempotency-key', 'x-salle-attente')
 
 # CSRF settings for API
 CSRF_TRUSTED_ORIGINS = [
@@ -165,9 +210,180 @@ REST_FRAMEWORK = {
         'rest_framework.permissions.AllowAny',
     ],
     'DEFAULT_RENDERER_CLASSES': [
-        'rest_framework.renderers.JSONRenderer',
+        'rendez_vous.instrumentation.JSONRendererMesure',
     ],
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'rendez_vous.authentication.JWTAuthenticationCache',
     ],
+    'DEFAULT_THROTTLE_CLASSES': [
+        'rendez_vous.limitation.LimitationSeaux',
+    ],
+    # Proxies de confiance devant Django (nginx : 1). X-Forwarded-For n'est lu
+    # que pour ceux-là ; à 0, l'IP d'un anonyme est REMOTE_ADDR
+    'NUM_PROXIES': config('NUM_PROXIES', default=0, cast=int),
+}
+
+SIMPLE_JWT = {
+    # Les tokens émis avant un changement de mot de passe sont rejetés
+    'CHECK_REVOKE_TOKEN': True,
+}
+
+# Durée de vie (secondes) du cache utilisateur de l'authentification JWT
+JWT_CACHE_UTILISATEUR_TTL = 60
+
+# État local partagé par les workers d'une machine (cache d'authentification,
+# seaux de limitation...) : hors de l'arborescence du code, dans un répertoire
+# propre à l'utilisateur du service.
+ETAT_REPERTOIRE = config('ETAT_REPERTOIRE', default=str(
+    Path(config('XDG_CACHE_HOME', default=str(Path.home() / '.cache'))) / 'portail-externe'
+))
+
+# Cache 'authentification' (utilisateurs de JWTAuthenticationCache), partagé
+# par tous les workers : l'invalidation faite par le worker qui enregistre le
+# User (mot de passe changé, compte désactivé) vaut pour les autres. Fichiers
+# locaux par défaut (une seule machine, sous ETAT_REPERTOIRE) ; avec plusieurs machines,
+# CACHE_AUTHENTIFICATION_URL=redis://... (paquet redis requis).
+# Fenêtre restante : un changement qui ne passe pas par User.save() (update(),
+# SQL direct) n'est vu qu'à l'expiration de l'entrée, JWT_CACHE_UTILISATEUR_TTL
+# secondes au plus ; de même entre machines si le cache reste en fichiers.
+CACHE_AUTHENTIFICATION_URL = config('CACHE_AUTHENTIFICATION_URL', default='')
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'authentification': {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': CACHE_AUTHENTIFICATION_URL,
+    } if CACHE_AUTHENTIFICATION_URL else {
+        # manage.py test : cache propre au processus, jamais celui des workers en service
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'tests-authentification',
+    } if sys.argv[1:2] == ['test'] else {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': config('CACHE_AUTHENTIFICATION_REPERTOIRE', default=os.path.join(ETAT_REPERTOIRE, 'authentification')),
+        'OPTIONS': {'MAX_ENTRIES': 20000},
+    },
+}
+
+# Nombre maximal de rendez-vous actifs par créneau de 2h
+CAPACITE_CRENEAU = 10
+# Plafond par opération en plus du plafond global, ex. {'export': 6} (vide : aucun)
+CAPACITE_CRENEAU_PAR_OPERATION = {}
+# Recherche des prochains créneaux libres : jours parcourus, nombre maximal demandé
+PROCHAINS_CRENEAUX_JOURS = 60
+PROCHAINS_CRENEAUX_MAX = 50
+
+# Portail interne : réception des QR codes (vide pour désactiver l'envoi)
+PORTAIL_INTERNE_URL = config('PORTAIL_INTERNE_URL', default='http://localhost:8001/api/qr-codes/receive/')
+PORTAIL_INTERNE_TIMEOUT = config('PORTAIL_INTERNE_TIMEOUT', default=10, cast=float)
+# Journal des changements lu par le portail interne (/api/sync/changes/, jeton
+# Bearer ; vide : endpoint fermé). Taille des lots et conservation en jours
+# (manage.py prune_sync_events). Une séquence manquante suivie d'un événement de
+# moins de SYNCHRO_DELAI_TROU secondes est attendue (transaction en cours) ;
+# au-delà elle est tenue pour annulée.
+SYNCHRO_JETON = config('SYNCHRO_JETON', default='')
+SYNCHRO_TAILLE_LOT = 500
+SYNCHRO_TAILLE_LOT_MAX = 5000
+SYNCHRO_DELAI_TROU = config('SYNCHRO_DELAI_TROU', default=60, cast=int)
+SYNCHRO_RETENTION_JOURS = config('SYNCHRO_RETENTION_JOURS', default=30, cast=int)
+# Réconciliation par empreintes (/api/reconciliation/, même jeton) : période
+# maximale d'une requête, en jours
+RECONCILIATION_JOURS_MAX = 366
+
+# Instrumentation (rendez_vous.middleware) : en-tête Server-Timing et alertes
+# « Requête lente » / « N+1 probable » dans le logger rendez_vous.performance.
+# Server-Timing expose durées et nombre de requêtes SQL : en développement seulement
+# par défaut
+SERVER_TIMING = config('SERVER_TIMING', default=DEBUG, cast=bool)
+SEUIL_REQUETE_LENTE_MS = config('SEUIL_REQUETE_LENTE_MS', default=500, cast=int)
+SEUIL_N_PLUS_UN = config('SEUIL_N_PLUS_UN', default=10, cast=int)
+
+# Métriques Prometheus (/metrics). Avec plusieurs workers, définir la variable
+# d'environnement PROMETHEUS_MULTIPROC_DIR (répertoire vidé au démarrage).
+# Jeton Bearer obligatoire hors DEBUG : les métriques exposent l'occupation des
+# créneaux.
+METRIQUES_JETON = config('METRIQUES_JETON', default='')
+if not DEBUG and not METRIQUES_JETON:
+    raise ImproperlyConfigured("METRIQUES_JETON doit être défini quand DEBUG est faux (accès à /metrics).")
+METRIQUES_JOURS_REMPLISSAGE = 2
+
+# Profilage à la demande (rendez_vous.middleware.ProfilageMiddleware) : sans
+# PROFILAGE_ACTIF le middleware est retiré au démarrage. Déclenchement par
+# l'en-tête X-Profilage (manage.py profiling_token) ou par tirage aléatoire.
+PROFILAGE_ACTIF = config('PROFILAGE_ACTIF', default=False, cast=bool)
+PROFILAGE_ECHANTILLONNAGE = config('PROFILAGE_ECHANTILLONNAGE', default=0.0, cast=float)
+PROFILAGE_JETON_DUREE = config('PROFILAGE_JETON_DUREE', default=3600, cast=int)
+PROFILAGE_REPERTOIRE = config('PROFILAGE_REPERTOIRE', default=str(BASE_DIR / 'profils'))
+PROFILAGE_MAX_CAPTURES = config('PROFILAGE_MAX_CAPTURES', default=50, cast=int)
+
+# Analyse de charge et prévisions (rendez_vous.prevision) : artefacts .npz
+# réutilisés pendant ANALYSE_DUREE_CACHE secondes ; historique maximal en jours
+ANALYSE_REPERTOIRE = config('ANALYSE_REPERTOIRE', default=str(BASE_DIR / 'analyses'))
+ANALYSE_DUREE_CACHE = config('ANALYSE_DUREE_CACHE', default=3600, cast=int)
+ANALYSE_JOURS_MAX = 3 * 366
+ANALYSE_SEMAINES_MAX = 12
+
+# Limitation de débit (rendez_vous.limitation) : seaux à jetons par IP pour les
+# anonymes, par compte pour les utilisateurs connectés, partagés entre workers
+# dans LIMITATION_FICHIER (vide : ETAT_REPERTOIRE/limitation.bin).
+# Budgets : (capacité en rafale, jetons rechargés par seconde)
+LIMITATION_ACTIVE = config('LIMITATION_ACTIVE', default=True, cast=bool)
+LIMITATION_FICHIER = config('LIMITATION_FICHIER', default='')
+LIMITATION_ENSEMBLES = 16384
+LIMITATION_BUDGETS = {
+    'recherche': {'anonyme': (10, 0.2), 'utilisateur': (30, 1)},
+    'liste': {'anonyme': (60, 2), 'utilisateur': (120, 5)},
+    'ecriture': {'anonyme': (5, 0.05), 'utilisateur': (20, 0.5)},
+    # valider/annuler/terminer, anonymes : plusieurs terminaux de portique derrière
+    # une même IP, un camion toutes les quelques secondes chacun
+    'portique': {'anonyme': (120, 4), 'utilisateur': (120, 4)},
+    # Inscription : plusieurs transporteurs peuvent partager une IP (NAT)
+    'inscription': {'anonyme': (20, 0.2), 'utilisateur': (20, 0.2)},
+}
+
+# En-tête Idempotency-Key (rendez_vous.idempotence) : durée de conservation
+# des réponses, en secondes, et part des créations qui purgent les clés expirées
+IDEMPOTENCE_DUREE = config('IDEMPOTENCE_DUREE', default=24 * 3600, cast=int)
+IDEMPOTENCE_PURGE_PROBABILITE = 0.01
+
+# Flux d'occupation des créneaux (rendez_vous.diffusion, servi sous ASGI) :
+# battement et durée maximale d'une connexion SSE, en secondes. Avec plusieurs
+# workers, DIFFUSION_REPERTOIRE (répertoire local partagé) relaie les changements.
+DIFFUSION_BATTEMENT = config('DIFFUSION_BATTEMENT', default=15, cast=int)
+DIFFUSION_DUREE_MAX = config('DIFFUSION_DUREE_MAX', default=300, cast=int)
+DIFFUSION_REPERTOIRE = config('DIFFUSION_REPERTOIRE', default='')
+
+# Salle d'attente (rendez_vous.salle_attente) devant la création de rendez-vous
+# et les disponibilités : requêtes simultanées admises sur la machine (à garder
+# sous le nombre total de threads des workers), tickets en file au-delà. Durées
+# en secondes : place réservée à un ticket appelé, ticket non consulté
+# considéré parti, bail maximal d'une requête, validité d'un ticket, intervalle
+# de consultation conseillé. État partagé dans SALLE_ATTENTE_FICHIER (vide :
+# ETAT_REPERTOIRE/salle-attente.bin).
+SALLE_ATTENTE_ACTIVE = config('SALLE_ATTENTE_ACTIVE', default=True, cast=bool)
+SALLE_ATTENTE_FICHIER = config('SALLE_ATTENTE_FICHIER', default='')
+SALLE_ATTENTE_CAPACITE = config('SALLE_ATTENTE_CAPACITE', default=4, cast=int)
+SALLE_ATTENTE_TAILLE_FILE = config('SALLE_ATTENTE_TAILLE_FILE', default=2000, cast=int)
+SALLE_ATTENTE_DELAI_PASSAGE = 20
+SALLE_ATTENTE_ABANDON = 10
+SALLE_ATTENTE_DUREE_MAX = 30
+SALLE_ATTENTE_DUREE_TICKET = 3600
+SALLE_ATTENTE_INTERVALLE = 2
+
+# Journalisation en JSON, écrite par un thread dédié (rendez_vous.journalisation)
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'file_attente': {
+            'class': 'rendez_vous.journalisation.GestionnaireFileAttente',
+        },
+    },
+    'loggers': {
+        'rendez_vous': {
+            'handlers': ['file_attente'],
+            'level': config('LOG_LEVEL', default='INFO'),
+            'propagate': False,
+        },
+    },
 }
@@ -15,11 +15,11 @@ Including another URLconf
     2. Add a URL to urlpatterns:  path('blog/', include('blog.urls'))
 """
 from django.contrib import admin
-from django.urls import path, include
+from django.urls import path, re_path, include
 from django.conf import settings
 from django.conf.urls.static import static
 from django.shortcuts import redirect
-from rendez_vous.views import EmailTokenObtainPairView
+from rendez_vous.views import EmailTokenObtainPairView, metriques, servir_frontend, servir_qr_code
 from rest_framework_simplejwt.views import TokenRefreshView
 
 def redirect_voyages(request):
@@ -28,12 +28,17 @@ def redirect_voyages(request):
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('api/', include('rendez_vous.urls')),
+    path('metrics', metriques, name='metriques'),
+    # QR codes : servis aussi en production, avec cache immuable
+    re_path(r'^media/qr_codes/(?P<nom>qr_code_[\w-]+\.png)$', servir_qr_code, name='qr-code-fichier'),
     # Auth endpoints JWT
     path('api/auth/login/', EmailTokenObtainPairView.as_view(), name='token_obtain_pair'),
     path('api/auth/refresh/', TokenRefreshView.as_view(), name='token_refresh'),
     # Redirection pour l'ancienne URL voyages
     path('voyages/', redirect_voyages, name='redirect_voyages'),
     # L'inscription sera ajoutée via une vue personnalisée
+    # Frontend React construit, en dernier : tout le reste de l'arborescence
+    re_path(r'^(?!api/|admin/|media/|static/|metrics$)(?P<chemin>.*)$', servir_frontend, name='frontend'),
 ]
 
 # Servir les fichiers média en développement
@@ -1,25 +1,117 @@
+from datetime import timedelta
+from functools import reduce
+from operator import or_
+
 from django.contrib import admin
+from django.core.paginator import Paginator
+from django.db import connection, models
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.functional import cached_property
 from .models import RendezVous
 
+# Au-delà, le nombre de résultats est plafonné (pas de COUNT(*) sur toute la table)
+COMPTE_MAX = 10000
+# Fenêtre affichée par défaut : rendez-vous à partir de J-7
+JOURS_PAR_DEFAUT = 7
+BORNE_PREFIXE = '\U0010ffff'
+
+
+class PaginateurApproximatif(Paginator):
+    """
+    Compte plafonné à COMPTE_MAX (SELECT COUNT(*) sur une sous-requête LIMIT) ;
+    sous PostgreSQL, la table entière non filtrée est estimée via pg_class.
+    """
+
+    @cached_property
+    def count(self):
+        query = self.object_list.query
+        if connection.vendor == 'postgresql' and not query.where:
+            with connection.cursor() as cursor:
+                cursor.execute('SELECT reltuples::bigint FROM pg_class WHERE relname = %s',
+                               [self.object_list.model._meta.db_table])
+                estimation = cursor.fetchone()
+            if estimation and estimation[0] > 0:
+                return estimation[0]
+        return self.object_list.order_by()[:COMPTE_MAX].count()
+
+
+def filtre_prefixe(champ, valeur):
+    """
+    Préfixe exploitable par l'index : intervalle [valeur, valeur + U+10FFFF[ en
+    collation binaire ; sous PostgreSQL, LIKE 'valeur%' sert un index
+    varchar_pattern_ops : *_like que Django crée pour les CharField indexés,
+    rdv_plaque_prefixe_idx pour la plaque.
+    """
+    if connection.vendor == 'postgresql':
+        return Q(**{f'{champ}__startswith': valeur})
+    return Q(**{f'{champ}__gte': valeur, f'{champ}__lt': valeur + BORNE_PREFIXE})
+
+
+class PeriodeFilter(admin.SimpleListFilter):
+    """Filtre sur date_rdv, à partir de J-7 par défaut (toutes les dates lors d'une recherche)"""
+    title = 'période du rendez-vous'
+    parameter_name = 'periode'
+
+    def __init__(self, request, params, model, model_admin):
+        self.recherche = bool(request.GET.get('q'))
+        super().__init__(request, params, model, model_admin)
+
+    def lookups(self, request, model_admin):
+        return [
+            ('recent', f'À partir de J-{JOURS_PAR_DEFAUT}'),
+            ('aujourdhui', "Aujourd'hui"),
+            ('a_venir', 'À venir'),
+            ('tout', 'Toutes les dates'),
+        ]
+
+    def value(self):
+        return super().value() or ('tout' if self.recherche else 'recent')
+
+    def choices(self, changelist):
+        # Pas d'entrée « Tout » implicite : la valeur par défaut est 'recent'
+        for valeur, libelle in self.lookup_choices:
+            yield {
+                'selected': self.value() == valeur,
+                'query_string': changelist.get_query_string({self.parameter_name: valeur}),
+                'display': libelle,
+            }
+
+    def queryset(self, request, queryset):
+        aujourd_hui = timezone.now().date()
+        valeur = self.value()
+        if valeur == 'recent':
+            return queryset.filter(date_rdv__gte=aujourd_hui - timedelta(days=JOURS_PAR_DEFAUT))
+        if valeur == 'aujourdhui':
+            return queryset.filter(date_rdv=aujourd_hui)
+        if valeur == 'a_venir':
+            return queryset.filter(date_rdv__gte=aujourd_hui)
+        return queryset
+
+
 @admin.register(RendezVous)
 class RendezVousAdmin(admin.ModelAdmin):
     list_display = [
         'code_unique', 'cin', 'plaque_camion', 'numero_conteneur',
         'operation', 'sens_trafic', 'type_conteneur', 'date_rdv',
-        'heure_rdv', 'statut', 'date_creation'
+        'heure_rdv', 'statut', 'user', 'date_creation'
     ]
+    list_select_related = ['user']
+    ordering = ['-date_rdv', '-heure_rdv']
+    paginator = PaginateurApproximatif
+    show_full_result_count = False
     list_filter = [
-        'statut', 'operation', 'sens_trafic', 'type_conteneur',
-        'date_rdv', 'date_creation'
+        PeriodeFilter, 'statut', 'operation', 'sens_trafic', 'type_conteneur',
+        'date_creation'
     ]
+    # Recherche par préfixe (voir get_search_results) : « AB12 » trouve AB123456
     search_fields = [
         'code_unique', 'cin', 'plaque_camion', 'numero_conteneur'
     ]
+    search_help_text = "Début du CIN, de la plaque, du numéro de conteneur ou du code unique"
     readonly_fields = [
         'code_unique', 'qr_code', 'date_creation'
     ]
-    date_hierarchy = 'date_creation'
-    
     fieldsets = (
         ('Informations du chauffeur', {
             'fields': ('cin',)
@@ -38,24 +130,51 @@ class RendezVousAdmin(admin.ModelAdmin):
     
     actions = ['valider_rendez_vous', 'annuler_rendez_vous', 'terminer_rendez_vous']
     
+    def get_search_results(self, request, queryset, search_term):
+        """Recherche par préfixe sur des colonnes indexées, sans icontains"""
+        termes = search_term.split()
+        if not termes:
+            return queryset, False
+        condition = Q()
+        for terme in termes:
+            condition &= reduce(or_, [
+                filtre_prefixe(champ, terme.lower() if champ == 'code_unique' else terme.upper())
+                for champ in self.search_fields
+            ])
+        # Sous-requête sur les seuls index de recherche : sinon, avec la jointure
+        # sur user et le tri, SQLite peut préférer parcourir tout l'index de date
+        return queryset.filter(pk__in=self.model.objects.filter(condition).values('pk')), False
+
+    def get_deleted_objects(self, objs, request):
+        """
+        Page de confirmation de delete_selected : un résumé plutôt que la liste
+        de chaque objet (parcours du Collector sur toute la sélection).
+        """
+        if not isinstance(objs, models.QuerySet):
+            return super().get_deleted_objects(objs, request)
+        nombre = objs.count()
+        refuse = set() if self.has_delete_permission(request) else {self.opts.verbose_name}
+        return [f'{nombre} rendez-vous'], {self.opts.verbose_name_plural: nombre}, refuse, []
+
+    def delete_queryset(self, request, queryset):
+        """delete_selected : suppression par lots (RendezVousQuerySet.supprimer)"""
+        queryset.supprimer()
+
+    def changer_statut(self, request, queryset, nouveau_statut, depuis, message):
+        updated = queryset.changer_statut(nouveau_statut, depuis)
+        self.message_user(request, f'{updated} rendez-vous ont été {message}.')
+
     def valider_rendez_vous(self, request, queryset):
         """Action pour valider les rendez-vous sélectionnés"""
-        updated = queryset.filter(statut='en_attente').update(statut='valide')
-        self.message_user(request, f'{updated} rendez-vous ont été validés.')
+        self.changer_statut(request, queryset, 'valide', ['en_attente'], 'validés')
     valider_rendez_vous.short_description = "Valider les rendez-vous sélectionnés"
     
     def annuler_rendez_vous(self, request, queryset):
         """Action pour annuler les rendez-vous sélectionnés"""
-        updated = queryset.filter(statut__in=['en_attente', 'valide']).update(statut='annule')
-        self.message_user(request, f'{updated} rendez-vous ont été annulés.')
+        self.changer_statut(request, queryset, 'annule', ['en_attente', 'valide'], 'annulés')
     annuler_rendez_vous.short_description = "Annuler les rendez-vous sélectionnés"
     
     def terminer_rendez_vous(self, request, queryset):
         """Action pour terminer les rendez-vous sélectionnés"""
-        updated = queryset.filter(statut='valide').update(statut='termine')
-        self.message_user(request, f'{updated} rendez-vous ont été terminés.')
+        self.changer_statut(request, queryset, 'termine', ['valide'], 'terminés')
     terminer_rendez_vous.short_description = "Terminer les rendez-vous sélectionnés"
-    
-    def get_queryset(self, request):
-        """Optimiser les requêtes"""
-        return super().get_queryset(request).select_related()
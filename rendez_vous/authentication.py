@@ -0,0 +1,123 @@
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth.hashers import check_password, make_password
+from django.contrib.auth.models import User
+from django.core.cache import caches
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.tokens import RefreshToken
+from rest_framework_simplejwt.utils import get_md5_hash_password
+import uuid
+
+# Champs de auth_user conservés en cache pour reconstruire request.user
+CHAMPS_UTILISATEUR = ('id', 'username', 'email', 'first_name', 'last_name', 'is_active', 'is_staff', 'is_superuser')
+
+
+def normaliser_email(email):
+    """Forme canonique d'un email : c'est elle qui est stockée et indexée"""
+    return (email or '').strip().lower()
+
+
+def username_depuis_email(email):
+    """Username unique dérivé de l'email, sans requête de vérification"""
+    if len(email) <= 150:
+        return email
+    return f"{email.split('@')[0][:140]}{uuid.uuid4().hex[:8]}"
+
+
+def _verifier_hash(password, encoded):
+    """Vérifie le mot de passe et retourne (valide, nouveau_hash_ou_None)"""
+    nouveau = []
+    valide = check_password(password, encoded, setter=lambda raw: nouveau.append(make_password(raw)))
+    return valide, (nouveau[0] if nouveau else None)
+
+
+# Le hachage PBKDF2 tourne dans le pool de threads de la boucle : sous ASGI il
+# ne bloque ni la boucle d'événements ni le thread partagé des vues synchrones.
+_verifier_hash_async = sync_to_async(_verifier_hash, thread_sensitive=False)
+_make_password_async = sync_to_async(make_password, thread_sensitive=False)
+
+
+async def averifier_identifiants(email, password):
+    """Retourne l'utilisateur si les identifiants sont valides, sinon None"""
+    user = await User.objects.filter(email=normaliser_email(email)).afirst()
+    if user is None:
+        # Hacher quand même pour ne pas révéler l'existence du compte
+        await _make_password_async(password)
+        return None
+    valide, nouveau_hash = await _verifier_hash_async(password, user.password)
+    if not valide:
+        return None
+    if nouveau_hash:
+        user.password = nouveau_hash
+        await User.objects.filter(pk=user.pk).aupdate(password=nouveau_hash)
+    return user
+
+
+def generer_tokens(user):
+    """Génère la paire de tokens JWT et les informations renvoyées à la connexion"""
+    refresh = RefreshToken.for_user(user)
+    return {
+        'refresh': str(refresh),
+        'access': str(refresh.access_token),
+        'email': user.email,
+        'first_name': user.first_name,
+        'last_name': user.last_name,
+    }
+
+
+def _cle_cache(user_id):
+    return f'jwt_utilisateur:{user_id}'
+
+
+def _cache():
+    # Partagé par les workers (settings.CACHES) : une invalidation vaut pour tous
+    return caches['authentification']
+
+
+def invalider_utilisateur(user_id):
+    """Retire un utilisateur du cache d'authentification (mot de passe, désactivation...)"""
+    _cache().delete(_cle_cache(user_id))
+
+
+class JWTAuthenticationCache(JWTAuthentication):
+    """
+    Authentification JWT sans lecture de auth_user à chaque requête.
+
+    L'utilisateur est reconstruit en mémoire depuis le cache 'authentification',
+    partagé par les workers, à durée de vie courte (JWT_CACHE_UTILISATEUR_TTL).
+    L'entrée est invalidée à chaque sauvegarde du User ; le claim de révocation de SimpleJWT rejette les
+    tokens émis avant un changement de mot de passe.
+    L'objet obtenu ne contient pas le mot de passe : recharger l'utilisateur
+    depuis la base avant de le modifier.
+    """
+
+    def get_user(self, validated_token):
+        try:
+            user_id = validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError:
+            raise InvalidToken('Le token ne contient pas d\'identifiant utilisateur.')
+
+        donnees = _cache().get(_cle_cache(user_id))
+        if donnees is None:
+            user = User.objects.filter(**{api_settings.USER_ID_FIELD: user_id}).first()
+            if user is None:
+                raise AuthenticationFailed('Utilisateur introuvable.', code='user_not_found')
+            donnees = {champ: getattr(user, champ) for champ in CHAMPS_UTILISATEUR}
+            donnees['hash_password'] = get_md5_hash_password(user.password)
+            _cache().set(_cle_cache(user_id), donnees, settings.JWT_CACHE_UTILISATEUR_TTL)
+
+        if api_settings.CHECK_USER_IS_ACTIVE and not donnees['is_active']:
+            raise AuthenticationFailed('Ce compte est inactif.', code='user_inactive')
+        if api_settings.CHECK_REVOKE_TOKEN and (
+            validated_token.get(api_settings.REVOKE_TOKEN_CLAIM) != donnees['hash_password']
+        ):
+            raise AuthenticationFailed(
+                'Le mot de passe a été modifié, veuillez vous reconnecter.', code='password_changed'
+            )
+
+        user = User(**{champ: donnees[champ] for champ in CHAMPS_UTILISATEUR})
+        user._state.adding = False
+        user._state.db = 'default'
+        return user
@@ -0,0 +1,105 @@
+"""
+Recherche des prochains créneaux libres (GET /api/rdv/prochains-creneaux/).
+
+L'occupation de tout l'horizon vient d'une seule requête sur les compteurs
+(StatistiqueRendezVous), les rendez-vous du camion d'une seconde. Chaque jour
+devient un masque d'un bit par créneau (complet, en conflit avec le camion ou
+déjà commencé) ; la recherche prend les bits à zéro jour après jour.
+"""
+from collections import defaultdict
+from datetime import datetime, time, timedelta
+
+from django.conf import settings
+from django.db.models import Sum
+from django.utils import timezone
+
+from .models import STATUTS_ACTIFS, RendezVous, StatistiqueRendezVous
+
+# Créneaux de 2h proposés par le formulaire de réservation
+CRENEAUX = tuple(time(heure) for heure in range(6, 22, 2))
+DUREE_CRENEAU = timedelta(hours=2)
+INDICES = {heure: i for i, heure in enumerate(CRENEAUX)}
+TOUS = (1 << len(CRENEAUX)) - 1
+
+
+def _minutes(heure):
+    return heure.hour * 60 + heure.minute
+
+
+def masque_chevauchements(heure_rdv):
+    """Créneaux qui chevauchent un rendez-vous de 2h commençant à heure_rdv"""
+    duree = DUREE_CRENEAU.total_seconds() // 60
+    return sum(1 << i for i, debut in enumerate(CRENEAUX) if abs(_minutes(debut) - _minutes(heure_rdv)) < duree)
+
+
+def masque_commences(heure):
+    """Créneaux dont le début est passé à cette heure"""
+    return sum(1 << i for i, debut in enumerate(CRENEAUX) if debut <= heure)
+
+
+async def occupation(du, au, operation=None):
+    """
+    Rendez-vous actifs par jour et créneau ({date: [nombre, ...]}), en tout et
+    pour `operation`, d'après les compteurs.
+    """
+    total = defaultdict(lambda: [0] * len(CRENEAUX))
+    pour_operation = defaultdict(lambda: [0] * len(CRENEAUX))
+    lignes = StatistiqueRendezVous.objects.filter(
+        date_rdv__range=(du, au), statut__in=STATUTS_ACTIFS, heure_rdv__in=CRENEAUX,
+    ).values('date_rdv', 'heure_rdv', 'operation').annotate(nombre=Sum('nombre')).order_by()
+    async for ligne in lignes:
+        i = INDICES[ligne['heure_rdv']]
+        total[ligne['date_rdv']][i] += ligne['nombre']
+        if ligne['operation'] == operation:
+            pour_operation[ligne['date_rdv']][i] += ligne['nombre']
+    return total, pour_operation
+
+
+async def prochains_creneaux(nombre, du, operation=None, plaque=None):
+    """
+    Les `nombre` premiers créneaux réservables à partir du jour `du`, sur
+    PROCHAINS_CRENEAUX_JOURS jours : [{'date', 'heure', 'fin', 'places'}].
+    """
+    au = du + timedelta(days=settings.PROCHAINS_CRENEAUX_JOURS - 1)
+    capacite = settings.CAPACITE_CRENEAU
+    capacite_operation = settings.CAPACITE_CRENEAU_PAR_OPERATION.get(operation)
+    total, pour_operation = await occupation(du, au, operation)
+
+    indisponibles = defaultdict(int)
+    for jour, nombres in total.items():
+        for i, n in enumerate(nombres):
+            if n >= capacite:
+                indisponibles[jour] |= 1 << i
+    if capacite_operation is not None:
+        for jour, nombres in pour_operation.items():
+            for i, n in enumerate(nombres):
+                if n >= capacite_operation:
+                    indisponibles[jour] |= 1 << i
+    if plaque:
+        async for jour, heure_rdv in RendezVous.objects.filter(
+            plaque_camion=plaque, date_rdv__range=(du, au), statut__in=STATUTS_ACTIFS,
+        ).values_list('date_rdv', 'heure_rdv'):
+            indisponibles[jour] |= masque_chevauchements(heure_rdv)
+    maintenant = timezone.localtime()
+    if du == maintenant.date():
+        indisponibles[du] |= masque_commences(maintenant.time())
+
+    resultats = []
+    jour = du
+    while jour <= au and len(resultats) < nombre:
+        libres = TOUS & ~indisponibles.get(jour, 0)
+        while libres and len(resultats) < nombre:
+            i = (libres & -libres).bit_length() - 1
+            libres &= libres - 1
+            places = capacite - total[jour][i] if jour in total else capacite
+            if capacite_operation is not None:
+                places = min(places, capacite_operation - (pour_operation[jour][i] if jour in pour_operation else 0))
+            debut = CRENEAUX[i]
+            resultats.append({
+                'date': jour.isoformat(),
+                'heure': debut.strftime('%H:%M'),
+                'fin': (datetime.combine(jour, debut) + DUREE_CRENEAU).strftime('%H:%M'),
+                'places': places,
+            })
+        jour += timedelta(days=1)
+    return resultats
@@ -0,0 +1,203 @@
+"""
+Diffusion en direct de l'occupation des créneaux (flux SSE /api/rdv/creneaux/flux/).
+
+Après chaque commit qui change le nombre de rendez-vous actifs d'un créneau
+(statistiques.ajuster), ce nombre est relu dans StatistiqueRendezVous et poussé
+aux abonnés de la date. Les valeurs sont absolues : un abonnement ne garde que
+la dernière valeur non envoyée de chaque créneau, sa mémoire reste bornée quel
+que soit le retard du client, et chaque reconnexion repart d'un instantané.
+
+Avec plusieurs workers, DIFFUSION_REPERTOIRE active un relais local : chaque
+worker ayant des abonnés écoute une socket Unix datagramme `<pid>.sock` dans ce
+répertoire, et chaque publication est envoyée à toutes les sockets présentes.
+"""
+import asyncio
+import json
+import logging
+import os
+import socket
+import threading
+from collections import defaultdict
+from datetime import date
+
+from django.conf import settings
+from django.db.models import Sum
+
+from .models import STATUTS_ACTIFS, StatistiqueRendezVous
+
+logger = logging.getLogger(__name__)
+
+
+def requete_occupation(dates, heures=None):
+    """Rendez-vous actifs par (date_rdv, heure_rdv) d'après les compteurs"""
+    compteurs = StatistiqueRendezVous.objects.filter(date_rdv__in=dates, statut__in=STATUTS_ACTIFS)
+    if heures is not None:
+        compteurs = compteurs.filter(heure_rdv__in=heures)
+    return compteurs.values('date_rdv', 'heure_rdv').annotate(nombre=Sum('nombre')).order_by()
+
+
+class Abonnement:
+    """Un client du flux, servi par la boucle asyncio qui l'a créé"""
+
+    def __init__(self, date_rdv, boucle):
+        self.date = date_rdv
+        self.boucle = boucle
+        self.en_attente = {}
+        self.signal = asyncio.Event()
+
+    def pousser(self, creneaux):
+        self.en_attente.update(creneaux)
+        self.signal.set()
+
+    async def attendre(self, delai):
+        """Créneaux modifiés depuis l'appel précédent ; {} si rien pendant `delai` secondes"""
+        try:
+            await asyncio.wait_for(self.signal.wait(), delai)
+        except asyncio.TimeoutError:
+            return {}
+        self.signal.clear()
+        creneaux, self.en_attente = self.en_attente, {}
+        return creneaux
+
+
+def _pousser_tous(abonnements, creneaux):
+    for abonnement in abonnements:
+        abonnement.pousser(creneaux)
+
+
+class Diffuseur:
+    """Abonnés du processus, par date ; publication possible depuis n'importe quel thread"""
+
+    def __init__(self):
+        self._abonnes = defaultdict(set)
+        self._verrou = threading.Lock()
+        self._publication = threading.Lock()
+        self._socket_envoi = None
+        self.socket_ecoute = None
+
+    def abonner(self, date_rdv):
+        boucle = asyncio.get_running_loop()
+        abonnement = Abonnement(date_rdv, boucle)
+        with self._verrou:
+            self._abonnes[date_rdv].add(abonnement)
+        if settings.DIFFUSION_REPERTOIRE and self.socket_ecoute is None:
+            self._ecouter(boucle)
+        return abonnement
+
+    def desabonner(self, abonnement):
+        with self._verrou:
+            abonnes = self._abonnes.get(abonnement.date)
+            if abonnes is not None:
+                abonnes.discard(abonnement)
+                if not abonnes:
+                    del self._abonnes[abonnement.date]
+
+    def nombre_abonnes(self):
+        with self._verrou:
+            return sum(len(abonnes) for abonnes in self._abonnes.values())
+
+    def distribuer(self, date_rdv, creneaux):
+        """Pousse {'HH:MM': nombre} aux abonnés locaux de la date (ISO)"""
+        with self._verrou:
+            abonnes = list(self._abonnes.get(date_rdv, ()))
+        par_boucle = defaultdict(list)
+        for abonnement in abonnes:
+            par_boucle[abonnement.boucle].append(abonnement)
+        for boucle, abonnements in par_boucle.items():
+            try:
+                # Un seul réveil par boucle, quel que soit le nombre d'abonnés
+                boucle.call_soon_threadsafe(_pousser_tous, abonnements, creneaux)
+            except RuntimeError:
+                # Boucle fermée : ses abonnés ne liront plus rien
+                for abonnement in abonnements:
+                    self.desabonner(abonnement)
+
+    def publier(self, creneaux):
+        """
+        on_commit : relit l'occupation des créneaux {(date_rdv, heure_rdv)} modifiés
+        et la diffuse. Sérialisé dans le processus pour que la dernière valeur lue
+        soit la dernière poussée.
+        """
+        if not settings.DIFFUSION_REPERTOIRE and not self.nombre_abonnes():
+            return
+        with self._publication:
+            par_date = defaultdict(dict)
+            for date_rdv, heure_rdv in creneaux:
+                par_date[date_rdv][heure_rdv.strftime('%H:%M')] = 0
+            for ligne in requete_occupation(list(par_date), {heure for _, heure in creneaux}):
+                heure = ligne['heure_rdv'].strftime('%H:%M')
+                if heure in par_date[ligne['date_rdv']]:
+                    par_date[ligne['date_rdv']][heure] = ligne['nombre']
+            for date_rdv, occupation in par_date.items():
+                self.distribuer(date_rdv.isoformat(), occupation)
+                if settings.DIFFUSION_REPERTOIRE:
+                    self._relayer({'date': date_rdv.isoformat(), 'creneaux': occupation})
+
+    def _ecouter(self, boucle):
+        with self._verrou:
+            if self.socket_ecoute is not None:
+                return
+            repertoire = settings.DIFFUSION_REPERTOIRE
+            os.makedirs(repertoire, exist_ok=True)
+            chemin = os.path.join(repertoire, f'{os.getpid()}.sock')
+            try:
+                os.unlink(chemin)
+            except FileNotFoundError:
+                pass
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+            sock.bind(chemin)
+            sock.setblocking(False)
+            boucle.add_reader(sock.fileno(), self._recevoir, sock)
+            self.socket_ecoute = chemin
+
+    def _recevoir(self, sock):
+        while True:
+            try:
+                message = json.loads(sock.recv(65536))
+            except BlockingIOError:
+                return
+            except ValueError:
+                continue
+            self.distribuer(message['date'], message['creneaux'])
+
+    def _relayer(self, message):
+        """Envoie la publication aux autres workers (les abonnés locaux sont déjà servis)"""
+        if self._socket_envoi is None:
+            self._socket_envoi = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+            self._socket_envoi.setblocking(False)
+        donnees = json.dumps(message).encode()
+        repertoire = settings.DIFFUSION_REPERTOIRE
+        try:
+            noms = os.listdir(repertoire)
+        except FileNotFoundError:
+            return
+        for nom in noms:
+            chemin = os.path.join(repertoire, nom)
+            if not nom.endswith('.sock') or chemin == self.socket_ecoute:
+                continue
+            try:
+                self._socket_envoi.sendto(donnees, chemin)
+            except (ConnectionRefusedError, FileNotFoundError):
+                # Worker arrêté : sa socket ne sera plus lue
+                try:
+                    os.unlink(chemin)
+                except FileNotFoundError:
+                    pass
+            except BlockingIOError:
+                # Tampon du destinataire plein : il se resynchronise à la reconnexion
+                logger.warning("Relais de diffusion saturé", extra={'donnees': {'socket': nom}})
+
+
+diffuseur = Diffuseur()
+
+
+async def instantane(date_rdv: date):
+    """Occupation de tous les créneaux de la date : {'HH:MM': nombre}"""
+    return {
+        ligne['heure_rdv'].strftime('%H:%M'): ligne['nombre']
+        async for ligne in requete_occupation([date_rdv]).order_by('heure_rdv')
+    }
+
+
+def evenement(nom, donnees):
+    return f'event: {nom}\ndata: {json.dumps(donnees)}\n\n'.encode()
@@ -0,0 +1,84 @@
+"""
+Fichiers QR code : suppression en arrière-plan et inventaire du répertoire.
+
+Un rendez-vous supprimé, ou dont le QR code est remplacé, laisse son PNG dans
+MEDIA_ROOT/qr_codes. Le fichier est retiré après le commit par un thread
+dédié : la requête n'attend pas l'unlink, et rien n'est supprimé si la
+transaction est annulée. Ce qui échappe (processus arrêté avant, écritures
+hors ORM) est ramassé par `manage.py gc_qrcodes`.
+"""
+import logging
+import os
+import queue
+import threading
+
+from django.conf import settings
+from django.db import transaction
+
+from .models import RendezVous
+
+logger = logging.getLogger(__name__)
+
+REPERTOIRE_QR = 'qr_codes'
+
+_file = queue.Queue()
+_thread = None
+_verrou = threading.Lock()
+
+
+def _supprimer_en_continu():
+    while True:
+        storage, noms = _file.get()
+        for nom in noms:
+            try:
+                storage.delete(nom)
+            except OSError as e:
+                logger.warning("Suppression du fichier impossible", extra={'donnees': {'nom': nom, 'erreur': repr(e)}})
+        _file.task_done()
+
+
+def _enfiler(storage, noms):
+    global _thread
+    with _verrou:
+        # Aussi après un fork : le thread du parent n'existe pas dans l'enfant
+        if _thread is None or not _thread.is_alive():
+            _thread = threading.Thread(target=_supprimer_en_continu, name='suppression-fichiers', daemon=True)
+            _thread.start()
+    _file.put((storage, noms))
+
+
+def supprimer_apres_commit(storage, noms):
+    """Programme la suppression des fichiers `noms` une fois la transaction validée"""
+    noms = [nom for nom in noms if nom]
+    if noms:
+        transaction.on_commit(lambda: _enfiler(storage, noms))
+
+
+def attendre_suppressions():
+    """Attend que les suppressions programmées soient faites (commandes, tests)"""
+    _file.join()
+
+
+def fichiers_qr():
+    """Fichiers sous MEDIA_ROOT/qr_codes, parcourus avec os.scandir : (nom relatif à MEDIA_ROOT, DirEntry)"""
+    a_parcourir = [os.path.join(settings.MEDIA_ROOT, REPERTOIRE_QR)]
+    while a_parcourir:
+        try:
+            entrees = os.scandir(a_parcourir.pop())
+        except FileNotFoundError:
+            continue
+        with entrees:
+            for entree in entrees:
+                if entree.is_dir(follow_symlinks=False):
+                    a_parcourir.append(entree.path)
+                elif entree.is_file(follow_symlinks=False):
+                    nom = os.path.relpath(entree.path, settings.MEDIA_ROOT).replace(os.sep, '/')
+                    yield nom, entree
+
+
+def noms_references(taille_lot=10000):
+    """Noms de fichier QR référencés par un rendez-vous, lus par lots"""
+    return set(
+        RendezVous.objects.exclude(qr_code='').exclude(qr_code__isnull=True).order_by()
+        .values_list('qr_code', flat=True).iterator(chunk_size=taille_lot)
+    )
@@ -0,0 +1,110 @@
+"""
+En-tête Idempotency-Key sur les écritures rejouées par les clients mobiles.
+
+La première requête portant une clé est exécutée dans une transaction qui
+verrouille la ligne CleIdempotence ; sa réponse (hors 5xx) y est enregistrée
+au commit. Une requête concurrente avec la même clé attend ce verrou, puis
+reçoit la réponse enregistrée sans repasser par la validation ni par les
+effets de bord (QR code, portail interne). Si l'attente échoue (SQLite :
+« database is locked » après busy_timeout), elle reçoit 409 et Retry-After.
+Une même clé sur un autre corps ou une autre URL est refusée (422). Les clés
+expirent après IDEMPOTENCE_DUREE.
+"""
+import hashlib
+import random
+from datetime import timedelta
+from functools import wraps
+
+from django.conf import settings
+from django.db import IntegrityError, OperationalError, transaction
+from django.db.models import F
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.response import Response
+
+from .models import CleIdempotence
+
+EN_TETE = 'Idempotency-Key'
+LONGUEUR_MAX = 255
+
+
+def empreinte(request):
+    contenu = hashlib.sha256()
+    for partie in (request.method.encode(), request.get_full_path().encode(), request.body):
+        contenu.update(partie)
+        contenu.update(b'\0')
+    return contenu.hexdigest()
+
+
+def purger_cles_expirees():
+    return CleIdempotence.objects.filter(expiration__lt=timezone.now()).delete()[0]
+
+
+def _reserver(user, cle):
+    """Ligne de la clé, créée si besoin (hors de la transaction de la requête)"""
+    expiration = timezone.now() + timedelta(seconds=settings.IDEMPOTENCE_DUREE)
+    try:
+        ligne, creee = CleIdempotence.objects.get_or_create(
+            user=user, cle=cle, defaults={'empreinte': '', 'expiration': expiration}
+        )
+    except IntegrityError:
+        # Créée au même instant par la requête concurrente
+        return
+    if creee and random.random() < settings.IDEMPOTENCE_PURGE_PROBABILITE:
+        # Éviction au fil de l'eau, comme le « cull » du cache en base de Django
+        purger_cles_expirees()
+
+
+def idempotent(methode):
+    """Décorateur de méthode de vue DRF (après authentification) ; sans en-tête, ne change rien"""
+
+    @wraps(methode)
+    def enveloppe(self, request, *args, **kwargs):
+        cle = request.headers.get(EN_TETE)
+        if not cle:
+            return methode(self, request, *args, **kwargs)
+        if len(cle) > LONGUEUR_MAX:
+            return Response({
+                'error': f'{EN_TETE} trop long ({LONGUEUR_MAX} caractères au plus)'
+            }, status=status.HTTP_400_BAD_REQUEST)
+        signature = empreinte(request)
+
+        verrouillee = False
+        try:
+            _reserver(request.user, cle)
+            with transaction.atomic():
+                lignes = CleIdempotence.objects.filter(user=request.user, cle=cle)
+                # UPDATE d'abord : verrou de ligne (PostgreSQL) ou d'écriture (SQLite)
+                # gardé jusqu'au commit ; la requête concurrente attend ici
+                lignes.update(expiration=F('expiration'))
+                verrouillee = True
+                ligne = lignes.get()
+                if ligne.statut is not None and ligne.expiration > timezone.now():
+                    if ligne.empreinte != signature:
+                        return Response({
+                            'error': f'{EN_TETE} déjà utilisé pour une autre requête'
+                        }, status=status.HTTP_422_UNPROCESSABLE_ENTITY)
+                    response = Response(ligne.corps, status=ligne.statut)
+                    response['Idempotent-Replayed'] = 'true'
+                    return response
+
+                response = methode(self, request, *args, **kwargs)
+                if response.status_code < 500:
+                    # Une erreur serveur n'est pas mémorisée : le client pourra réessayer
+                    ligne.empreinte = signature
+                    ligne.statut = response.status_code
+                    ligne.corps = response.data
+                    ligne.expiration = timezone.now() + timedelta(seconds=settings.IDEMPOTENCE_DUREE)
+                    ligne.save(update_fields=['empreinte', 'statut', 'corps', 'expiration'])
+                return response
+        except OperationalError:
+            if verrouillee:
+                raise
+            # La requête qui porte la même clé est toujours en cours
+            response = Response({
+                'error': f'Requête avec ce {EN_TETE} en cours de traitement, réessayez'
+            }, status=status.HTTP_409_CONFLICT)
+            response['Retry-After'] = '1'
+            return response
+
+    return enveloppe
@@ -0,0 +1,193 @@
+"""Import en masse de comptes transporteurs (commande import_accounts et API admin)"""
+import csv
+import io
+import json
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.exceptions import ValidationError
+from django.core.validators import validate_email
+from django.db import IntegrityError, transaction
+
+from .authentication import normaliser_email, username_depuis_email
+from .models import Profil
+
+TAILLE_LOT = 500
+# Champs facultatifs copiés dans User et Profil (texte, tronqués)
+CHAMPS_TEXTE = ('first_name', 'last_name', 'telephone')
+
+
+def lire_roster(contenu, format=None):
+    """Lit un roster CSV (séparateur , ou ;) ou JSON et retourne une liste de dicts"""
+    if isinstance(contenu, bytes):
+        contenu = contenu.decode('utf-8-sig')
+    if format is None:
+        format = 'json' if contenu.lstrip().startswith(('[', '{')) else 'csv'
+    if format == 'json':
+        donnees = json.loads(contenu)
+        if isinstance(donnees, dict):
+            donnees = donnees.get('comptes', [])
+        return list(donnees)
+    entete = contenu.split('\n', 1)[0]
+    separateur = ';' if entete.count(';') > entete.count(',') else ','
+    return list(csv.DictReader(io.StringIO(contenu), delimiter=separateur))
+
+
+def _valider(ligne, email):
+    if not isinstance(ligne, dict):
+        return 'Ligne invalide.'
+    try:
+        validate_email(email)
+    except ValidationError:
+        return 'Email invalide.'
+    if not ligne.get('password'):
+        return 'Mot de passe manquant.'
+    if not isinstance(ligne['password'], str):
+        # Un nombre ou une liste JSON ferait échouer make_password dans le pool
+        return 'Mot de passe invalide (texte attendu).'
+    for champ in CHAMPS_TEXTE:
+        if ligne.get(champ) is not None and not isinstance(ligne[champ], str):
+            return f'Champ {champ} invalide (texte attendu).'
+    return None
+
+
+def _hacher(mots_de_passe, processus):
+    """Hache les mots de passe en parallèle dans un pool de processus"""
+    if processus <= 1 or len(mots_de_passe) < 2:
+        return [make_password(mdp) for mdp in mots_de_passe]
+    # spawn : ne pas forker un serveur web multi-threadé
+    contexte = multiprocessing.get_context('spawn')
+    taille_bloc = max(1, len(mots_de_passe) // (processus * 4))
+    with ProcessPoolExecutor(max_workers=processus, mp_context=contexte) as pool:
+        return list(pool.map(make_password, mots_de_passe, chunksize=taille_bloc))
+
+
+def _deja_pris(emails):
+    """Emails du roster dont l'email ou le username dérivé existe déjà en base, par lots"""
+    pris = set()
+    for i in range(0, len(emails), TAILLE_LOT):
+        lot = emails[i:i + TAILLE_LOT]
+        pris.update(User.objects.filter(email__in=lot).values_list('email', flat=True))
+        # Le compte qui porte ce username peut avoir un autre email (ou aucun) :
+        # c'est l'email du roster qui est pris
+        par_username = {username_depuis_email(email): email for email in lot}
+        pris.update(
+            par_username[username]
+            for username in User.objects.filter(username__in=par_username).values_list('username', flat=True)
+        )
+    return pris
+
+
+def _inserer_lot(lot):
+    """Insère un lot de (ligne, email, données, hash) ; retourne les emails créés"""
+    users = [
+        User(
+            username=username_depuis_email(email),
+            email=email,
+            password=encoded,
+            first_name=(donnees.get('first_name') or '')[:150],
+            last_name=(donnees.get('last_name') or '')[:150],
+        )
+        for _, email, donnees, encoded in lot
+    ]
+    with transaction.atomic():
+        User.objects.bulk_create(users, batch_size=TAILLE_LOT)
+        if any(user.pk is None for user in users):
+            ids = dict(User.objects.filter(email__in=[u.email for u in users]).values_list('email', 'pk'))
+            for user in users:
+                user.pk = ids[user.email]
+        Profil.objects.bulk_create(
+            [Profil(user_id=user.pk, telephone=(donnees.get('telephone') or '')[:20])
+             for user, (_, _, donnees, _) in zip(users, lot)],
+            batch_size=TAILLE_LOT,
+        )
+    return {user.email for user in users}
+
+
+def _reessayer_lot(lot, resultats):
+    """
+    Après un conflit : écarte les comptes apparus entre-temps, réinsère le reste
+    et, si un autre conflit survient, ligne par ligne. Retourne (lot, emails créés).
+    """
+    concurrents = _deja_pris([email for _, email, _, _ in lot])
+    for numero, email, _, _ in lot:
+        if email in concurrents:
+            resultats[numero] = {'ligne': numero, 'email': email, 'statut': 'existant'}
+    lot = [c for c in lot if c[1] not in concurrents]
+    try:
+        return lot, _inserer_lot(lot) if lot else set()
+    except IntegrityError:
+        pass
+    crees = set()
+    for candidat in lot:
+        numero, email, _, _ = candidat
+        try:
+            crees |= _inserer_lot([candidat])
+        except IntegrityError:
+            resultats[numero] = {
+                'ligne': numero, 'email': email, 'statut': 'erreur',
+                'detail': "Conflit à l'insertion (compte créé en parallèle ?).",
+            }
+    return lot, crees
+
+
+def importer_comptes(lignes, taille_lot=TAILLE_LOT, processus=None):
+    """
+    Crée les comptes (User + Profil) d'un roster et retourne le rapport :
+    résultat par ligne et débit global.
+    """
+    debut = time.perf_counter()
+    processus = processus or os.cpu_count() or 1
+    resultats = {}
+    candidats = []
+    vus = set()
+
+    for numero, ligne in enumerate(lignes, start=1):
+        email = ligne.get('email') if isinstance(ligne, dict) else ''
+        email = normaliser_email(email if isinstance(email, str) else '')
+        erreur = _valider(ligne, email)
+        if erreur:
+            resultats[numero] = {'ligne': numero, 'email': email, 'statut': 'erreur', 'detail': erreur}
+        elif email in vus:
+            resultats[numero] = {'ligne': numero, 'email': email, 'statut': 'doublon_fichier'}
+        else:
+            vus.add(email)
+            candidats.append((numero, email, ligne))
+
+    existants = _deja_pris([email for _, email, _ in candidats])
+    a_creer = [c for c in candidats if c[1] not in existants]
+    for numero, email, _ in candidats:
+        if email in existants:
+            resultats[numero] = {'ligne': numero, 'email': email, 'statut': 'existant'}
+
+    hashes = _hacher([ligne['password'] for _, _, ligne in a_creer], processus)
+    a_inserer = [(numero, email, ligne, encoded) for (numero, email, ligne), encoded in zip(a_creer, hashes)]
+
+    for i in range(0, len(a_inserer), taille_lot):
+        lot = a_inserer[i:i + taille_lot]
+        try:
+            crees = _inserer_lot(lot)
+        except IntegrityError:
+            # Inscription concurrente entre la vérification et l'insertion
+            lot, crees = _reessayer_lot(lot, resultats)
+        for numero, email, _, _ in lot:
+            if email in crees:
+                resultats[numero] = {'ligne': numero, 'email': email, 'statut': 'cree'}
+
+    duree = time.perf_counter() - debut
+    lignes_rapport = [resultats[numero] for numero in sorted(resultats)]
+    statuts = [r['statut'] for r in lignes_rapport]
+    return {
+        'total': len(lignes_rapport),
+        'crees': statuts.count('cree'),
+        'existants': statuts.count('existant'),
+        'doublons_fichier': statuts.count('doublon_fichier'),
+        'erreurs': statuts.count('erreur'),
+        'duree_secondes': round(duree, 3),
+        'comptes_par_seconde': round(len(lignes_rapport) / duree, 1) if duree else None,
+        'lignes': lignes_rapport,
+    }
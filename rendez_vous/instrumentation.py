@@ -0,0 +1,82 @@
+"""
+Mesures par requête : temps SQL, sérialisation, rendu JSON, QR code, portail interne.
+
+Les mesures sont rangées dans une variable de contexte ouverte par
+InstrumentationMiddleware ; hors requête, mesurer() ne fait rien.
+"""
+import time
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from rest_framework.renderers import JSONRenderer
+
+_requete = ContextVar('mesures_requete', default=None)
+
+
+class Mesures:
+    def __init__(self):
+        self.debut = time.perf_counter()
+        self.durees = Counter()
+        self.sql = Counter()
+        self.nb_requetes_sql = 0
+        self._en_cours = Counter()
+
+    @property
+    def total(self):
+        return time.perf_counter() - self.debut
+
+
+def demarrer():
+    """Ouvre les mesures de la requête courante"""
+    mesures = Mesures()
+    return mesures, _requete.set(mesures)
+
+
+def terminer(jeton):
+    _requete.reset(jeton)
+
+
+@contextmanager
+def mesurer(nom):
+    """Ajoute la durée du bloc à la catégorie `nom` (seul le bloc le plus externe compte)"""
+    mesures = _requete.get()
+    if mesures is None or mesures._en_cours[nom]:
+        yield
+        return
+    mesures._en_cours[nom] += 1
+    debut = time.perf_counter()
+    try:
+        yield
+    finally:
+        mesures.durees[nom] += time.perf_counter() - debut
+        mesures._en_cours[nom] -= 1
+
+
+def chronometrer_sql(execute, sql, params, many, context):
+    """execute_wrapper installé sur chaque connexion (voir signals.py)"""
+    mesures = _requete.get()
+    if mesures is None:
+        return execute(sql, params, many, context)
+    debut = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        mesures.durees['db'] += time.perf_counter() - debut
+        mesures.nb_requetes_sql += 1
+        # SQL paramétré : une même requête répétée avec d'autres valeurs garde le même texte
+        mesures.sql[sql] += 1
+
+
+class SerialisationMesuree:
+    """Mixin de sérialiseur : le temps de to_representation compte en « serialisation »"""
+
+    def to_representation(self, instance):
+        with mesurer('serialisation'):
+            return super().to_representation(instance)
+
+
+class JSONRendererMesure(JSONRenderer):
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        with mesurer('rendu'):
+            return super().render(data, accepted_media_type, renderer_context)
@@ -0,0 +1,65 @@
+"""
+Journalisation non bloquante : les handlers ne font qu'empiler dans une file,
+un thread dédié se charge de l'écriture (sortie d'erreur, en JSON).
+"""
+import atexit
+import json
+import logging
+import os
+import queue
+import sys
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+
+
+class FormateurJSON(logging.Formatter):
+    """Une ligne JSON par enregistrement ; extra={'donnees': {...}} est fusionné"""
+
+    def format(self, record):
+        ligne = {
+            'horodatage': datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec='milliseconds'),
+            'niveau': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+        }
+        ligne.update(getattr(record, 'donnees', None) or {})
+        if record.exc_info:
+            ligne['exception'] = self.formatException(record.exc_info)
+        return json.dumps(ligne, ensure_ascii=False, default=str)
+
+
+class GestionnaireFileAttente(QueueHandler):
+    """QueueHandler qui démarre son propre écouteur vers la sortie d'erreur"""
+
+    def __init__(self, taille=10000):
+        super().__init__(queue.Queue(taille))
+        self.taille = taille
+        self.demarrer_ecouteur()
+        atexit.register(lambda: self.ecouteur.stop())
+        # Worker forké depuis un processus qui a déjà chargé l'application
+        # (gunicorn --preload) : le thread d'écriture n'existe pas dans l'enfant
+        os.register_at_fork(after_in_child=self.apres_fork)
+
+    def demarrer_ecouteur(self):
+        sortie = logging.StreamHandler(sys.stderr)
+        sortie.setFormatter(FormateurJSON())
+        self.ecouteur = QueueListener(self.queue, sortie, respect_handler_level=True)
+        self.ecouteur.start()
+
+    def apres_fork(self):
+        # File neuve : le verrou de l'ancienne a pu être copié pris par un autre thread
+        self.queue = queue.Queue(self.taille)
+        self.demarrer_ecouteur()
+
+    def prepare(self, record):
+        # La traceback est mise en forme par l'écouteur, pas dans le thread de la requête
+        if record.exc_info:
+            return record
+        return super().prepare(record)
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            # File saturée : on perd la ligne plutôt que de bloquer la requête
+            pass
@@ -0,0 +1,122 @@
+"""
+Limitation de débit par seaux à jetons : par IP pour les anonymes (REMOTE_ADDR
+derrière NUM_PROXIES proxies de confiance), par compte sinon, avec des budgets distincts (LIMITATION_BUDGETS) pour les recherches,
+les listes et les écritures.
+
+Les seaux sont dans un fichier projeté en mémoire (LIMITATION_FICHIER) que
+partagent tous les workers de la machine. La table est associative par
+ensembles de VOIES emplacements : un accès ne verrouille (fcntl) que son
+ensemble et, s'il est plein, remplace le seau resté inactif le plus longtemps.
+"""
+import fcntl
+import hashlib
+import math
+import mmap
+import os
+import struct
+import threading
+import time
+
+from django.conf import settings
+from rest_framework.permissions import SAFE_METHODS
+from rest_framework.throttling import BaseThrottle
+
+# empreinte de la clé (0 = libre), jetons restants, dernier passage (time.time())
+EMPLACEMENT = struct.Struct('<Qdd')
+VOIES = 4
+
+
+class SeauxPartages:
+    def __init__(self, chemin, ensembles):
+        self.chemin = chemin
+        self.ensembles = ensembles
+        self.taille_ensemble = VOIES * EMPLACEMENT.size
+        self._verrou = threading.Lock()  # les verrous fcntl sont par processus, pas par thread
+        self._fd = None
+        self._carte = None
+
+    def _ouvrir(self):
+        taille = self.ensembles * self.taille_ensemble
+        fd = os.open(self.chemin, os.O_RDWR | os.O_CREAT, 0o600)
+        if os.fstat(fd).st_size < taille:
+            os.ftruncate(fd, taille)
+        self._carte = mmap.mmap(fd, taille)
+        self._fd = fd
+
+    def prendre(self, cle, capacite, debit):
+        """Retire un jeton du seau `cle` ; 0 si accordé, sinon secondes avant le prochain jeton"""
+        empreinte = int.from_bytes(hashlib.blake2b(cle.encode(), digest_size=8).digest(), 'little') | 1
+        debut = empreinte % self.ensembles * self.taille_ensemble
+        with self._verrou:
+            if self._carte is None:
+                self._ouvrir()
+            carte = self._carte
+            fcntl.lockf(self._fd, fcntl.LOCK_EX, self.taille_ensemble, debut)
+            try:
+                maintenant = time.time()
+                remplacable, plus_ancien = debut, math.inf
+                for position in range(debut, debut + self.taille_ensemble, EMPLACEMENT.size):
+                    occupant, jetons, passage = EMPLACEMENT.unpack_from(carte, position)
+                    if occupant == empreinte:
+                        jetons = min(capacite, jetons + max(0.0, maintenant - passage) * debit)
+                        break
+                    if passage < plus_ancien:
+                        remplacable, plus_ancien = position, passage
+                else:
+                    # Nouveau seau (ou éviction du plus ancien de l'ensemble), plein
+                    position, jetons = remplacable, capacite
+                if jetons >= 1:
+                    jetons -= 1
+                    attente = 0.0
+                else:
+                    attente = (1 - jetons) / debit
+                EMPLACEMENT.pack_into(carte, position, empreinte, jetons, maintenant)
+            finally:
+                fcntl.lockf(self._fd, fcntl.LOCK_UN, self.taille_ensemble, debut)
+        return attente
+
+
+_seaux = None
+
+
+def seaux():
+    global _seaux
+    if _seaux is None:
+        chemin = settings.LIMITATION_FICHIER or os.path.join(settings.ETAT_REPERTOIRE, 'limitation.bin')
+        os.makedirs(os.path.dirname(chemin), 0o700, exist_ok=True)
+        _seaux = SeauxPartages(chemin, settings.LIMITATION_ENSEMBLES)
+    return _seaux
+
+
+def attente_requise(request, portee, user=None):
+    """Consomme un jeton du budget `portee` ; 0 si la requête passe, sinon l'attente en secondes"""
+    if not settings.LIMITATION_ACTIVE:
+        return 0.0
+    if user is not None and user.is_authenticated:
+        profil, identite = 'utilisateur', f'u{user.pk}'
+    else:
+        # REMOTE_ADDR, ou l'adresse ajoutée par le dernier des NUM_PROXIES proxies de
+        # confiance : jamais un X-Forwarded-For choisi par le client
+        profil, identite = 'anonyme', BaseThrottle().get_ident(request)
+    capacite, debit = settings.LIMITATION_BUDGETS[portee][profil]
+    return seaux().prendre(f'{portee}:{identite}', capacite, debit)
+
+
+def entete_retry_after(attente):
+    return str(math.ceil(attente))
+
+
+class LimitationSeaux(BaseThrottle):
+    """
+    Throttle DRF. La portée vient de view.get_portee_limitation(request) si la
+    vue la définit, sinon de la méthode : lecture 'liste', écriture 'ecriture'.
+    """
+
+    def allow_request(self, request, view):
+        choisir = getattr(view, 'get_portee_limitation', None)
+        portee = choisir(request) if choisir else ('liste' if request.method in SAFE_METHODS else 'ecriture')
+        self.attente = attente_requise(request, portee, request.user)
+        return not self.attente
+
+    def wait(self):
+        return self.attente
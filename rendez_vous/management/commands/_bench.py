@@ -0,0 +1,88 @@
+"""Outils communs aux commandes de benchmark (module privé, pas une commande)"""
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db import connection
+from django.test.utils import override_settings, setup_test_environment, teardown_test_environment
+
+
+@contextmanager
+def base_de_test():
+    """Crée une base jetable pour la durée du benchmark.
+
+    Pour SQLite la base est un fichier et non la base en mémoire des tests,
+    afin que les threads concurrents la partagent comme en production.
+    La limitation de débit est coupée (toute la charge vient d'une seule IP),
+    ainsi que la salle d'attente. Le cache d'authentification est propre au
+    processus : les comptes de test ont les ids de comptes réels, ils ne
+    doivent pas arriver dans le cache lu par les workers en service.
+    """
+    test_settings = connection.settings_dict.setdefault('TEST', {})
+    dossier = None
+    if connection.vendor == 'sqlite' and not test_settings.get('NAME'):
+        dossier = tempfile.mkdtemp(prefix='bench_')
+        test_settings['NAME'] = os.path.join(dossier, 'bench.sqlite3')
+    setup_test_environment()
+    ancien_nom = connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+    try:
+        with override_settings(LIMITATION_ACTIVE=False, SALLE_ATTENTE_ACTIVE=False, CACHES={
+            **settings.CACHES,
+            'authentification': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'bench'},
+        }):
+            yield
+    finally:
+        connection.creation.destroy_test_db(ancien_nom, verbosity=0)
+        teardown_test_environment()
+        if dossier:
+            test_settings.pop('NAME', None)
+            shutil.rmtree(dossier, ignore_errors=True)
+
+
+def percentiles(valeurs):
+    """Résumé d'une série de durées (en secondes) : moyenne et p50/p95/p99"""
+    v = sorted(valeurs)
+    if not v:
+        return {'n': 0, 'moyenne': 0.0, 'p50': 0.0, 'p95': 0.0, 'p99': 0.0}
+
+    def p(q):
+        return v[min(len(v) - 1, int(round(q / 100 * (len(v) - 1))))]
+
+    return {'n': len(v), 'moyenne': statistics.fmean(v), 'p50': p(50), 'p95': p(95), 'p99': p(99)}
+
+
+def formater_ms(resume):
+    """Formate un résumé de percentiles en millisecondes"""
+    return (f"n={resume['n']} moy={resume['moyenne'] * 1000:.2f}ms "
+            f"p50={resume['p50'] * 1000:.2f}ms p95={resume['p95'] * 1000:.2f}ms "
+            f"p99={resume['p99'] * 1000:.2f}ms")
+
+
+def lire_importtime(sortie):
+    """Lignes de `python -X importtime` : [(profondeur, module, propre_us, cumule_us)]"""
+    lignes = []
+    for ligne in sortie.splitlines():
+        if not ligne.startswith('import time:') or 'cumulative' in ligne:
+            continue
+        propre, cumule, module = ligne.split('|', 2)
+        nom = module.lstrip(' ')
+        # Un espace pour le niveau 0, puis deux par niveau d'import imbriqué
+        lignes.append(((len(module) - len(nom) - 1) // 2, nom, int(propre.split(':')[1]), int(cumule)))
+    return lignes
+
+
+def profiler_imports(code, env=None):
+    """Exécute `code` dans un nouvel interpréteur avec -X importtime ; voir lire_importtime"""
+    from django.conf import settings
+
+    resultat = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', code], cwd=settings.BASE_DIR,
+        env={**os.environ, 'DJANGO_SETTINGS_MODULE': 'portail_externe.settings', **(env or {})},
+        capture_output=True, text=True, check=True,
+    )
+    return lire_importtime(resultat.stderr)
@@ -0,0 +1,70 @@
+from datetime import date, timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from rendez_vous import prevision
+
+
+class Command(BaseCommand):
+    help = ("Analyse la charge historique par jour de semaine × créneau × opération et prévoit la demande "
+            "des semaines à venir ; le résultat (.npz) sert aussi GET /api/stats/charge/.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--jours', type=int, default=365, help="Jours d'historique")
+        parser.add_argument('--semaines', type=int, default=4, help="Semaines de prévision")
+        parser.add_argument('--recalculer', action='store_true', help="Ignore l'artefact en cache")
+        parser.add_argument('--top', type=int, default=10, help="Cases affichées par classement")
+
+    def handle(self, *args, **options):
+        if not 7 <= options['jours'] <= settings.ANALYSE_JOURS_MAX:
+            raise CommandError(f"--jours doit être compris entre 7 et {settings.ANALYSE_JOURS_MAX}.")
+        if not 1 <= options['semaines'] <= settings.ANALYSE_SEMAINES_MAX:
+            raise CommandError(f"--semaines doit être compris entre 1 et {settings.ANALYSE_SEMAINES_MAX}.")
+        import numpy as np
+
+        resultat = prevision.analyse(options['jours'], options['semaines'], recalculer=options['recalculer'])
+        meta = resultat['meta']
+        self.stdout.write(
+            f"{meta['du']} → {meta['au']} : {meta['rendez_vous']} rendez-vous, "
+            f"chargés en {meta['duree_chargement'] * 1000:.0f}ms, analysés en {meta['duree_calcul'] * 1000:.0f}ms "
+            f"(calcul du {meta['calcule_le']})"
+        )
+        self.stdout.write(f"Artefact : {meta['artefact']}")
+
+        top = options['top']
+        reservations = resultat['reservations']
+        moyenne = reservations / max(meta['semaines_historique'], 1)
+        self.classement("Cases les plus chargées (réservations par semaine)", moyenne, top, '{:.1f}')
+        # Taux sur les cases d'au moins une réservation par semaine en moyenne
+        volume = moyenne >= 1
+        prises = reservations - resultat['annulations']
+        self.classement("Taux d'annulation", np.where(volume, resultat['annulations'] / np.maximum(reservations, 1), 0),
+                        top, '{:.0%}')
+        self.classement("Taux d'absence", np.where(volume, resultat['absences'] / np.maximum(prises, 1), 0),
+                        top, '{:.0%}')
+
+        self.stdout.write(f"Prévision (croissance {meta['croissance_hebdomadaire']:+.1%} par semaine, "
+                          f"capacité {meta['capacite_creneau']} par créneau) :")
+        debut = date.fromisoformat(meta['debut_prevision'])
+        for i, semaine in enumerate(resultat['prevision']):
+            saturation = semaine.sum(axis=-1) / meta['capacite_creneau']
+            tendus = np.argwhere(saturation >= 0.9)
+            self.stdout.write(f"  semaine du {debut + timedelta(weeks=i)} : {semaine.sum():.0f} rendez-vous prévus, "
+                              f"{len(tendus)} créneaux à 90 % ou plus")
+            for jour, creneau in tendus[:top]:
+                self.stdout.write(f"    {prevision.JOURS_SEMAINE[jour]} {prevision.CRENEAUX[creneau]:%H:%M} "
+                                  f"{saturation[jour, creneau]:.0%}")
+
+    def classement(self, titre, valeurs, top, format_valeur):
+        import numpy as np
+
+        self.stdout.write(f"{titre} :")
+        for indice in np.argsort(valeurs, axis=None)[::-1][:top]:
+            jour, creneau, operation = np.unravel_index(indice, valeurs.shape)
+            if not valeurs[jour, creneau, operation]:
+                break
+            self.stdout.write(
+                f"  {prevision.JOURS_SEMAINE[jour]:9} {prevision.CRENEAUX[creneau]:%H:%M} "
+                f"{prevision.OPERATIONS[operation]:7} {format_valeur.format(valeurs[jour, creneau, operation])}"
+            )
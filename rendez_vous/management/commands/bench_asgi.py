@@ -0,0 +1,127 @@
+import asyncio
+import io
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, time as heure, timedelta
+
+from django.core.asgi import get_asgi_application
+from django.core.management.base import BaseCommand
+from django.core.wsgi import get_wsgi_application
+
+from rendez_vous.management.commands._bench import base_de_test, formater_ms, percentiles
+from rendez_vous.models import RendezVous
+
+
+def appel_wsgi(application, chemin, requete):
+    """Exécute une requête GET sur l'application WSGI ; retourne le code HTTP"""
+    environ = {
+        'REQUEST_METHOD': 'GET', 'SCRIPT_NAME': '', 'PATH_INFO': chemin, 'QUERY_STRING': requete,
+        'SERVER_NAME': 'testserver', 'SERVER_PORT': '80', 'SERVER_PROTOCOL': 'HTTP/1.1',
+        'HTTP_HOST': 'testserver', 'REMOTE_ADDR': '127.0.0.1',
+        'wsgi.version': (1, 0), 'wsgi.url_scheme': 'http', 'wsgi.input': io.BytesIO(b''),
+        'wsgi.errors': sys.stderr, 'wsgi.multithread': True, 'wsgi.multiprocess': False,
+        'wsgi.run_once': False,
+    }
+    statut = []
+    corps = application(environ, lambda s, h, exc_info=None: statut.append(int(s[:3])))
+    try:
+        for _ in corps:
+            pass
+    finally:
+        corps.close()
+    return statut[0]
+
+
+async def appel_asgi(application, chemin, requete):
+    """Exécute une requête GET sur l'application ASGI ; retourne le code HTTP"""
+    scope = {
+        'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'method': 'GET',
+        'scheme': 'http', 'path': chemin, 'raw_path': chemin.encode(), 'root_path': '',
+        'query_string': requete.encode(), 'headers': [(b'host', b'testserver')],
+        'client': ('127.0.0.1', 0), 'server': ('testserver', 80),
+    }
+    corps_envoye = False
+
+    async def receive():
+        nonlocal corps_envoye
+        if not corps_envoye:
+            corps_envoye = True
+            return {'type': 'http.request', 'body': b'', 'more_body': False}
+        await asyncio.Future()  # le client ne se déconnecte pas
+
+    statut = []
+
+    async def send(message):
+        if message['type'] == 'http.response.start':
+            statut.append(message['status'])
+
+    await application(scope, receive, send)
+    return statut[0]
+
+
+class Command(BaseCommand):
+    help = ("Compare WSGI (un worker, N threads) et ASGI (une boucle d'événements) "
+            "sous un grand nombre de connexions simultanées sur un endpoint de lecture.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--connexions', type=int, default=1000, help="Requêtes simultanées")
+        parser.add_argument('--threads', type=int, default=8, help="Threads du worker WSGI")
+        parser.add_argument('--chemin', default='/api/rendez-vous/prochains/')
+        parser.add_argument('--requete', default='', help="Query string, ex. date=2030-01-01")
+
+    def handle(self, *args, **options):
+        with base_de_test():
+            self.peupler()
+            n, chemin, requete = options['connexions'], options['chemin'], options['requete']
+
+            wsgi = get_wsgi_application()
+            appel_wsgi(wsgi, chemin, requete)  # échauffement
+            self.rapport(f"WSGI, 1 worker, {options['threads']} threads", *self.mesurer_wsgi(
+                wsgi, chemin, requete, n, options['threads']))
+
+            asgi = get_asgi_application()
+            self.rapport("ASGI, 1 worker", *asyncio.run(self.mesurer_asgi(asgi, chemin, requete, n)))
+
+    def peupler(self):
+        aujourd_hui = date.today()
+        RendezVous.objects.bulk_create([
+            RendezVous(
+                cin=f"AB{i:06d}", plaque_camion=f"{1000 + i}-A-1", numero_conteneur=f"MSCU{i:07d}",
+                sens_trafic='entree', type_conteneur='plein', operation='import',
+                date_rdv=aujourd_hui + timedelta(days=i % 2), heure_rdv=heure(6 + 2 * (i % 8)),
+                qr_code=f"qr_codes/qr_code_{i}.png",
+            )
+            for i in range(50)
+        ])
+
+    def mesurer_wsgi(self, application, chemin, requete, n, threads):
+        def requete_chronometree(depart):
+            statut = appel_wsgi(application, chemin, requete)
+            return time.perf_counter() - depart, statut
+
+        debut = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=threads) as pool:
+            # Toutes les connexions arrivent ensemble : la latence inclut l'attente d'un thread
+            futures = [pool.submit(requete_chronometree, debut) for _ in range(n)]
+            resultats = [f.result() for f in futures]
+        return time.perf_counter() - debut, resultats
+
+    async def mesurer_asgi(self, application, chemin, requete, n):
+        await appel_asgi(application, chemin, requete)  # échauffement
+        debut = time.perf_counter()
+
+        async def requete_chronometree():
+            statut = await appel_asgi(application, chemin, requete)
+            return time.perf_counter() - debut, statut
+
+        resultats = await asyncio.gather(*(requete_chronometree() for _ in range(n)))
+        return time.perf_counter() - debut, resultats
+
+    def rapport(self, nom, duree, resultats):
+        statuts = {}
+        for _, statut in resultats:
+            statuts[statut] = statuts.get(statut, 0) + 1
+        self.stdout.write(f"{nom} :")
+        self.stdout.write("  " + formater_ms(percentiles([d for d, _ in resultats])))
+        self.stdout.write(f"  {len(resultats) / duree:.1f} requêtes/s, statuts={statuts}")
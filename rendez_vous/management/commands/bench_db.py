@@ -0,0 +1,86 @@
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, time as heure, timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import OperationalError, connection, connections
+
+from rendez_vous.management.commands._bench import base_de_test, formater_ms, percentiles
+from rendez_vous.models import RendezVous
+from rendez_vous.serializers import RendezVousCreateSerializer
+
+# PRAGMA par défaut de SQLite, pour comparer au profil réglé des settings
+PRAGMAS_SQLITE_DEFAUT = {'journal_mode': 'DELETE', 'synchronous': 'FULL'}
+
+
+def donnees_reservation():
+    """Réservation valide et sans conflit (plaque aléatoire)"""
+    return {
+        'cin': f"AB{random.randint(0, 999999):06d}",
+        'plaque_camion': f"{random.randint(100, 9999)}-{random.choice('ABDHW')}-{random.randint(1, 99)}",
+        'numero_conteneur': f"MSCU{random.randint(0, 9999999):07d}",
+        'sens_trafic': random.choice(['entree', 'sortie']),
+        'type_conteneur': random.choice(['plein', 'vide']),
+        'operation': random.choice(['import', 'export']),
+        'date_rdv': (date.today() + timedelta(days=random.randint(1, 30))).isoformat(),
+        'heure_rdv': heure(random.choice(range(6, 22, 2))).isoformat(),
+    }
+
+
+class Command(BaseCommand):
+    help = ("Benchmark de concurrence sur la réservation (validation avec contrôle de conflit, "
+            "insertion, lecture du planning) pour la base configurée. Sous SQLite, compare "
+            "les PRAGMA par défaut au profil SQLITE_PRAGMAS.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=16, help="Réservations simultanées")
+        parser.add_argument('--reservations', type=int, default=2000, help="Réservations par scénario")
+
+    def handle(self, *args, **options):
+        if connection.vendor == 'sqlite':
+            scenarios = [('sqlite (PRAGMA par défaut)', PRAGMAS_SQLITE_DEFAUT),
+                         ('sqlite (SQLITE_PRAGMAS)', settings.SQLITE_PRAGMAS)]
+        else:
+            db = connection.settings_dict
+            scenarios = [(f"{connection.vendor} (CONN_MAX_AGE={db['CONN_MAX_AGE']}, "
+                          f"CONN_HEALTH_CHECKS={db['CONN_HEALTH_CHECKS']})", None)]
+
+        pragmas_origine = settings.SQLITE_PRAGMAS
+        try:
+            for nom, pragmas in scenarios:
+                if pragmas is not None:
+                    settings.SQLITE_PRAGMAS = pragmas
+                connections.close_all()
+                with base_de_test():
+                    self.executer(nom, options['threads'], options['reservations'])
+        finally:
+            settings.SQLITE_PRAGMAS = pragmas_origine
+
+    def executer(self, nom, threads, reservations):
+        def reserver(_):
+            debut = time.perf_counter()
+            try:
+                serializer = RendezVousCreateSerializer(data=donnees_reservation())
+                serializer.is_valid(raise_exception=True)
+                # QR code prérempli : on mesure la base, pas le rendu PNG
+                rdv = serializer.save(qr_code='qr_codes/bench.png')
+                list(RendezVous.objects.filter(date_rdv=rdv.date_rdv).order_by('heure_rdv')[:50])
+                return time.perf_counter() - debut, None
+            except OperationalError as e:
+                return time.perf_counter() - debut, str(e)
+            finally:
+                connection.close()
+
+        debut = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=threads) as pool:
+            resultats = list(pool.map(reserver, range(reservations)))
+        duree = time.perf_counter() - debut
+
+        latences = [d for d, erreur in resultats if erreur is None]
+        erreurs = [erreur for _, erreur in resultats if erreur is not None]
+        self.stdout.write(f"{nom} — {threads} threads :")
+        self.stdout.write("  " + formater_ms(percentiles(latences)))
+        self.stdout.write(f"  {len(latences) / duree:.1f} réservations/s, {len(erreurs)} erreurs"
+                          + (f" (ex. {erreurs[0]})" if erreurs else ""))
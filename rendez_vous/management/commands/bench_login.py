@@ -0,0 +1,80 @@
+import asyncio
+import random
+import time
+
+from django.contrib.auth.hashers import check_password, make_password
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.test import AsyncClient
+
+from rendez_vous.management.commands._bench import base_de_test, formater_ms, percentiles
+
+MOT_DE_PASSE = 'Bench-Connexion-2024'
+
+
+class Command(BaseCommand):
+    help = ("Mesure le débit de connexion en séparant le temps base de données "
+            "(recherche par email) du temps de hachage PBKDF2.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--utilisateurs', type=int, default=5000, help="Comptes créés dans la base de test")
+        parser.add_argument('--connexions', type=int, default=100, help="Connexions complètes à mesurer")
+        parser.add_argument('--concurrence', type=int, default=16, help="Connexions simultanées")
+
+    def handle(self, *args, **options):
+        with base_de_test():
+            emails = self.creer_utilisateurs(options['utilisateurs'])
+            echantillon = random.sample(emails, min(len(emails), options['connexions']))
+            encoded = User.objects.get(email=echantillon[0]).password
+
+            self.stdout.write("Recherche par email (index unique, égalité) :")
+            self.stdout.write("  " + formater_ms(self.chronometrer(
+                lambda e: User.objects.filter(email=e).first(), echantillon)))
+            self.stdout.write("Recherche par email (iexact, ancien chemin) :")
+            self.stdout.write("  " + formater_ms(self.chronometrer(
+                lambda e: User.objects.filter(email__iexact=e).first(), echantillon)))
+            self.stdout.write("Vérification PBKDF2 :")
+            self.stdout.write("  " + formater_ms(self.chronometrer(
+                lambda e: check_password(MOT_DE_PASSE, encoded), echantillon[:20])))
+
+            duree, latences, statuts = asyncio.run(self.connexions(echantillon, options['concurrence']))
+            self.stdout.write(f"Connexions complètes (ASGI, concurrence {options['concurrence']}) :")
+            self.stdout.write("  " + formater_ms(percentiles(latences)))
+            self.stdout.write(f"  statuts={statuts}")
+            self.stdout.write(self.style.SUCCESS(f"Débit : {len(echantillon) / duree:.1f} connexions/s"))
+
+    def creer_utilisateurs(self, nombre):
+        encoded = make_password(MOT_DE_PASSE)
+        emails = [f"chauffeur{i}@bench.ma" for i in range(nombre)]
+        User.objects.bulk_create(
+            [User(username=email, email=email, password=encoded) for email in emails],
+            batch_size=500,
+        )
+        return emails
+
+    def chronometrer(self, fonction, emails):
+        durees = []
+        for email in emails:
+            debut = time.perf_counter()
+            fonction(email)
+            durees.append(time.perf_counter() - debut)
+        return percentiles(durees)
+
+    async def connexions(self, emails, concurrence):
+        client = AsyncClient()
+        semaphore = asyncio.Semaphore(concurrence)
+        latences, statuts = [], {}
+
+        async def connexion(email):
+            async with semaphore:
+                debut = time.perf_counter()
+                response = await client.post(
+                    '/api/auth/login/', {'email': email, 'password': MOT_DE_PASSE},
+                    content_type='application/json',
+                )
+                latences.append(time.perf_counter() - debut)
+                statuts[response.status_code] = statuts.get(response.status_code, 0) + 1
+
+        debut = time.perf_counter()
+        await asyncio.gather(*(connexion(email) for email in emails))
+        return time.perf_counter() - debut, latences, statuts
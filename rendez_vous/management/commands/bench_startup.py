@@ -0,0 +1,101 @@
+import json
+import os
+import subprocess
+import sys
+import time
+from collections import Counter
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from rendez_vous.management.commands._bench import formater_ms, percentiles, profiler_imports
+
+# Exécuté dans un nouvel interpréteur : charge portail_externe.wsgi ou .asgi
+# comme un worker, sert une première requête, puis (mode préchargé) forke des
+# workers qui servent chacun leur première requête, comme gunicorn --preload.
+# Les instants sont pris sur l'horloge monotone, commune aux processus sous Linux.
+WORKER = '''
+import asyncio, importlib, json, os, sys, time
+serveur, chemin, forks = sys.argv[1], sys.argv[2], int(sys.argv[3])
+application = importlib.import_module(f'portail_externe.{serveur}').application
+pret = time.monotonic()
+from rendez_vous.management.commands.bench_asgi import appel_asgi, appel_wsgi
+
+def servir():
+    if serveur == 'wsgi':
+        return appel_wsgi(application, chemin, '')
+    return asyncio.run(appel_asgi(application, chemin, ''))
+
+mesure = {'pret': pret, 'statut': servir(), 'reponse': time.monotonic(), 'modules': len(sys.modules), 'forks': []}
+for _ in range(forks):
+    lecture, ecriture = os.pipe()
+    debut = time.monotonic()
+    pid = os.fork()
+    if pid == 0:
+        os.close(lecture)
+        servir()
+        os.write(ecriture, str(time.monotonic() - debut).encode())
+        os._exit(0)
+    os.close(ecriture)
+    mesure['forks'].append(float(os.read(lecture, 64)))
+    os.close(lecture)
+    os.waitpid(pid, 0)
+print(json.dumps(mesure))
+'''
+
+
+class Command(BaseCommand):
+    help = ("Mesure le démarrage des workers WSGI et ASGI : lancement à froid (processus → application "
+            "chargée → première réponse) et fork depuis un processus préchargé (gunicorn --preload), "
+            "puis liste les imports les plus coûteux.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repetitions', type=int, default=10, help="Workers lancés par mesure")
+        parser.add_argument('--serveur', choices=('wsgi', 'asgi', 'tous'), default='tous')
+        parser.add_argument('--chemin', default='/api/test/', help="Première requête servie")
+        parser.add_argument('--imports', type=int, default=15,
+                            help="Nombre d'imports de premier niveau à afficher (0 : aucun)")
+        parser.add_argument('--budget-ms', type=float, default=None,
+                            help="Échoue si les imports d'un worker dépassent ce temps (ms), pour la CI")
+
+    def handle(self, *args, **options):
+        serveurs = ('wsgi', 'asgi') if options['serveur'] == 'tous' else (options['serveur'],)
+        for serveur in serveurs:
+            self.mesurer(serveur, options['chemin'], options['repetitions'])
+        if options['imports'] or options['budget_ms'] is not None:
+            self.imports(options['imports'], options['budget_ms'])
+
+    def lancer(self, serveur, chemin, forks):
+        debut = time.monotonic()
+        resultat = subprocess.run(
+            [sys.executable, '-c', WORKER, serveur, chemin, str(forks)], cwd=settings.BASE_DIR,
+            env={**os.environ, 'DJANGO_SETTINGS_MODULE': 'portail_externe.settings', 'ALLOWED_HOSTS': 'testserver'},
+            capture_output=True, text=True, check=True,
+        )
+        mesure = json.loads(resultat.stdout.strip().splitlines()[-1])
+        mesure['pret'] -= debut
+        mesure['reponse'] -= debut
+        return mesure
+
+    def mesurer(self, serveur, chemin, repetitions):
+        mesures = [self.lancer(serveur, chemin, 0) for _ in range(repetitions)]
+        forks = self.lancer(serveur, chemin, repetitions)['forks']
+        statuts = sorted({m['statut'] for m in mesures})
+        self.stdout.write(f"{serveur.upper()} ({mesures[-1]['modules']} modules chargés, statuts {statuts}) :")
+        self.stdout.write(f"  à froid, application chargée : {formater_ms(percentiles([m['pret'] for m in mesures]))}")
+        self.stdout.write(f"  à froid, première réponse    : {formater_ms(percentiles([m['reponse'] for m in mesures]))}")
+        self.stdout.write(f"  préchargé, fork → réponse    : {formater_ms(percentiles(forks))}")
+
+    def imports(self, nombre, budget_ms=None):
+        lignes = profiler_imports('import portail_externe.wsgi', env={'ALLOWED_HOSTS': 'testserver'})
+        # Temps propre de chaque module cumulé par paquet : qui coûte, pas qui importe
+        paquets = Counter()
+        for _, module, propre, _ in lignes:
+            paquets[module.split('.')[0]] += propre
+        total_ms = sum(paquets.values()) / 1000
+        self.stdout.write(f"Imports d'un worker WSGI : {len(lignes)} modules, {total_ms:.1f}ms au total")
+        for paquet, propre in paquets.most_common(nombre):
+            self.stdout.write(f"  {propre / 1000:8.1f}ms  {paquet}")
+        # Mesure d'horloge : à lancer sur une machine de référence, pas dans la suite de tests
+        if budget_ms is not None and total_ms > budget_ms:
+            raise CommandError(f"Imports : {total_ms:.1f}ms, au-delà du budget de {budget_ms:.0f}ms.")
@@ -0,0 +1,73 @@
+import os
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from rendez_vous.fichiers import fichiers_qr, noms_references
+
+
+class Command(BaseCommand):
+    help = ("Supprime les fichiers de MEDIA_ROOT/qr_codes qu'aucun rendez-vous ne référence "
+            "(suppressions ou régénérations passées), par lots.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help="Liste les orphelins sans rien supprimer")
+        parser.add_argument('--lot', type=int, default=500, help="Fichiers supprimés par lot")
+        parser.add_argument('--lot-lecture', type=int, default=10000, help="Noms lus par lot en base")
+        parser.add_argument('--age-min', type=int, default=3600,
+                            help="Ignore les fichiers modifiés depuis moins de N secondes")
+        parser.add_argument('--pause', type=float, default=0, help="Secondes d'attente entre deux lots")
+
+    def handle(self, *args, **options):
+        if options['lot'] < 1 or options['lot_lecture'] < 1:
+            raise CommandError("--lot et --lot-lecture doivent être positifs.")
+        # Les noms référencés sont lus avant le parcours : un QR code écrit par une
+        # réservation pas encore validée est récent, et protégé par --age-min
+        debut = time.perf_counter()
+        references = noms_references(options['lot_lecture'])
+        limite = time.time() - options['age_min']
+        self.stdout.write(f"{len(references)} QR codes référencés, lus en {time.perf_counter() - debut:.2f}s")
+
+        dry_run = options['dry_run']
+        parcourus = orphelins = recents = supprimes = octets = 0
+        lot = []
+        for nom, entree in fichiers_qr():
+            parcourus += 1
+            if nom in references:
+                continue
+            try:
+                stat = entree.stat(follow_symlinks=False)
+            except FileNotFoundError:
+                continue
+            if stat.st_mtime > limite:
+                recents += 1
+                continue
+            orphelins += 1
+            octets += stat.st_size
+            lot.append(entree.path)
+            if dry_run:
+                self.stdout.write(f"  {nom}")
+            if len(lot) >= options['lot']:
+                supprimes += self.vider(lot, dry_run, options['pause'])
+        supprimes += self.vider(lot, dry_run, options['pause'])
+
+        self.stdout.write(f"{parcourus} fichiers parcourus, {orphelins} orphelins ({octets / 1024 / 1024:.1f} Mo), "
+                          f"{recents} orphelins récents ignorés")
+        if dry_run:
+            self.stdout.write("Simulation : aucun fichier supprimé.")
+        else:
+            self.stdout.write(self.style.SUCCESS(f"{supprimes} fichiers supprimés."))
+
+    def vider(self, lot, dry_run, pause):
+        supprimes = 0
+        if not dry_run:
+            for chemin in lot:
+                try:
+                    os.unlink(chemin)
+                    supprimes += 1
+                except FileNotFoundError:
+                    pass
+            if lot and pause:
+                time.sleep(pause)
+        lot.clear()
+        return supprimes
@@ -0,0 +1,39 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from rendez_vous.import_comptes import TAILLE_LOT, importer_comptes, lire_roster
+
+
+class Command(BaseCommand):
+    help = ("Crée en masse les comptes d'un transporteur à partir d'un roster CSV ou JSON "
+            "(colonnes : email, password, first_name, last_name, telephone).")
+
+    def add_arguments(self, parser):
+        parser.add_argument('fichier', help="Chemin du roster CSV ou JSON")
+        parser.add_argument('--format', choices=['csv', 'json'], help="Détecté d'après le contenu par défaut")
+        parser.add_argument('--taille-lot', type=int, default=TAILLE_LOT, help="Lignes insérées par bulk_create")
+        parser.add_argument('--processus', type=int, help="Processus de hachage (nombre de CPU par défaut)")
+        parser.add_argument('--rapport', help="Écrire le rapport complet en JSON dans ce fichier")
+
+    def handle(self, *args, **options):
+        try:
+            with open(options['fichier'], 'rb') as f:
+                lignes = lire_roster(f.read(), options['format'])
+        except (OSError, ValueError) as e:
+            raise CommandError(f"Roster illisible : {e}")
+
+        rapport = importer_comptes(lignes, taille_lot=options['taille_lot'], processus=options['processus'])
+
+        for ligne in rapport['lignes']:
+            if ligne['statut'] != 'cree':
+                self.stdout.write(f"Ligne {ligne['ligne']} ({ligne['email']}) : {ligne['statut']} "
+                                  f"{ligne.get('detail', '')}".rstrip())
+        if options['rapport']:
+            with open(options['rapport'], 'w', encoding='utf-8') as f:
+                json.dump(rapport, f, ensure_ascii=False, indent=2)
+        self.stdout.write(self.style.SUCCESS(
+            f"{rapport['crees']} comptes créés, {rapport['existants']} existants, "
+            f"{rapport['doublons_fichier']} doublons, {rapport['erreurs']} erreurs "
+            f"en {rapport['duree_secondes']}s ({rapport['comptes_par_seconde']} lignes/s)."
+        ))
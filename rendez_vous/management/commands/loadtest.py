@@ -0,0 +1,312 @@
+import http.client
+import json
+import random
+import tempfile
+import threading
+import time
+import uuid
+from collections import Counter, defaultdict
+from datetime import date, datetime, time as heure, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.core.servers.basehttp import ThreadedWSGIServer, WSGIRequestHandler
+from django.core.wsgi import get_wsgi_application
+
+from rendez_vous.management.commands._bench import base_de_test, percentiles
+
+MOT_DE_PASSE = 'Charge-Test-2024'
+
+
+class GestionnaireSilencieux(WSGIRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+
+class PortailInterneStub(BaseHTTPRequestHandler):
+    """Portail interne factice : accepte tous les QR codes (201)"""
+    recus = 0
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        PortailInterneStub.recus += 1
+        self.send_response(201)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    def log_message(self, format, *args):
+        pass
+
+
+def demarrer(serveur):
+    threading.Thread(target=serveur.serve_forever, daemon=True).start()
+    return serveur
+
+
+class Statistiques:
+    def __init__(self):
+        self.verrou = threading.Lock()
+        self.latences = defaultdict(list)
+        self.statuts = defaultdict(Counter)
+        self.erreurs = Counter()
+
+    def enregistrer(self, etiquette, duree, statut, erreur):
+        with self.verrou:
+            self.latences[etiquette].append(duree)
+            self.statuts[etiquette][statut] += 1
+            if erreur:
+                self.erreurs[etiquette] += 1
+
+    def resume(self, duree):
+        endpoints = {}
+        for etiquette in sorted(self.latences):
+            latences = self.latences[etiquette]
+            resume = percentiles(latences)
+            endpoints[etiquette] = {
+                'requetes': len(latences),
+                'requetes_par_seconde': round(len(latences) / duree, 2),
+                'taux_erreur': round(self.erreurs[etiquette] / len(latences), 4),
+                'p50_ms': round(resume['p50'] * 1000, 2),
+                'p95_ms': round(resume['p95'] * 1000, 2),
+                'p99_ms': round(resume['p99'] * 1000, 2),
+                'statuts': {str(k): v for k, v in sorted(self.statuts[etiquette].items(), key=str)},
+            }
+        toutes = [d for latences in self.latences.values() for d in latences]
+        resume = percentiles(toutes)
+        total = {
+            'requetes': len(toutes),
+            'requetes_par_seconde': round(len(toutes) / duree, 2),
+            'taux_erreur': round(sum(self.erreurs.values()) / len(toutes), 4) if toutes else 0,
+            'p50_ms': round(resume['p50'] * 1000, 2),
+            'p95_ms': round(resume['p95'] * 1000, 2),
+            'p99_ms': round(resume['p99'] * 1000, 2),
+        }
+        return total, endpoints
+
+
+class ClientHTTP:
+    """Connexion keep-alive d'un utilisateur virtuel"""
+
+    def __init__(self, hote, port, statistiques):
+        self.hote, self.port, self.statistiques = hote, port, statistiques
+        self.connexion = None
+        self.jeton = None
+
+    def requete(self, etiquette, methode, chemin, corps=None, attendus=(200, 201)):
+        entetes = {'Content-Type': 'application/json'}
+        if self.jeton:
+            entetes['Authorization'] = f'Bearer {self.jeton}'
+        debut = time.perf_counter()
+        try:
+            if self.connexion is None:
+                self.connexion = http.client.HTTPConnection(self.hote, self.port, timeout=60)
+            self.connexion.request(methode, chemin, body=json.dumps(corps) if corps is not None else None,
+                                   headers=entetes)
+            reponse = self.connexion.getresponse()
+            contenu = reponse.read()
+            if reponse.getheader('Connection', '').lower() == 'close':
+                self.fermer()
+        except (OSError, http.client.HTTPException) as e:
+            self.fermer()
+            self.statistiques.enregistrer(etiquette, time.perf_counter() - debut, type(e).__name__, True)
+            return None, None
+        self.statistiques.enregistrer(etiquette, time.perf_counter() - debut, reponse.status,
+                                      reponse.status not in attendus)
+        try:
+            return reponse.status, json.loads(contenu) if contenu else None
+        except ValueError:
+            return reponse.status, None
+
+    def fermer(self):
+        if self.connexion is not None:
+            self.connexion.close()
+            self.connexion = None
+
+
+def reservation_aleatoire():
+    return {
+        'cin': f"{random.choice(['AB', 'BK', 'J', 'CD'])}{random.randint(0, 999999):06d}",
+        'plaque_camion': f"{random.randint(100, 9999)}-{random.choice(['A', 'B', 'WW', 'HB'])}-{random.randint(1, 99)}",
+        'numero_conteneur': f"{random.choice(['MSCU', 'CMAU', 'MAEU'])}{random.randint(0, 9999999):07d}",
+        'sens_trafic': random.choice(['entree', 'sortie']),
+        'type_conteneur': random.choice(['plein', 'vide']),
+        'operation': random.choice(['import', 'export']),
+        'date_rdv': (date.today() + timedelta(days=random.randint(1, 14))).isoformat(),
+        'heure_rdv': heure(random.choice(range(6, 22, 2))).strftime('%H:%M'),
+    }
+
+
+class UtilisateurVirtuel:
+    """Enchaîne les parcours tirés selon le mélange jusqu'à l'échéance"""
+
+    def __init__(self, client, partage, melange, pause):
+        self.client, self.partage, self.pause = client, partage, pause
+        self.parcours = [getattr(self, f'parcours_{nom}') for nom in melange]
+        self.poids = list(melange.values())
+        self.email = None
+
+    def attendre(self):
+        if self.pause:
+            time.sleep(random.uniform(0, 2 * self.pause))
+
+    def executer(self, echeance):
+        while time.monotonic() < echeance:
+            random.choices(self.parcours, self.poids)[0]()
+        self.client.fermer()
+
+    def parcours_chauffeur(self):
+        """Connexion → disponibilités → réservation → historique"""
+        if self.email is None:
+            self.email = f"vu-{uuid.uuid4().hex[:12]}@charge.ma"
+            self.client.requete('POST /api/auth/register/', 'POST', '/api/auth/register/', {
+                'email': self.email, 'password': MOT_DE_PASSE, 'first_name': 'Charge',
+                'last_name': 'Test', 'telephone': '0600000000',
+            })
+        self.client.jeton = None
+        _, donnees = self.client.requete('POST /api/auth/login/', 'POST', '/api/auth/login/', {
+            'email': self.email, 'password': MOT_DE_PASSE,
+        })
+        if not donnees or 'access' not in donnees:
+            return
+        self.client.jeton = donnees['access']
+        self.attendre()
+        reservation = reservation_aleatoire()
+        self.client.requete('GET /api/rdv/creneaux-pleins/', 'GET',
+                            f"/api/rdv/creneaux-pleins/?date={reservation['date_rdv']}")
+        self.attendre()
+        statut, rdv = self.client.requete('POST /api/rendez-vous/', 'POST', '/api/rendez-vous/', reservation,
+                                          attendus=(201, 400))
+        if statut == 201 and rdv:
+            self.partage.ajouter(rdv)
+        self.attendre()
+        self.client.requete('GET /api/mes-rendez-vous/', 'GET', '/api/mes-rendez-vous/')
+
+    def parcours_portique(self):
+        """Scan au portique : lecture du rendez-vous puis validation"""
+        rdv = self.partage.tirer()
+        if rdv is None:
+            return self.parcours_public()
+        self.client.jeton = None
+        statut, donnees = self.client.requete('GET /api/rendez-vous/<id>/', 'GET', f"/api/rendez-vous/{rdv['id']}/")
+        if statut == 200 and donnees and donnees['statut'] == 'en_attente':
+            self.attendre()
+            self.client.requete('POST /api/rendez-vous/<id>/valider/', 'POST',
+                                f"/api/rendez-vous/{rdv['id']}/valider/", attendus=(200, 400))
+
+    def parcours_public(self):
+        """Recherches publiques par plaque, CIN et date"""
+        rdv = self.partage.tirer() or reservation_aleatoire()
+        self.client.jeton = None
+        self.client.requete('GET /api/public/rendez-vous/?plaque=', 'GET',
+                            f"/api/public/rendez-vous/?plaque={rdv['plaque_camion'][:4]}")
+        self.attendre()
+        self.client.requete('GET /api/rendez-vous/par_cin/', 'GET', f"/api/rendez-vous/par_cin/?cin={rdv['cin']}")
+        self.attendre()
+        self.client.requete('GET /api/rendez-vous/par_date/', 'GET', f"/api/rendez-vous/par_date/?date={rdv['date_rdv']}")
+
+
+class RendezVousPartages:
+    """Rendez-vous créés pendant le test, réutilisés par les scans et recherches"""
+
+    def __init__(self):
+        self.verrou = threading.Lock()
+        self.rdvs = []
+
+    def ajouter(self, rdv):
+        with self.verrou:
+            self.rdvs.append(rdv)
+
+    def tirer(self):
+        with self.verrou:
+            return random.choice(self.rdvs) if self.rdvs else None
+
+
+def lire_melange(valeur):
+    melange = {}
+    for element in valeur.split(','):
+        nom, _, poids = element.partition('=')
+        if nom not in ('chauffeur', 'portique', 'public'):
+            raise CommandError(f"Parcours inconnu : {nom}")
+        melange[nom] = float(poids or 1)
+    return melange
+
+
+class Command(BaseCommand):
+    help = ("Test de charge de bout en bout : serveur Django réel (ou --url) et portail interne factice, "
+            "parcours chauffeur/portique/public, rapport par endpoint (débit, p50/p95/p99, erreurs) en JSON.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--url', help="Serveur déjà lancé (sinon serveur local sur une base jetable)")
+        parser.add_argument('--utilisateurs', type=int, default=20, help="Utilisateurs virtuels simultanés")
+        parser.add_argument('--duree', type=float, default=30, help="Durée du test en secondes")
+        parser.add_argument('--melange', type=lire_melange, default='chauffeur=6,portique=2,public=2',
+                            help="Poids des parcours, ex. chauffeur=6,portique=2,public=2")
+        parser.add_argument('--pause', type=float, default=0.0, help="Temps de réflexion moyen (s) entre requêtes")
+        parser.add_argument('--etiquette', default='', help="Nom de la version testée, repris dans le JSON")
+        parser.add_argument('--sortie', help="Fichier JSON de résultats (loadtest-<date>.json par défaut)")
+
+    def handle(self, *args, **options):
+        stub = demarrer(ThreadingHTTPServer(('127.0.0.1', 0), PortailInterneStub))
+        url_stub = f"http://127.0.0.1:{stub.server_address[1]}/api/qr-codes/receive/"
+        if options['url']:
+            cible = urlsplit(options['url'])
+            self.stdout.write(f"Portail interne factice : {url_stub} (à configurer sur le serveur testé)")
+            resultat = self.charger(cible.hostname, cible.port or 80, options)
+        else:
+            portail, media = settings.PORTAIL_INTERNE_URL, settings.MEDIA_ROOT
+            # QR codes des rendez-vous de test : répertoire supprimé à la fin
+            with tempfile.TemporaryDirectory(prefix='loadtest_media_') as media_test:
+                settings.PORTAIL_INTERNE_URL, settings.MEDIA_ROOT = url_stub, media_test
+                try:
+                    with base_de_test():
+                        serveur = ThreadedWSGIServer(('127.0.0.1', 0), GestionnaireSilencieux)
+                        serveur.set_app(get_wsgi_application())
+                        demarrer(serveur)
+                        resultat = self.charger('127.0.0.1', serveur.server_address[1], options)
+                        serveur.shutdown()
+                finally:
+                    settings.PORTAIL_INTERNE_URL, settings.MEDIA_ROOT = portail, media
+        stub.shutdown()
+        resultat['portail_interne_recus'] = PortailInterneStub.recus
+        self.ecrire(resultat, options['sortie'])
+
+    def charger(self, hote, port, options):
+        statistiques = Statistiques()
+        partage = RendezVousPartages()
+        echeance = time.monotonic() + options['duree']
+        utilisateurs = [
+            UtilisateurVirtuel(ClientHTTP(hote, port, statistiques), partage, options['melange'], options['pause'])
+            for _ in range(options['utilisateurs'])
+        ]
+        self.stdout.write(f"{len(utilisateurs)} utilisateurs virtuels pendant {options['duree']}s sur {hote}:{port}...")
+        debut = time.perf_counter()
+        threads = [threading.Thread(target=u.executer, args=(echeance,)) for u in utilisateurs]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        duree = time.perf_counter() - debut
+
+        total, endpoints = statistiques.resume(duree)
+        return {
+            'etiquette': options['etiquette'],
+            'date': datetime.now().isoformat(timespec='seconds'),
+            'duree_secondes': round(duree, 2),
+            'utilisateurs': options['utilisateurs'],
+            'melange': options['melange'],
+            'total': total,
+            'endpoints': endpoints,
+        }
+
+    def ecrire(self, resultat, sortie):
+        self.stdout.write(f"{'endpoint':<42} {'req':>6} {'req/s':>8} {'err%':>6} {'p50':>8} {'p95':>8} {'p99':>8}")
+        lignes = list(resultat['endpoints'].items()) + [('TOTAL', resultat['total'])]
+        for etiquette, e in lignes:
+            self.stdout.write(f"{etiquette:<42} {e['requetes']:>6} {e['requetes_par_seconde']:>8} "
+                              f"{e['taux_erreur'] * 100:>6.2f} {e['p50_ms']:>8} {e['p95_ms']:>8} {e['p99_ms']:>8}")
+        sortie = sortie or f"loadtest-{datetime.now():%Y%m%d-%H%M%S}.json"
+        with open(sortie, 'w', encoding='utf-8') as f:
+            json.dump(resultat, f, ensure_ascii=False, indent=2)
+        self.stdout.write(self.style.SUCCESS(f"Résultats enregistrés dans {sortie}"))
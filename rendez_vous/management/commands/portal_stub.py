@@ -0,0 +1,106 @@
+import json
+import random
+import threading
+from datetime import date, time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+from django.core.management.base import BaseCommand
+
+from rendez_vous.models import RendezVous
+from rendez_vous.reconciliation import resumer
+
+
+class PortailInterneFactice(BaseHTTPRequestHandler):
+    """
+    Portail interne en mémoire : reçoit les rendez-vous (POST .../qr-codes/receive/,
+    en perdant sans le dire la part `perte` des envois) et sert
+    GET /api/reconciliation/ sur ce qu'il a reçu.
+    """
+    rendez_vous = {}
+    verrou = threading.Lock()
+    perte = 0.0
+    jeton = ''
+
+    def repondre(self, statut, donnees=None):
+        corps = json.dumps(donnees).encode() if donnees is not None else b''
+        self.send_response(statut)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(corps)))
+        self.end_headers()
+        self.wfile.write(corps)
+
+    def do_POST(self):
+        payload = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))) or b'{}')
+        if not urlsplit(self.path).path.endswith('/qr-codes/receive/'):
+            return self.repondre(404)
+        if random.random() >= self.perte:
+            with self.verrou:
+                self.rendez_vous[payload['code_unique']] = payload
+        self.repondre(201, {'status': 'ok'})
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        if url.path != '/api/reconciliation/':
+            return self.repondre(404)
+        if self.jeton and self.headers.get('Authorization') != f'Bearer {self.jeton}':
+            return self.repondre(403)
+        params = {cle: valeurs[0] for cle, valeurs in parse_qs(url.query).items()}
+        with self.verrou:
+            lignes = list(self.rendez_vous.values())
+        if 'date' in params:
+            lignes = [l for l in lignes if l['date_rdv'] == params['date']]
+            if 'heure' in params:
+                lignes = [l for l in lignes if l['heure_rdv'] == params['heure']]
+            self.repondre(200, resumer(lignes, date.fromisoformat(params['date']),
+                                       time.fromisoformat(params['heure']) if 'heure' in params else None))
+        else:
+            lignes = [l for l in lignes if params['du'] <= l['date_rdv'] <= params['au']]
+            self.repondre(200, resumer(lignes))
+
+    def log_message(self, format, *args):
+        pass
+
+
+class Command(BaseCommand):
+    help = ("Portail interne factice pour tester la réconciliation de bout en bout : reçoit les "
+            "rendez-vous envoyés (PORTAIL_INTERNE_URL) et sert /api/reconciliation/ sur ses données.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--port', type=int, default=8001)
+        parser.add_argument('--jeton', default='', help="Jeton Bearer exigé (défaut : aucun)")
+        parser.add_argument('--perte', type=float, default=0.0,
+                            help="Part des envois perdus sans erreur (0 à 1)")
+        parser.add_argument('--charger', action='store_true',
+                            help="Part de la base locale comme si tout avait été envoyé (avec --perte et --alterer)")
+        parser.add_argument('--alterer', type=float, default=0.0,
+                            help="Avec --charger, part des rendez-vous gardés dans un ancien statut")
+
+    def handle(self, *args, **options):
+        PortailInterneFactice.perte = options['perte']
+        PortailInterneFactice.jeton = options['jeton']
+        if options['charger']:
+            self.charger(options['perte'], options['alterer'])
+        serveur = ThreadingHTTPServer(('127.0.0.1', options['port']), PortailInterneFactice)
+        self.stdout.write(f"Portail interne factice sur http://127.0.0.1:{options['port']}/ "
+                          f"({len(PortailInterneFactice.rendez_vous)} rendez-vous) ; Ctrl+C pour arrêter")
+        try:
+            serveur.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            serveur.server_close()
+
+    def charger(self, perte, alterer):
+        pertes = alterations = 0
+        for rdv in RendezVous.objects.order_by().iterator(chunk_size=5000):
+            if random.random() < perte:
+                pertes += 1
+                continue
+            payload = rdv.donnees_portail()
+            if random.random() < alterer:
+                # Changement de statut jamais transmis
+                payload['statut'] = 'en_attente' if rdv.statut != 'en_attente' else 'valide'
+                alterations += 1
+            PortailInterneFactice.rendez_vous[payload['code_unique']] = payload
+        self.stdout.write(f"Chargé depuis la base : {pertes} rendez-vous perdus, {alterations} périmés.")
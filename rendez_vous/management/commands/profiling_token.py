@@ -0,0 +1,15 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from rendez_vous.profilage import creer_jeton
+
+
+class Command(BaseCommand):
+    help = "Génère un jeton signé pour profiler des requêtes via l'en-tête X-Profilage."
+
+    def handle(self, *args, **options):
+        if not settings.PROFILAGE_ACTIF:
+            self.stderr.write(self.style.WARNING("PROFILAGE_ACTIF est faux : le jeton sera ignoré."))
+        self.stdout.write(creer_jeton())
+        self.stderr.write(f"Valable {settings.PROFILAGE_JETON_DUREE} s. Exemple :\n"
+                          f"  curl -H 'X-Profilage: <jeton>' https://.../api/rendez-vous/prochains/")
@@ -0,0 +1,18 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from rendez_vous.synchro import purger
+
+
+class Command(BaseCommand):
+    help = ("Supprime les événements de synchronisation plus anciens que la période de conservation "
+            "(à planifier chaque jour). Un consommateur en retard au-delà reçoit 410 et se resynchronise.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--jours', type=int, default=settings.SYNCHRO_RETENTION_JOURS,
+                            help="Jours conservés (défaut : SYNCHRO_RETENTION_JOURS)")
+
+    def handle(self, *args, **options):
+        if options['jours'] < 1:
+            raise CommandError("--jours doit être au moins 1.")
+        self.stdout.write(self.style.SUCCESS(f"{purger(options['jours'])} événements supprimés."))
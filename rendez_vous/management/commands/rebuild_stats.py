@@ -0,0 +1,30 @@
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+
+from rendez_vous.statistiques import ecarts, reconstruire
+
+
+class Command(BaseCommand):
+    help = ("Recalcule les compteurs StatistiqueRendezVous depuis les rendez-vous "
+            "(après un chargement en masse ou pour corriger une dérive).")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--du', type=date.fromisoformat, help="Première date (YYYY-MM-DD) ; défaut : tout")
+        parser.add_argument('--au', type=date.fromisoformat, help="Dernière date (YYYY-MM-DD) ; défaut : tout")
+        parser.add_argument('--verifier', action='store_true',
+                            help="Liste les compteurs faux sans rien écrire (échoue s'il y en a)")
+
+    def handle(self, *args, **options):
+        du, au = options['du'], options['au']
+        if du and au and du > au:
+            raise CommandError("--du doit précéder --au.")
+        if options['verifier']:
+            differences = ecarts(du, au)
+            for cle, attendu, enregistre in differences[:50]:
+                self.stdout.write(f"{' '.join(map(str, cle))} : {enregistre} au lieu de {attendu}")
+            if differences:
+                raise CommandError(f"{len(differences)} compteur(s) en écart.")
+            self.stdout.write(self.style.SUCCESS("Compteurs à jour."))
+            return
+        self.stdout.write(self.style.SUCCESS(f"{reconstruire(du, au)} compteurs recalculés."))
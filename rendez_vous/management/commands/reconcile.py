@@ -0,0 +1,92 @@
+from datetime import date, timedelta
+from urllib.parse import urljoin
+
+import httpx
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from rendez_vous.models import RendezVous
+from rendez_vous.portail_interne import planifier_envoi
+from rendez_vous.reconciliation import comparer, resume_local
+
+
+class Command(BaseCommand):
+    help = ("Compare les rendez-vous avec ceux du portail interne par empreintes hiérarchiques "
+            "(jour → créneau → rendez-vous) et, avec --reparer, renvoie ceux qui manquent ou ont changé.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--url', help="Endpoint de réconciliation du portail interne "
+                                          "(défaut : /api/reconciliation/ sur l'hôte de PORTAIL_INTERNE_URL)")
+        parser.add_argument('--jeton', default=settings.SYNCHRO_JETON, help="Jeton Bearer du portail interne")
+        parser.add_argument('--du', type=date.fromisoformat, help="Première date (défaut : il y a 30 jours)")
+        parser.add_argument('--au', type=date.fromisoformat, help="Dernière date (défaut : dans 30 jours)")
+        parser.add_argument('--reparer', action='store_true',
+                            help="Renvoie au portail les rendez-vous manquants ou périmés")
+
+    def handle(self, *args, **options):
+        url = options['url'] or (settings.PORTAIL_INTERNE_URL and urljoin(settings.PORTAIL_INTERNE_URL,
+                                                                          '/api/reconciliation/'))
+        if not url:
+            raise CommandError("Indiquer --url (PORTAIL_INTERNE_URL est vide).")
+        aujourd_hui = timezone.localdate()
+        du = options['du'] or aujourd_hui - timedelta(days=30)
+        au = options['au'] or aujourd_hui + timedelta(days=30)
+        if du > au:
+            raise CommandError("--du doit précéder --au.")
+
+        entetes = {'Authorization': f"Bearer {options['jeton']}"} if options['jeton'] else {}
+        with httpx.Client(timeout=settings.PORTAIL_INTERNE_TIMEOUT, headers=entetes) as client:
+            def distant(du, au, date_rdv, heure_rdv):
+                if date_rdv is None:
+                    params = {'du': du.isoformat(), 'au': au.isoformat()}
+                else:
+                    params = {'date': date_rdv.isoformat()}
+                    if heure_rdv is not None:
+                        params['heure'] = heure_rdv.strftime('%H:%M')
+                response = client.get(url, params=params)
+                if response.status_code != 200:
+                    raise CommandError(f"Portail interne : {response.status_code} {response.text[:200]}")
+                return response.json()
+
+            ecarts = {'manquants': [], 'perimes': [], 'en_trop': []}
+            echanges = {'jours': 0, 'creneaux': 0, 'lignes': 0}
+            debut = du
+            while debut <= au:
+                # Périodes acceptées par l'endpoint (RECONCILIATION_JOURS_MAX)
+                fin = min(au, debut + timedelta(days=settings.RECONCILIATION_JOURS_MAX - 1))
+                try:
+                    ecarts_periode, echanges_periode = comparer(resume_local, distant, debut, fin)
+                except httpx.HTTPError as e:
+                    raise CommandError(f"Portail interne injoignable : {e!r}")
+                for cle in ecarts:
+                    ecarts[cle] += ecarts_periode[cle]
+                for cle in echanges:
+                    echanges[cle] += echanges_periode[cle]
+                debut = fin + timedelta(days=1)
+
+        total = RendezVous.objects.filter(date_rdv__range=(du, au)).count()
+        self.stdout.write(
+            f"{du} → {au} : {total} rendez-vous ; échangé {echanges['jours']} jours, "
+            f"{echanges['creneaux']} créneaux, {echanges['lignes']} empreintes de rendez-vous"
+        )
+        for cle, libelle in (('manquants', 'absents du portail'), ('perimes', 'différents'),
+                             ('en_trop', 'inconnus ici (supprimés ?)')):
+            self.stdout.write(f"  {len(ecarts[cle])} {libelle}")
+            for code in ecarts[cle][:20]:
+                self.stdout.write(f"    {code}")
+
+        a_envoyer = ecarts['manquants'] + ecarts['perimes']
+        if options['reparer'] and a_envoyer:
+            self.reparer(a_envoyer)
+        elif a_envoyer:
+            self.stdout.write("Relancer avec --reparer pour les renvoyer au portail interne.")
+
+    def reparer(self, codes):
+        envois = []
+        for i in range(0, len(codes), 1000):
+            for rdv in RendezVous.objects.filter(code_unique__in=codes[i:i + 1000]):
+                envois.append(planifier_envoi(rdv.donnees_portail()))
+        reussis = sum(1 for envoi in envois if envoi is not None and envoi.result())
+        style = self.style.SUCCESS if reussis == len(codes) else self.style.WARNING
+        self.stdout.write(style(f"{reussis}/{len(codes)} rendez-vous renvoyés au portail interne."))
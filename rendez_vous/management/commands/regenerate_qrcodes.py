@@ -1,26 +1,32 @@
 from django.core.management.base import BaseCommand
+
+from rendez_vous.fichiers import REPERTOIRE_QR, attendre_suppressions, fichiers_qr
 from rendez_vous.models import RendezVous
-import os
-from django.conf import settings
+
 
 class Command(BaseCommand):
     help = "Régénère les QR codes manquants pour tous les rendez-vous."
 
     def handle(self, *args, **options):
-        count_regenerated = 0
-        for rdv in RendezVous.objects.all():
-            regenerate = False
-            if not rdv.qr_code:
-                regenerate = True
-            else:
-                # Vérifier si le fichier existe physiquement
-                qr_path = os.path.join(settings.MEDIA_ROOT, rdv.qr_code.name)
-                if not os.path.isfile(qr_path):
-                    regenerate = True
-            if regenerate:
-                self.stdout.write(f"Régénération du QR code pour le rendez-vous {rdv.id} ({rdv.code_unique})...")
-                rdv.qr_code.delete(save=False)  # Supprimer l'ancien chemin si besoin
-                rdv.generate_qr_code()
+        # Un seul parcours du répertoire plutôt qu'un stat par rendez-vous
+        existants = {nom for nom, _ in fichiers_qr()}
+        count_regenerated = count_relies = 0
+        for rdv in RendezVous.objects.order_by('pk').iterator(chunk_size=2000):
+            if rdv.qr_code and rdv.qr_code.name in existants:
+                continue
+            attendu = f'{REPERTOIRE_QR}/qr_code_{rdv.code_unique}.png'
+            if attendu in existants:
+                # Le fichier est là mais n'est plus référencé : le régénérer sous un
+                # autre nom (suffixe du storage) laisserait celui-ci orphelin
+                rdv.qr_code.name = attendu
                 rdv.save(update_fields=['qr_code'])
-                count_regenerated += 1
-        self.stdout.write(self.style.SUCCESS(f"QR codes régénérés pour {count_regenerated} rendez-vous.")) 
\ No newline at end of file
+                count_relies += 1
+                continue
+            self.stdout.write(f"Régénération du QR code pour le rendez-vous {rdv.id} ({rdv.code_unique})...")
+            rdv.generate_qr_code()
+            rdv.save(update_fields=['qr_code'])
+            count_regenerated += 1
+        attendre_suppressions()
+        self.stdout.write(self.style.SUCCESS(
+            f"QR codes régénérés pour {count_regenerated} rendez-vous, {count_relies} rattachés à leur fichier existant."
+        ))
@@ -0,0 +1,259 @@
+import random
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime, time as heure, timedelta
+from itertools import accumulate
+
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.utils import timezone
+
+from rendez_vous.models import Profil, RendezVous
+from rendez_vous.statistiques import reconstruire
+
+# Préfixes de CIN les plus courants (une ou deux lettres, selon la province)
+PREFIXES_CIN = ['A', 'B', 'BE', 'BH', 'BJ', 'BK', 'C', 'CD', 'D', 'E', 'EE', 'F', 'G', 'H', 'HA',
+                'I', 'J', 'JA', 'JB', 'K', 'L', 'M', 'N', 'P', 'Q', 'R', 'S', 'T', 'U', 'W', 'X', 'Y', 'Z']
+LETTRES_PLAQUE = ['A', 'B', 'D', 'H', 'W', 'WW']
+# Codes propriétaires BIC (3 lettres) + catégorie U
+ARMATEURS = ['MSC', 'CMA', 'MAE', 'HLX', 'EGH', 'ONE', 'ZIM', 'OOL', 'CSN', 'TGH', 'COS', 'HAS']
+ARMATEURS_POIDS = [22, 18, 16, 8, 7, 6, 5, 5, 4, 4, 3, 2]
+
+# Créneaux de 2h proposés par le portail, plus chargés le matin
+CRENEAUX = [heure(h) for h in range(6, 22, 2)]
+CRENEAUX_POIDS = [14, 20, 18, 14, 12, 10, 8, 4]
+# Lundi → dimanche
+JOURS_POIDS = [1.0, 1.0, 1.0, 1.0, 0.9, 0.5, 0.15]
+
+STATUTS_PASSES = (['termine', 'annule', 'valide', 'en_attente'], [82, 10, 5, 3])
+STATUTS_FUTURS = (['en_attente', 'valide', 'annule'], [70, 22, 8])
+# (operation, sens_trafic) : un export entre au port, un import entre ou sort
+MOUVEMENTS = [('import', 'entree'), ('import', 'sortie'), ('export', 'entree')]
+MOUVEMENTS_POIDS = [27, 28, 45]
+
+COLONNES = ['cin', 'plaque_camion', 'numero_conteneur', 'sens_trafic', 'type_conteneur', 'operation',
+            'date_rdv', 'heure_rdv', 'user', 'code_unique', 'qr_code', 'date_creation',
+            'date_modification', 'statut']
+
+# Valeurs ISO 6346 des lettres : de 10 à 38 en sautant les multiples de 11
+VALEURS_ISO6346 = {}
+_valeur = 10
+for _lettre in 'ABCDEFGHIJKLMNOPQRSTUVWXYZ':
+    if _valeur % 11 == 0:
+        _valeur += 1
+    VALEURS_ISO6346[_lettre] = _valeur
+    _valeur += 1
+
+
+def chiffre_controle_iso6346(code):
+    """Chiffre de contrôle des 10 premiers caractères d'un numéro de conteneur"""
+    total = sum((VALEURS_ISO6346[c] if c.isalpha() else int(c)) << i for i, c in enumerate(code))
+    return total % 11 % 10
+
+
+class Generateur:
+    """
+    Tirages réalistes, colonne par colonne (random.choices avec k=taille du lot).
+    Chauffeurs, camions et conteneurs sont tirés dans des flottes qui reviennent
+    d'un rendez-vous à l'autre, comme en exploitation.
+    """
+
+    def __init__(self, graine, jours_passes, jours_futurs, flotte):
+        self.rng = r = random.Random(graine)
+        # code_unique au format UUIDv7 (horodatage puis compteur) : l'index unique
+        # se remplit en fin d'arbre au lieu de pages aléatoires
+        self.horodatage = int(time.time() * 1000)
+        self.compteur = r.getrandbits(40)
+        aujourd_hui = date.today()
+        self.jours = [aujourd_hui + timedelta(days=d) for d in range(-jours_passes, jours_futurs + 1)]
+        self.cumul_jours = list(accumulate(JOURS_POIDS[j.weekday()] for j in self.jours))
+        self.premier_futur = jours_passes
+        self.cumul_creneaux = list(accumulate(CRENEAUX_POIDS))
+
+        self.cins = [f"{r.choice(PREFIXES_CIN)}{r.randrange(1000000):06d}" for _ in range(flotte)]
+        self.plaques = [f"{r.randrange(100, 10000)}-{r.choice(LETTRES_PLAQUE)}-{r.randrange(1, 90)}"
+                        for _ in range(flotte)]
+        proprietaires = r.choices(ARMATEURS, weights=ARMATEURS_POIDS, k=flotte * 3)
+        self.conteneurs = []
+        for proprietaire in proprietaires:
+            code = f"{proprietaire}U{r.randrange(1000000):06d}"
+            self.conteneurs.append(code + str(chiffre_controle_iso6346(code)))
+
+        # Valeurs converties une fois pour toutes au format de la base
+        ops = connection.ops
+        self.jours_db = [ops.adapt_datefield_value(j) for j in self.jours]
+        self.creneaux_db = [ops.adapt_timefield_value(c) for c in CRENEAUX]
+        # Réservation faite 0 à 13 jours avant le rendez-vous, à la demi-heure près
+        fuseau = timezone.get_current_timezone()
+        self.creations_db = [
+            [ops.adapt_datetimefield_value(timezone.make_aware(
+                datetime.combine(j - timedelta(days=k % 14), heure(7 + k % 12, 30 * (k % 2))), fuseau))
+             for k in range(0, 28, 3)]
+            for j in self.jours
+        ]
+
+    def lignes(self, user_ids, cumul_users, k):
+        """k lignes prêtes pour executemany, dans l'ordre de COLONNES (générateur)"""
+        r = self.rng
+        jours = r.choices(range(len(self.jours)), cum_weights=self.cumul_jours, k=k)
+        statuts_passes = r.choices(STATUTS_PASSES[0], weights=STATUTS_PASSES[1], k=k)
+        statuts_futurs = r.choices(STATUTS_FUTURS[0], weights=STATUTS_FUTURS[1], k=k)
+        mouvements = r.choices(MOUVEMENTS, weights=MOUVEMENTS_POIDS, k=k)
+        for i, j, cin, plaque, conteneur, mouvement, type_conteneur, creneau, user_id, creation in zip(
+            range(k), jours,
+            r.choices(self.cins, k=k), r.choices(self.plaques, k=k), r.choices(self.conteneurs, k=k),
+            mouvements, r.choices(['plein', 'vide'], weights=[7, 3], k=k),
+            r.choices(self.creneaux_db, cum_weights=self.cumul_creneaux, k=k),
+            r.choices(user_ids, cum_weights=cumul_users, k=k), r.choices(range(10), k=k),
+        ):
+            creation = self.creations_db[j][creation]
+            self.compteur += 1
+            h = f"{self.horodatage:012x}7{self.compteur:019x}"
+            yield (
+                cin, plaque, conteneur, mouvement[1], type_conteneur, mouvement[0],
+                self.jours_db[j], creneau, user_id, f"{h[:8]}-{h[8:12]}-{h[12:16]}-{h[16:20]}-{h[20:]}",
+                '', creation, creation,
+                statuts_futurs[i] if j >= self.premier_futur else statuts_passes[i],
+            )
+
+
+class Command(BaseCommand):
+    help = ("Génère des rendez-vous, utilisateurs et profils synthétiques (CIN, plaques et numéros "
+            "ISO 6346 valides) par lots, sans QR code ni envoi au portail interne par défaut.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rendez-vous', type=int, default=100000, dest='rendez_vous')
+        parser.add_argument('--utilisateurs', type=int, help="Comptes transporteurs (défaut : 1 pour 50 rendez-vous)")
+        parser.add_argument('--jours-passes', type=int, default=365)
+        parser.add_argument('--jours-futurs', type=int, default=30)
+        parser.add_argument('--taille-lot', type=int, default=20000, help="Lignes par transaction")
+        parser.add_argument('--garder-index', action='store_false', dest='reconstruire_index',
+                            help="SQLite : ne pas retirer les index secondaires pendant l'insertion")
+        parser.add_argument('--cache-sqlite-mo', type=int, default=256, help="Cache de pages SQLite pendant l'insertion")
+        parser.add_argument('--graine', type=int, help="Graine aléatoire, pour des jeux reproductibles")
+        parser.add_argument('--avec-qr', action='store_true', help="Génère aussi les PNG (lent)")
+
+    def handle(self, *args, **options):
+        n = options['rendez_vous']
+        nb_utilisateurs = options['utilisateurs'] or max(1, n // 50)
+        if n < 0 or nb_utilisateurs < 1:
+            raise CommandError("Nombres de rendez-vous et d'utilisateurs invalides.")
+        generateur = Generateur(options['graine'], options['jours_passes'], options['jours_futurs'],
+                                flotte=max(100, nb_utilisateurs * 3))
+
+        debut = time.perf_counter()
+        user_ids = self.creer_utilisateurs(nb_utilisateurs, generateur.rng)
+        duree = time.perf_counter() - debut
+        self.stdout.write(f"{len(user_ids)} utilisateurs et profils en {duree:.2f}s")
+
+        # Quelques gros transporteurs concentrent l'essentiel des réservations
+        cumul_users = list(accumulate(1 / (rang + 1) for rang in range(len(user_ids))))
+        insertion = self.requete_insertion()
+        tailles = [min(options['taille_lot'], n - depart) for depart in range(0, n, options['taille_lot'])]
+
+        def preparer(taille):
+            return list(generateur.lignes(user_ids, cumul_users, taille))
+
+        debut = time.perf_counter()
+        crees = 0
+        index = self.retirer_index_secondaires() if options['reconstruire_index'] else []
+        try:
+            # Le lot suivant est généré pendant l'insertion du courant (sqlite3 et
+            # psycopg relâchent le GIL pendant l'exécution)
+            with ThreadPoolExecutor(max_workers=1) as generation, connection.cursor() as cursor:
+                if connection.vendor == 'sqlite':
+                    cursor.execute(f'PRAGMA cache_size = -{options["cache_sqlite_mo"] * 1024}')
+                suivant = generation.submit(preparer, tailles[0]) if tailles else None
+                for i in range(len(tailles)):
+                    lignes = suivant.result()
+                    if i + 1 < len(tailles):
+                        suivant = generation.submit(preparer, tailles[i + 1])
+                    with transaction.atomic():
+                        cursor.executemany(insertion, lignes)
+                    crees += len(lignes)
+                    self.stdout.write(f"  {crees}/{n}", ending='\r')
+        finally:
+            self.recreer_index(index)
+        with connection.cursor() as cursor:
+            # Statistiques à jour pour le planificateur après un chargement massif
+            cursor.execute(f'ANALYZE {connection.ops.quote_name(RendezVous._meta.db_table)}')
+        duree = time.perf_counter() - debut
+        self.stdout.write(self.style.SUCCESS(
+            f"{n} rendez-vous en {duree:.2f}s ({n / duree if duree else 0:,.0f} lignes/s)"))
+        # L'insertion directe ne passe pas par les signaux
+        debut = time.perf_counter()
+        self.stdout.write(f"{reconstruire()} compteurs de statistiques en {time.perf_counter() - debut:.2f}s")
+
+        if options['avec_qr']:
+            self.generer_qr_codes()
+
+    def requete_insertion(self):
+        """INSERT multi-lignes sur les colonnes du modèle (executemany, sans instancier de modèles)"""
+        champs = [RendezVous._meta.get_field(nom) for nom in COLONNES]
+        qn = connection.ops.quote_name
+        return (f"INSERT INTO {qn(RendezVous._meta.db_table)} ({', '.join(qn(c.column) for c in champs)}) "
+                f"VALUES ({', '.join(['%s'] * len(champs))})")
+
+    def retirer_index_secondaires(self):
+        """
+        SQLite : supprime les index non uniques de la table pendant le chargement ;
+        les reconstruire d'un coup à la fin coûte moins qu'une mise à jour par ligne.
+        """
+        if connection.vendor != 'sqlite':
+            return []
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT name, sql FROM sqlite_master WHERE type = 'index' AND tbl_name = %s "
+                "AND sql IS NOT NULL AND sql NOT LIKE 'CREATE UNIQUE%%'",
+                [RendezVous._meta.db_table],
+            )
+            index = cursor.fetchall()
+            for nom, _ in index:
+                cursor.execute(f'DROP INDEX {connection.ops.quote_name(nom)}')
+        return index
+
+    def recreer_index(self, index):
+        with connection.cursor() as cursor:
+            for _, sql in index:
+                cursor.execute(sql)
+
+    def creer_utilisateurs(self, nombre, rng):
+        # Même empreinte pour tous : un seul PBKDF2 au lieu d'un par compte
+        mot_de_passe = make_password('Seed-2024')
+        serie = uuid.uuid4().hex[:6]
+        ids = []
+        for depart in range(0, nombre, 5000):
+            with transaction.atomic():
+                users = User.objects.bulk_create([
+                    User(
+                        username=f"seed-{serie}-{i}@transport.ma", email=f"seed-{serie}-{i}@transport.ma",
+                        password=mot_de_passe, first_name='Transporteur', last_name=f"{serie.upper()}-{i}",
+                    )
+                    for i in range(depart, min(depart + 5000, nombre))
+                ])
+                if users and users[0].pk is None:
+                    # Base sans RETURNING sur insertion multiple : relire les ids
+                    users = list(User.objects.filter(username__startswith=f"seed-{serie}-").order_by('pk')[depart:])
+                Profil.objects.bulk_create([
+                    Profil(user_id=u.pk, telephone=f"06{rng.randrange(100000000):08d}") for u in users
+                ])
+            ids += [u.pk for u in users]
+        return ids
+
+    def generer_qr_codes(self):
+        portail = settings.PORTAIL_INTERNE_URL
+        settings.PORTAIL_INTERNE_URL = ''  # pas d'envoi au portail pour des données de test
+        try:
+            debut = time.perf_counter()
+            total = 0
+            for rdv in RendezVous.objects.filter(qr_code='').iterator(chunk_size=2000):
+                rdv.generate_qr_code()
+                RendezVous.objects.filter(pk=rdv.pk).update(qr_code=rdv.qr_code.name)
+                total += 1
+            self.stdout.write(f"{total} QR codes en {time.perf_counter() - debut:.1f}s")
+        finally:
+            settings.PORTAIL_INTERNE_URL = portail
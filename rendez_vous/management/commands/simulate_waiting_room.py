@@ -0,0 +1,241 @@
+import asyncio
+import http.client
+import json
+import tempfile
+import threading
+import time
+from collections import Counter
+from http.server import ThreadingHTTPServer
+
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.core.servers.basehttp import ThreadedWSGIServer
+from django.core.wsgi import get_wsgi_application
+from django.test.utils import override_settings
+
+from rendez_vous import portail_interne, salle_attente
+from rendez_vous.authentication import generer_tokens
+from rendez_vous.management.commands._bench import base_de_test, formater_ms, percentiles
+from rendez_vous.management.commands.loadtest import (
+    GestionnaireSilencieux, PortailInterneStub, demarrer, reservation_aleatoire,
+)
+from rendez_vous.models import RendezVous
+
+
+class Chauffeur:
+    """
+    Utilisateur virtuel impatient : réserve en boucle ; sans réponse après
+    `delai` secondes il abandonne et renvoie le formulaire (nouvelle requête,
+    celle en cours continue côté serveur). Mis en file, il attend son tour.
+    """
+
+    def __init__(self, hote, port, jeton, delai, resultats):
+        self.hote, self.port, self.jeton = hote, port, jeton
+        self.delai, self.resultats = delai, resultats
+        self.connexion = None
+
+    def requete(self, methode, chemin, corps=None, entetes=None):
+        if self.connexion is None:
+            self.connexion = http.client.HTTPConnection(self.hote, self.port, timeout=self.delai)
+        try:
+            self.connexion.request(methode, chemin, body=json.dumps(corps) if corps is not None else None, headers={
+                'Content-Type': 'application/json', 'Authorization': f'Bearer {self.jeton}', **(entetes or {}),
+            })
+            reponse = self.connexion.getresponse()
+            contenu = reponse.read()
+        except (OSError, http.client.HTTPException):
+            self.connexion.close()
+            self.connexion = None
+            return None, None
+        return reponse, json.loads(contenu) if contenu else None
+
+    def reserver(self, echeance):
+        """Une réservation, avec abandons et file d'attente ; True si confirmée au client"""
+        reservation = reservation_aleatoire()
+        entetes = {}
+        while time.monotonic() < echeance:
+            reponse, donnees = self.requete('POST', '/api/rendez-vous/', reservation, entetes)
+            entetes = {}
+            if reponse is None:
+                self.resultats.compter('abandons')
+                continue
+            if reponse.status == 201:
+                return True
+            if reponse.status != 503:
+                self.resultats.compter(f'statut_{reponse.status}')
+                return False
+            if not donnees or 'file_attente' not in donnees:
+                self.resultats.compter('delestees')
+                time.sleep(min(float(reponse.getheader('Retry-After', 1)), 1.0))
+                continue
+            self.resultats.compter('mises_en_file')
+            passage = self.attendre_son_tour(donnees['file_attente'], echeance)
+            if passage:
+                entetes = {salle_attente.EN_TETE_PASSAGE: passage}
+        return False
+
+    def attendre_son_tour(self, file_attente, echeance):
+        """Consulte la file au rythme indiqué par le serveur ; jeton de passage ou None"""
+        jeton, donnees = file_attente['jeton'], file_attente
+        while time.monotonic() < echeance:
+            time.sleep(donnees['consulter_dans'])
+            self.resultats.compter('consultations')
+            reponse, resultat = self.requete('GET', f'/api/file-attente/?jeton={jeton}')
+            if reponse is None:
+                continue
+            if reponse.status != 200:
+                self.resultats.compter('tours_perdus')
+                return None
+            if resultat['admis']:
+                return resultat['passage']
+            donnees = resultat
+        return None
+
+    def executer(self, echeance):
+        while time.monotonic() < echeance:
+            debut = time.perf_counter()
+            if self.reserver(echeance):
+                self.resultats.confirmer(time.perf_counter() - debut)
+        if self.connexion is not None:
+            self.connexion.close()
+
+
+async def _envois_en_cours():
+    return len(asyncio.all_tasks()) - 1
+
+
+def attendre_envois():
+    """Attend la fin des envois au portail interne lancés par la phase"""
+    if portail_interne._boucle is None:
+        return
+    while asyncio.run_coroutine_threadsafe(_envois_en_cours(), portail_interne._boucle).result():
+        time.sleep(0.1)
+
+
+class RequetesEnCours:
+    """Application WSGI enveloppée : nombre de requêtes en cours de traitement"""
+
+    def __init__(self, application):
+        self.application = application
+        self.verrou = threading.Lock()
+        self.nombre = 0
+
+    def __call__(self, environ, start_response):
+        with self.verrou:
+            self.nombre += 1
+        try:
+            return self.application(environ, start_response)
+        finally:
+            with self.verrou:
+                self.nombre -= 1
+
+
+class Resultats:
+    def __init__(self):
+        self.verrou = threading.Lock()
+        self.compteurs = Counter()
+        self.durees = []
+
+    def compter(self, nom):
+        with self.verrou:
+            self.compteurs[nom] += 1
+
+    def confirmer(self, duree):
+        with self.verrou:
+            self.durees.append(duree)
+
+
+class Command(BaseCommand):
+    help = ("Simule un pic d'ouverture des réservations sur un serveur local : débit utile (réservations "
+            "confirmées au client avant son abandon) sans puis avec la salle d'attente.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--utilisateurs', type=int, default=150, help="Chauffeurs simultanés")
+        parser.add_argument('--duree', type=float, default=20, help="Durée de chaque phase en secondes")
+        parser.add_argument('--delai-client', type=float, default=3,
+                            help="Secondes avant qu'un chauffeur abandonne et renvoie sa demande")
+        parser.add_argument('--capacite', type=int, default=settings.SALLE_ATTENTE_CAPACITE,
+                            help="Requêtes admises simultanément par la salle d'attente")
+
+    def handle(self, *args, **options):
+        stub = demarrer(ThreadingHTTPServer(('127.0.0.1', 0), PortailInterneStub))
+        with tempfile.TemporaryDirectory(prefix='salle_attente_') as dossier, override_settings(
+            PORTAIL_INTERNE_URL=f"http://127.0.0.1:{stub.server_address[1]}/api/qr-codes/receive/",
+            MEDIA_ROOT=dossier,
+            # Créneaux illimités : seule la charge limite les réservations
+            CAPACITE_CRENEAU=10 ** 6,
+        ), base_de_test():
+            serveur = ThreadedWSGIServer(('127.0.0.1', 0), GestionnaireSilencieux)
+            serveur.set_app(RequetesEnCours(get_wsgi_application()))
+            demarrer(serveur)
+            jetons = self.creer_chauffeurs(options['utilisateurs'])
+            phases = [('libre', {'SALLE_ATTENTE_ACTIVE': False})]
+            phases.append(('salle_attente', {
+                'SALLE_ATTENTE_ACTIVE': True,
+                'SALLE_ATTENTE_CAPACITE': options['capacite'],
+                'SALLE_ATTENTE_FICHIER': f'{dossier}/salle.bin',
+            }))
+            rapports = {}
+            for nom, reglages in phases:
+                salle_attente._salle = None
+                with override_settings(**reglages):
+                    rapports[nom] = self.phase(nom, serveur, jetons, options)
+                salle_attente._salle = None
+            serveur.shutdown()
+        stub.shutdown()
+
+        libre, salle = rapports['libre'], rapports['salle_attente']
+        if libre['debit_utile']:
+            self.stdout.write(self.style.SUCCESS(
+                f"Débit utile x{salle['debit_utile'] / libre['debit_utile']:.2f} avec la salle d'attente"
+            ))
+
+    def creer_chauffeurs(self, nombre):
+        mot_de_passe = make_password(None)
+        User.objects.bulk_create([
+            User(username=f'chauffeur-{i}@simulation.ma', email=f'chauffeur-{i}@simulation.ma', password=mot_de_passe)
+            for i in range(nombre)
+        ])
+        return [generer_tokens(user)['access'] for user in User.objects.filter(username__endswith='@simulation.ma')]
+
+    def phase(self, nom, serveur, jetons, options):
+        resultats = Resultats()
+        chauffeurs = [
+            Chauffeur('127.0.0.1', serveur.server_address[1], jeton, options['delai_client'], resultats)
+            for jeton in jetons
+        ]
+        avant = RendezVous.objects.count()
+        self.stdout.write(f"[{nom}] {len(chauffeurs)} chauffeurs pendant {options['duree']}s...")
+        echeance = time.monotonic() + options['duree']
+        debut = time.perf_counter()
+        threads = [threading.Thread(target=c.executer, args=(echeance,)) for c in chauffeurs]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        duree = time.perf_counter() - debut
+        # Laisse finir les requêtes abandonnées encore traitées par le serveur
+        # et leurs envois, pour ne pas les compter dans la phase suivante
+        while serveur.application.nombre:
+            time.sleep(0.1)
+        attendre_envois()
+        creees = RendezVous.objects.count() - avant
+
+        confirmees = len(resultats.durees)
+        rapport = {
+            'duree': round(duree, 2),
+            'confirmees': confirmees,
+            'debit_utile': round(confirmees / duree, 2),
+            'creees_serveur': creees,
+            'travail_perdu': creees - confirmees,
+            **resultats.compteurs,
+        }
+        self.stdout.write(
+            f"  confirmées {confirmees} ({rapport['debit_utile']}/s), créées côté serveur {creees}, "
+            f"travail perdu {rapport['travail_perdu']}, "
+            + ', '.join(f'{k} {v}' for k, v in sorted(resultats.compteurs.items()))
+        )
+        self.stdout.write(f"  délai perçu par réservation confirmée : {formater_ms(percentiles(resultats.durees))}")
+        return rapport
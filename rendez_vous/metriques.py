@@ -0,0 +1,81 @@
+"""
+Métriques Prometheus du portail.
+
+Avec PROMETHEUS_MULTIPROC_DIR défini (plusieurs workers gunicorn), chaque
+processus écrit ses valeurs dans ce répertoire et /metrics les agrège.
+"""
+import os
+from datetime import timedelta
+
+from django.conf import settings
+from django.db.models import Count
+from django.utils import timezone
+from prometheus_client import REGISTRY, CollectorRegistry, Counter, Histogram, multiprocess
+from prometheus_client.core import GaugeMetricFamily
+
+LATENCE_REQUETES = Histogram(
+    'portail_requete_duree_secondes', "Durée des requêtes HTTP par vue (action DRF)",
+    ['vue', 'methode', 'statut'],
+)
+RESERVATIONS_CREEES = Counter(
+    'portail_reservations_creees_total', "Rendez-vous créés",
+    ['operation', 'sens_trafic'],
+)
+CONFLITS_REJETES = Counter(
+    'portail_conflits_rejetes_total', "Réservations refusées pour chevauchement sur le même camion",
+)
+RENDU_QR = Histogram(
+    'portail_qr_rendu_duree_secondes', "Génération et écriture du PNG de QR code",
+    buckets=(.005, .01, .025, .05, .1, .25, .5, 1, 2.5),
+)
+ENVOI_PORTAIL = Histogram(
+    'portail_interne_envoi_duree_secondes', "Latence des envois au portail interne",
+)
+ECHECS_PORTAIL = Counter(
+    'portail_interne_echecs_total', "Envois au portail interne en échec",
+    ['motif'],
+)
+
+
+class RemplissageCreneaux:
+    """Taux de remplissage des créneaux, calculé en base au moment de la collecte"""
+
+    def collect(self):
+        from .models import RendezVous  # models importe ce module
+
+        metrique = GaugeMetricFamily(
+            'portail_creneau_taux_remplissage',
+            "Rendez-vous actifs / CAPACITE_CRENEAU (créneaux ayant au moins une réservation)",
+            labels=['date', 'heure'],
+        )
+        aujourd_hui = timezone.now().date()
+        creneaux = RendezVous.objects.filter(
+            date_rdv__gte=aujourd_hui,
+            date_rdv__lt=aujourd_hui + timedelta(days=settings.METRIQUES_JOURS_REMPLISSAGE),
+            statut__in=['en_attente', 'valide'],
+        ).values('date_rdv', 'heure_rdv').annotate(nombre=Count('id')).order_by('date_rdv', 'heure_rdv')
+        for creneau in creneaux:
+            metrique.add_metric(
+                [creneau['date_rdv'].isoformat(), creneau['heure_rdv'].strftime('%H:%M')],
+                creneau['nombre'] / settings.CAPACITE_CRENEAU,
+            )
+        yield metrique
+
+
+def registre_de_collecte():
+    """Registre à exposer : valeurs de tous les workers en mode multiprocessus"""
+    registre = CollectorRegistry()
+    if os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+        multiprocess.MultiProcessCollector(registre)
+    else:
+        registre.register(REGISTRY)
+    registre.register(RemplissageCreneaux())
+    return registre
+
+
+def observer_requete(request, response, duree):
+    vue = getattr(request.resolver_match, 'view_name', None)
+    if vue is None:
+        # URL inconnue : pas de label par chemin, la cardinalité resterait ouverte
+        vue = 'non_resolue'
+    LATENCE_REQUETES.labels(vue, request.method, response.status_code).observe(duree)
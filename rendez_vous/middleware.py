@@ -0,0 +1,138 @@
+import cProfile
+import logging
+import random
+import time
+from datetime import datetime
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connection
+
+from .instrumentation import demarrer, terminer
+from .metriques import observer_requete
+from .profilage import enregistrer_capture, jeton_valide
+
+logger = logging.getLogger('rendez_vous.performance')
+
+
+class InstrumentationMiddleware:
+    """
+    En-tête Server-Timing si SERVER_TIMING (SQL, sérialisation, rendu, QR code, portail, total)
+    et alertes structurées pour les requêtes lentes et les N+1 probables.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        mesures, jeton = demarrer()
+        try:
+            response = self.get_response(request)
+        finally:
+            terminer(jeton)
+        return self.conclure(request, response, mesures)
+
+    async def __acall__(self, request):
+        mesures, jeton = demarrer()
+        try:
+            response = await self.get_response(request)
+        finally:
+            terminer(jeton)
+        return self.conclure(request, response, mesures)
+
+    def conclure(self, request, response, mesures):
+        total = mesures.total
+        observer_requete(request, response, total)
+        if settings.SERVER_TIMING:
+            # Valeur d'en-tête : ASCII seulement
+            entrees = [f'db;dur={mesures.durees["db"] * 1000:.1f};desc="{mesures.nb_requetes_sql} requetes SQL"']
+            entrees += [f'{nom};dur={duree * 1000:.1f}' for nom, duree in mesures.durees.items() if nom != 'db']
+            entrees.append(f'total;dur={total * 1000:.1f}')
+            response['Server-Timing'] = ', '.join(entrees)
+
+        contexte = {
+            'methode': request.method,
+            'chemin': request.path,
+            'vue': getattr(request.resolver_match, 'view_name', None),
+            'statut': response.status_code,
+            'duree_ms': round(total * 1000, 1),
+            'sql_nb': mesures.nb_requetes_sql,
+            **{f'{nom}_ms': round(duree * 1000, 1) for nom, duree in mesures.durees.items()},
+        }
+        if total * 1000 >= settings.SEUIL_REQUETE_LENTE_MS:
+            logger.warning('Requête lente', extra={'donnees': contexte})
+        if mesures.sql:
+            sql, repetitions = mesures.sql.most_common(1)[0]
+            if repetitions >= settings.SEUIL_N_PLUS_UN:
+                logger.warning('N+1 probable', extra={'donnees': {
+                    **contexte, 'sql': sql, 'repetitions': repetitions,
+                }})
+        return response
+
+
+
+class ProfilageMiddleware:
+    """
+    Profilage cProfile + trace SQL d'une requête, déclenché par un en-tête
+    X-Profilage signé (manage.py profiling_token) ou par échantillonnage.
+    Retiré de la chaîne au démarrage si PROFILAGE_ACTIF est faux.
+    """
+
+    def __init__(self, get_response):
+        if not settings.PROFILAGE_ACTIF:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def declencheur(self, request):
+        jeton = request.headers.get('X-Profilage')
+        if jeton:
+            return 'jeton' if jeton_valide(jeton) else None
+        if settings.PROFILAGE_ECHANTILLONNAGE and random.random() < settings.PROFILAGE_ECHANTILLONNAGE:
+            return 'echantillon'
+        return None
+
+    def __call__(self, request):
+        declencheur = self.declencheur(request)
+        if declencheur is None:
+            return self.get_response(request)
+
+        trace = []
+
+        def tracer_sql(execute, sql, params, many, context):
+            debut = time.perf_counter()
+            try:
+                return execute(sql, params, many, context)
+            finally:
+                trace.append({
+                    'sql': sql, 'params': repr(params)[:500], 'many': many,
+                    'duree_ms': round((time.perf_counter() - debut) * 1000, 3),
+                })
+
+        profil = cProfile.Profile()
+        debut = time.perf_counter()
+        with connection.execute_wrapper(tracer_sql):
+            profil.enable()
+            try:
+                response = self.get_response(request)
+            finally:
+                profil.disable()
+        identifiant = enregistrer_capture(profil, {
+            'date': datetime.now().isoformat(timespec='seconds'),
+            'methode': request.method,
+            'chemin': request.get_full_path(),
+            'vue': getattr(request.resolver_match, 'view_name', None),
+            'statut': response.status_code,
+            'duree_ms': round((time.perf_counter() - debut) * 1000, 1),
+            'declencheur': declencheur,
+            'sql_nb': len(trace),
+            'sql': trace,
+        })
+        response['X-Profilage-Id'] = identifiant
+        return response
@@ -0,0 +1,38 @@
+from collections import defaultdict
+
+from django.db import migrations
+
+
+def normaliser_emails(apps, schema_editor):
+    User = apps.get_model('auth', 'User')
+    par_email = defaultdict(list)
+    for pk, email in User.objects.exclude(email='').values_list('pk', 'email'):
+        par_email[email.strip().lower()].append((pk, email))
+
+    doublons = sorted(email for email, comptes in par_email.items() if len(comptes) > 1)
+    if doublons:
+        raise RuntimeError(
+            "Emails utilisés par plusieurs comptes, à corriger avant la migration : "
+            + ", ".join(doublons)
+        )
+
+    for email, [(pk, original)] in par_email.items():
+        if email != original:
+            User.objects.filter(pk=pk).update(email=email)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auth', '0012_alter_user_first_name_max_length'),
+        ('rendez_vous', '0005_rendezvous_user'),
+    ]
+
+    operations = [
+        migrations.RunPython(normaliser_emails, migrations.RunPython.noop),
+        # Index partiel : les comptes sans email (superutilisateurs) restent autorisés
+        migrations.RunSQL(
+            "CREATE UNIQUE INDEX auth_user_email_unique ON auth_user (email) WHERE email <> ''",
+            "DROP INDEX auth_user_email_unique",
+        ),
+    ]
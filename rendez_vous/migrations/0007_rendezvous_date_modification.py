@@ -0,0 +1,18 @@
+# Generated by Django 4.2.7 on 2026-10-19 13:24
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rendez_vous', '0006_index_unique_email'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='rendezvous',
+            name='date_modification',
+            field=models.DateTimeField(auto_now=True),
+        ),
+    ]
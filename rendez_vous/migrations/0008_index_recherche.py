@@ -0,0 +1,32 @@
+# Generated by Django 4.2.7 on 2026-10-19 13:42
+
+import django.core.validators
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rendez_vous', '0007_rendezvous_date_modification'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='rendezvous',
+            name='cin',
+            field=models.CharField(db_index=True, max_length=20, validators=[django.core.validators.RegexValidator(message='Le CIN doit être au format: A123456 ou AB123456', regex='^[A-Z]{1,2}\\d{6}$')], verbose_name='CIN du chauffeur'),
+        ),
+        migrations.AlterField(
+            model_name='rendezvous',
+            name='numero_conteneur',
+            field=models.CharField(db_index=True, max_length=11, validators=[django.core.validators.RegexValidator(message='Le numéro de conteneur doit être au format: ABCD1234567', regex='^[A-Z]{4}\\d{7}$')], verbose_name='Numéro de conteneur'),
+        ),
+        migrations.AddIndex(
+            model_name='rendezvous',
+            index=models.Index(fields=['plaque_camion', 'date_rdv'], name='rdv_plaque_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='rendezvous',
+            index=models.Index(fields=['date_rdv', 'heure_rdv'], name='rdv_date_heure_idx'),
+        ),
+    ]
@@ -0,0 +1,47 @@
+# Generated by Django 4.2.7 on 2026-10-19 13:48
+
+from django.db import migrations, models
+from django.db.models import Count
+
+DIMENSIONS = ('date_rdv', 'heure_rdv', 'operation', 'sens_trafic', 'type_conteneur', 'statut')
+
+
+def remplir_statistiques(apps, schema_editor):
+    RendezVous = apps.get_model('rendez_vous', 'RendezVous')
+    StatistiqueRendezVous = apps.get_model('rendez_vous', 'StatistiqueRendezVous')
+    lignes = RendezVous.objects.order_by().values(*DIMENSIONS).annotate(nombre=Count('id'))
+    StatistiqueRendezVous.objects.bulk_create(
+        [StatistiqueRendezVous(**ligne) for ligne in lignes], batch_size=1000
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rendez_vous', '0008_index_recherche'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StatistiqueRendezVous',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date_rdv', models.DateField()),
+                ('heure_rdv', models.TimeField()),
+                ('operation', models.CharField(choices=[('import', 'Import'), ('export', 'Export')], max_length=10)),
+                ('sens_trafic', models.CharField(choices=[('entree', 'Entrée'), ('sortie', 'Sortie')], max_length=10)),
+                ('type_conteneur', models.CharField(choices=[('plein', 'Plein'), ('vide', 'Vide')], max_length=5)),
+                ('statut', models.CharField(choices=[('en_attente', 'En attente'), ('valide', 'Validé'), ('annule', 'Annulé'), ('termine', 'Terminé')], max_length=20)),
+                ('nombre', models.IntegerField(default=0)),
+            ],
+            options={
+                'verbose_name': 'Statistique de rendez-vous',
+                'verbose_name_plural': 'Statistiques de rendez-vous',
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='statistiquerendezvous',
+            constraint=models.UniqueConstraint(fields=('date_rdv', 'heure_rdv', 'operation', 'sens_trafic', 'type_conteneur', 'statut'), name='stat_rdv_cle_unique'),
+        ),
+        migrations.RunPython(remplir_statistiques, migrations.RunPython.noop),
+    ]
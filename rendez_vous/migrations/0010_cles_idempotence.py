@@ -0,0 +1,38 @@
+# Generated by Django 4.2.7 on 2026-10-19 14:03
+
+from django.conf import settings
+import django.core.serializers.json
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('rendez_vous', '0009_statistiques_rendez_vous'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CleIdempotence',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('cle', models.CharField(max_length=255)),
+                ('empreinte', models.CharField(max_length=64)),
+                ('statut', models.PositiveSmallIntegerField(blank=True, null=True)),
+                ('corps', models.JSONField(blank=True, encoder=django.core.serializers.json.DjangoJSONEncoder, null=True)),
+                ('date_creation', models.DateTimeField(auto_now_add=True)),
+                ('expiration', models.DateTimeField(db_index=True)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='cles_idempotence', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': "Clé d'idempotence",
+                'verbose_name_plural': "Clés d'idempotence",
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='cleidempotence',
+            constraint=models.UniqueConstraint(fields=('user', 'cle'), name='idempotence_user_cle_unique'),
+        ),
+    ]
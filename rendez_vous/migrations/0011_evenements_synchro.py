@@ -0,0 +1,30 @@
+# Generated by Django 4.2.7 on 2026-10-19 14:20
+
+import django.core.serializers.json
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rendez_vous', '0010_cles_idempotence'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EvenementSynchro',
+            fields=[
+                ('sequence', models.BigAutoField(primary_key=True, serialize=False)),
+                ('type', models.CharField(choices=[('creation', 'Création'), ('modification', 'Modification'), ('statut', 'Changement de statut'), ('suppression', 'Suppression')], max_length=12)),
+                ('rendez_vous_id', models.BigIntegerField()),
+                ('donnees', models.JSONField(encoder=django.core.serializers.json.DjangoJSONEncoder)),
+                ('date', models.DateTimeField(auto_now_add=True, db_index=True)),
+                ('xid', models.BigIntegerField(blank=True, null=True)),
+            ],
+            options={
+                'verbose_name': 'Événement de synchronisation',
+                'verbose_name_plural': 'Événements de synchronisation',
+                'ordering': ['sequence'],
+            },
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 4.2.7 on 2026-10-19 15:04
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rendez_vous', '0011_evenements_synchro'),
+    ]
+
+    operations = [
+        migrations.RemoveField(
+            model_name='evenementsynchro',
+            name='xid',
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 4.2.7 on 2026-10-19 15:08
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rendez_vous', '0012_suppression_xid_synchro'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='rendezvous',
+            index=models.Index(fields=['plaque_camion'], name='rdv_plaque_prefixe_idx', opclasses=['varchar_pattern_ops']),
+        ),
+    ]
@@ -1,14 +1,47 @@
 from django.db import models
 from django.core.validators import RegexValidator
-import qrcode
 from io import BytesIO
-from django.core.files import File
-from PIL import Image
+from django.core.files.base import ContentFile
 import json
 import uuid
 from datetime import datetime
 from django.contrib.auth.models import User
-import requests
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+from django.dispatch import Signal
+from django.utils import timezone
+from django.urls import reverse
+import os
+import logging
+from .instrumentation import mesurer
+from .metriques import RENDU_QR
+from .portail_interne import planifier_envoi
+
+logger = logging.getLogger(__name__)
+
+# Envoyé après chaque lot de RendezVousQuerySet.changer_statut (update() ne
+# déclenche pas post_save) : anciens_statuts = {pk: statut avant}, nouveau_statut
+statuts_modifies = Signal()
+# Envoyé après chaque lot de RendezVousQuerySet.supprimer (sans le Collector, donc
+# sans pre_delete ni post_delete) : rendez_vous = [instances lues avant la suppression]
+rendez_vous_supprimes = Signal()
+
+# Clé des compteurs StatistiqueRendezVous (voir statistiques.py)
+DIMENSIONS_STATISTIQUES = ('date_rdv', 'heure_rdv', 'operation', 'sens_trafic', 'type_conteneur', 'statut')
+# Statuts qui occupent une place dans un créneau
+STATUTS_ACTIFS = ('en_attente', 'valide')
+
+def ecrire_qr_code(storage, nom, contenu):
+    """Écrit le PNG d'un QR code sous le nom enregistré en base (après le commit)"""
+    try:
+        ecrit = storage.save(nom, ContentFile(contenu))
+    except OSError:
+        logger.exception("Écriture du QR code impossible", extra={'donnees': {'nom': nom}})
+        return
+    if ecrit != nom:
+        # Nom pris entre-temps par une régénération concurrente du même rendez-vous
+        logger.warning("QR code écrit sous un autre nom", extra={'donnees': {'nom': nom, 'ecrit': ecrit}})
+
 
 class Profil(models.Model):
     user = models.OneToOneField(User, on_delete=models.CASCADE, related_name='profil')
@@ -17,6 +50,49 @@ class Profil(models.Model):
     def __str__(self):
         return f"Profil de {self.user.username}"
 
+class RendezVousQuerySet(models.QuerySet):
+    def changer_statut(self, nouveau_statut, depuis, taille_lot=1000):
+        """
+        Passe au statut `nouveau_statut` les rendez-vous du queryset dont le statut
+        est dans `depuis`, par lots de `taille_lot` (une transaction par lot).
+        Met à jour date_modification et envoie statuts_modifies ; retourne le total.
+        """
+        pks = list(self.filter(statut__in=depuis).order_by('pk').values_list('pk', flat=True))
+        total = 0
+        for i in range(0, len(pks), taille_lot):
+            with transaction.atomic():
+                anciens = dict(
+                    RendezVous.objects.select_for_update()
+                    .filter(pk__in=pks[i:i + taille_lot], statut__in=depuis)
+                    .values_list('pk', 'statut')
+                )
+                if not anciens:
+                    continue
+                total += RendezVous.objects.filter(pk__in=anciens).update(
+                    statut=nouveau_statut, date_modification=timezone.now()
+                )
+                statuts_modifies.send(sender=RendezVous, anciens_statuts=anciens, nouveau_statut=nouveau_statut)
+        return total
+
+    def supprimer(self, taille_lot=1000):
+        """
+        Supprime les rendez-vous du queryset par lots de `taille_lot` (une
+        transaction par lot) : un DELETE par lot au lieu des signaux ligne à
+        ligne du Collector, puis rendez_vous_supprimes. Retourne le total.
+        """
+        pks = list(self.order_by('pk').values_list('pk', flat=True))
+        total = 0
+        for i in range(0, len(pks), taille_lot):
+            with transaction.atomic():
+                lot = list(RendezVous.objects.select_for_update().filter(pk__in=pks[i:i + taille_lot]).order_by('pk'))
+                if not lot:
+                    continue
+                # Aucune table ne référence RendezVous : pas de cascade à collecter
+                total += RendezVous.objects.filter(pk__in=[rdv.pk for rdv in lot])._raw_delete(self.db)
+                rendez_vous_supprimes.send(sender=RendezVous, rendez_vous=lot)
+        return total
+
+
 class RendezVous(models.Model):
     SENS_CHOICES = [
         ('entree', 'Entrée'),
@@ -33,6 +109,13 @@ class RendezVous(models.Model):
         ('export', 'Export'),
     ]
     
+    STATUT_CHOICES = [
+        ('en_attente', 'En attente'),
+        ('valide', 'Validé'),
+        ('annule', 'Annulé'),
+        ('termine', 'Terminé'),
+    ]
+    
     # Informations du chauffeur
     cin = models.CharField(
         max_length=20,
@@ -42,6 +125,7 @@ class RendezVous(models.Model):
                 message='Le CIN doit être au format: A123456 ou AB123456'
             )
         ],
+        db_index=True,
         verbose_name="CIN du chauffeur"
     )
     
@@ -66,6 +150,7 @@ class RendezVous(models.Model):
                 message='Le numéro de conteneur doit être au format: ABCD1234567'
             )
         ],
+        db_index=True,
         verbose_name="Numéro de conteneur"
     )
     
@@ -98,21 +183,28 @@ class RendezVous(models.Model):
     code_unique = models.CharField(max_length=50, unique=True, default=uuid.uuid4)
     qr_code = models.ImageField(upload_to='qr_codes/', blank=True, null=True)
     date_creation = models.DateTimeField(auto_now_add=True)
+    date_modification = models.DateTimeField(auto_now=True)
     statut = models.CharField(
         max_length=20,
-        choices=[
-            ('en_attente', 'En attente'),
-            ('valide', 'Validé'),
-            ('annule', 'Annulé'),
-            ('termine', 'Terminé'),
-        ],
+        choices=STATUT_CHOICES,
         default='en_attente'
     )
     
+    objects = RendezVousQuerySet.as_manager()
+    
     class Meta:
         verbose_name = "Rendez-vous"
         verbose_name_plural = "Rendez-vous"
         ordering = ['-date_creation']
+        indexes = [
+            # Recherche par plaque (préfixe) et contrôle de conflit plaque + date
+            models.Index(fields=['plaque_camion', 'date_rdv'], name='rdv_plaque_date_idx'),
+            # Sous PostgreSQL, LIKE 'AB12%' (recherche par préfixe de l'admin) ne sert
+            # que d'un index varchar_pattern_ops ; opclasses ignoré ailleurs
+            models.Index(fields=['plaque_camion'], name='rdv_plaque_prefixe_idx', opclasses=['varchar_pattern_ops']),
+            # Planning d'une date, créneaux pleins, filtre par défaut de l'admin
+            models.Index(fields=['date_rdv', 'heure_rdv'], name='rdv_date_heure_idx'),
+        ]
     
     def __str__(self):
         return f"RDV {self.code_unique} - {self.cin} - {self.date_rdv}"
@@ -122,13 +214,17 @@ class RendezVous(models.Model):
         if not self.code_unique:
             self.code_unique = str(uuid.uuid4())
         
-        # Sauvegarder d'abord pour avoir l'ID
-        super().save(*args, **kwargs)
-        
-        # Générer le QR code
-        if not self.qr_code:
-            self.generate_qr_code()
-            super().save(update_fields=['qr_code'])
+        # Une transaction pour l'écriture et les effets de post_save (compteurs,
+        # journal de synchro) : Django envoie post_save hors de la sienne, et un
+        # échec entre les deux laisserait le rendez-vous validé sans eux
+        with transaction.atomic():
+            # Sauvegarder d'abord pour avoir l'ID
+            super().save(*args, **kwargs)
+            
+            # Générer le QR code
+            if not self.qr_code:
+                self.generate_qr_code()
+                super().save(update_fields=['qr_code'])
     
     def generate_qr_code(self):
         """Génère un QR code avec les informations du rendez-vous"""
@@ -144,73 +240,81 @@ class RendezVous(models.Model):
                 'date_rdv': self.date_rdv.isoformat() if self.date_rdv else None
             }
             
-            # Créer le QR code
-            qr = qrcode.QRCode(
-                version=1,
-                error_correction=qrcode.constants.ERROR_CORRECT_L,
-                box_size=10,
-                border=4,
-            )
-            qr.add_data(json.dumps(qr_data, ensure_ascii=False))
-            qr.make(fit=True)
-            
-            # Créer l'image
-            img = qr.make_image(fill_color="black", back_color="white")
-            
-            # Sauvegarder l'image
-            buffer = BytesIO()
-            img.save(buffer, format='PNG')
-            buffer.seek(0)
-            filename = f'qr_code_{self.code_unique}.png'
-            
-            self.qr_code.save(filename, File(buffer), save=False)
+            with mesurer('qr'), RENDU_QR.time():
+                # Import au premier rendu : qrcode charge PIL, inutile aux
+                # commandes et aux workers qui ne créent pas de rendez-vous
+                import qrcode
+
+                # Créer le QR code
+                qr = qrcode.QRCode(
+                    version=1,
+                    error_correction=qrcode.constants.ERROR_CORRECT_L,
+                    box_size=10,
+                    border=4,
+                )
+                qr.add_data(json.dumps(qr_data, ensure_ascii=False))
+                qr.make(fit=True)
+                
+                # Créer l'image
+                img = qr.make_image(fill_color="black", back_color="white")
+                
+                # Sauvegarder l'image
+                buffer = BytesIO()
+                img.save(buffer, format='PNG')
+                filename = f'qr_code_{self.code_unique}.png'
+                
+                # Le nom est réservé tout de suite, le fichier écrit au commit :
+                # une transaction annulée ne laisse pas de PNG orphelin
+                storage = self.qr_code.storage
+                ancien = self.qr_code.name
+                nom = storage.get_available_name(self.qr_code.field.generate_filename(self, filename))
+                self.qr_code.name = nom
+                contenu = buffer.getvalue()
+                transaction.on_commit(lambda: ecrire_qr_code(storage, nom, contenu))
+                if ancien and ancien != nom:
+                    # Remplacé : l'ancien fichier part une fois la nouvelle valeur validée
+                    from .fichiers import supprimer_apres_commit
+                    supprimer_apres_commit(storage, [ancien])
             
             # Envoyer automatiquement au portail interne
             self.send_to_internal_portal(qr_data)
             
-        except Exception as e:
+        except Exception:
             # En cas d'erreur, on ne génère pas le QR code mais on continue
-            print(f"Erreur lors de la génération du QR code: {e}")
-            pass
+            logger.exception("Erreur lors de la génération du QR code",
+                             extra={'donnees': {'rendez_vous_id': self.pk}})
     
+    def donnees_portail(self):
+        """Rendez-vous tel qu'envoyé au portail interne (et comparé par reconciliation.py)"""
+        return {
+            'code_unique': str(self.code_unique),
+            'cin': self.cin,
+            'plaque_camion': self.plaque_camion,
+            'numero_conteneur': self.numero_conteneur,
+            'type_conteneur': self.type_conteneur,
+            'operation': self.operation,
+            'sens_trafic': self.sens_trafic,
+            'date_rdv': self.date_rdv.isoformat() if self.date_rdv else None,
+            'heure_rdv': str(self.heure_rdv)[:5] if self.heure_rdv else None,
+            'date_creation': self.date_creation.isoformat(),
+            'statut': self.statut,
+            'rendez_vous_id': self.id,
+            'source': 'portail_externe'
+        }
+
     def send_to_internal_portal(self, qr_data):
-        """Envoie le QR code au portail interne pour stockage"""
-        try:
-            # URL du portail interne (à adapter selon ton URL)
-            internal_portal_url = "http://localhost:8001/api/qr-codes/receive/"  # Change le port selon ton portail interne
-            
-            # Données à envoyer
-            payload = {
-                'code_unique': qr_data['code_unique'],
-                'cin': qr_data['cin'],
-                'plaque_camion': qr_data['plaque_camion'],
-                'numero_conteneur': qr_data['numero_conteneur'],
-                'type_conteneur': qr_data['type_conteneur'],
-                'operation': qr_data['operation'],
-                'date_rdv': qr_data['date_rdv'],
-                'date_creation': self.date_creation.isoformat(),
-                'statut': self.statut,
-                'rendez_vous_id': self.id,
-                'source': 'portail_externe'
-            }
-            
-            # Envoyer la requête
-            response = requests.post(
-                internal_portal_url,
-                json=payload,
-                headers={'Content-Type': 'application/json'},
-                timeout=10  # Timeout de 10 secondes
-            )
-            
-            if response.status_code == 201:
-                print(f"QR code {self.code_unique} envoyé avec succès au portail interne")
-            else:
-                print(f"Erreur lors de l'envoi au portail interne: {response.status_code} - {response.text}")
-                
-        except requests.exceptions.RequestException as e:
-            print(f"Erreur de connexion au portail interne: {e}")
-        except Exception as e:
-            print(f"Erreur lors de l'envoi au portail interne: {e}")
+        """Envoie le QR code au portail interne pour stockage, sans bloquer la requête"""
+        payload = self.donnees_portail()
+        with mesurer('portail'):
+            # Dans une transaction (requête idempotente), rien n'est envoyé si elle est annulée
+            transaction.on_commit(lambda: planifier_envoi(payload))
+    
+    def get_qr_code_url(self, request=None):
+        """URL du QR code, servie par la vue à cache immuable"""
+        if not self.qr_code:
+            return None
+        url = reverse('qr-code-fichier', args=[os.path.basename(self.qr_code.name)])
+        return request.build_absolute_uri(url) if request else url
     
     def get_intervalle_rdv(self):
         """Retourne l'intervalle de 2h pour le rendez-vous"""
@@ -229,3 +333,80 @@ class RendezVous(models.Model):
                 return "Import - Camion plein"
         else:  # export
             return f"Export - Camion plein avec conteneur {self.type_conteneur}"
+
+
+class StatistiqueRendezVous(models.Model):
+    """
+    Nombre de rendez-vous par date, créneau, opération, sens, type et statut,
+    tenu à jour à chaque écriture (statistiques.py) ; rebuild_stats le recalcule.
+    """
+    date_rdv = models.DateField()
+    heure_rdv = models.TimeField()
+    operation = models.CharField(max_length=10, choices=RendezVous.OPERATION_CHOICES)
+    sens_trafic = models.CharField(max_length=10, choices=RendezVous.SENS_CHOICES)
+    type_conteneur = models.CharField(max_length=5, choices=RendezVous.TYPE_CHOICES)
+    statut = models.CharField(max_length=20, choices=RendezVous.STATUT_CHOICES)
+    nombre = models.IntegerField(default=0)
+
+    class Meta:
+        verbose_name = "Statistique de rendez-vous"
+        verbose_name_plural = "Statistiques de rendez-vous"
+        constraints = [
+            # Commence par date_rdv : sert aussi les lectures par période
+            models.UniqueConstraint(fields=DIMENSIONS_STATISTIQUES, name='stat_rdv_cle_unique'),
+        ]
+
+    def __str__(self):
+        return f"{self.date_rdv} {self.heure_rdv:%H:%M} {self.operation}/{self.sens_trafic}/{self.type_conteneur} {self.statut} : {self.nombre}"
+
+
+class CleIdempotence(models.Model):
+    """
+    Réponse enregistrée pour un en-tête Idempotency-Key (voir idempotence.py).
+    statut reste vide tant que la première requête n'a pas abouti.
+    """
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='cles_idempotence')
+    cle = models.CharField(max_length=255)
+    empreinte = models.CharField(max_length=64)
+    statut = models.PositiveSmallIntegerField(null=True, blank=True)
+    corps = models.JSONField(null=True, blank=True, encoder=DjangoJSONEncoder)
+    date_creation = models.DateTimeField(auto_now_add=True)
+    expiration = models.DateTimeField(db_index=True)
+
+    class Meta:
+        verbose_name = "Clé d'idempotence"
+        verbose_name_plural = "Clés d'idempotence"
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'cle'], name='idempotence_user_cle_unique'),
+        ]
+
+    def __str__(self):
+        return f"{self.user_id} {self.cle} ({self.statut or 'en cours'})"
+
+
+class EvenementSynchro(models.Model):
+    """
+    Journal des changements de rendez-vous lu par le portail interne
+    (GET /api/sync/changes/?since=<sequence>, voir synchro.py). Écrit dans la
+    transaction du changement ; `donnees` est l'état du rendez-vous après coup.
+    """
+    TYPE_CHOICES = [
+        ('creation', 'Création'),
+        ('modification', 'Modification'),
+        ('statut', 'Changement de statut'),
+        ('suppression', 'Suppression'),
+    ]
+
+    sequence = models.BigAutoField(primary_key=True)
+    type = models.CharField(max_length=12, choices=TYPE_CHOICES)
+    rendez_vous_id = models.BigIntegerField()
+    donnees = models.JSONField(encoder=DjangoJSONEncoder)
+    date = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    class Meta:
+        verbose_name = "Événement de synchronisation"
+        verbose_name_plural = "Événements de synchronisation"
+        ordering = ['sequence']
+
+    def __str__(self):
+        return f"#{self.sequence} {self.type} RDV {self.rendez_vous_id}"
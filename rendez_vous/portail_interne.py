@@ -0,0 +1,75 @@
+"""
+Client asynchrone du portail interne : un seul pool de connexions HTTP par processus.
+
+httpx n'est importé qu'au premier envoi : models.py importe ce module, donc
+chaque démarrage (worker, commande, tests) le paierait sinon.
+"""
+import asyncio
+import logging
+import threading
+import time
+
+from django.conf import settings
+
+from .metriques import ECHECS_PORTAIL, ENVOI_PORTAIL
+
+logger = logging.getLogger(__name__)
+
+_boucle = None
+_client = None
+_verrou = threading.Lock()
+
+
+def _boucle_de_fond():
+    """Boucle d'événements dédiée aux envois lancés depuis du code synchrone"""
+    global _boucle
+    with _verrou:
+        if _boucle is None:
+            _boucle = asyncio.new_event_loop()
+            threading.Thread(target=_boucle.run_forever, name='portail-interne', daemon=True).start()
+    return _boucle
+
+
+def _client_http():
+    # Le client httpx est lié à la boucle de fond, seule à l'utiliser
+    global _client
+    if _client is None:
+        import httpx
+
+        _client = httpx.AsyncClient(
+            timeout=settings.PORTAIL_INTERNE_TIMEOUT,
+            limits=httpx.Limits(max_connections=20, max_keepalive_connections=10),
+        )
+    return _client
+
+
+async def envoyer(payload):
+    """Envoie un rendez-vous au portail interne ; retourne True s'il est accepté"""
+    import httpx
+
+    donnees = {'code_unique': payload['code_unique']}
+    debut = time.perf_counter()
+    try:
+        response = await _client_http().post(settings.PORTAIL_INTERNE_URL, json=payload)
+    except httpx.HTTPError as e:
+        ECHECS_PORTAIL.labels('connexion').inc()
+        logger.warning("Erreur de connexion au portail interne", extra={'donnees': {
+            **donnees, 'erreur': repr(e), 'duree_ms': round((time.perf_counter() - debut) * 1000, 1),
+        }})
+        return False
+    ENVOI_PORTAIL.observe(time.perf_counter() - debut)
+    donnees.update(statut=response.status_code, duree_ms=round((time.perf_counter() - debut) * 1000, 1))
+    if response.status_code == 201:
+        logger.debug("QR code envoyé au portail interne", extra={'donnees': donnees})
+        return True
+    ECHECS_PORTAIL.labels('statut').inc()
+    logger.warning("Erreur lors de l'envoi au portail interne",
+                   extra={'donnees': {**donnees, 'reponse': response.text[:500]}})
+    return False
+
+
+def planifier_envoi(payload):
+    """Programme l'envoi sur la boucle de fond sans bloquer l'appelant"""
+    if not settings.PORTAIL_INTERNE_URL:
+        return None
+    return asyncio.run_coroutine_threadsafe(envoyer(payload), _boucle_de_fond())
@@ -0,0 +1,208 @@
+"""
+Analyse de la charge historique et prévision de la demande par créneau.
+
+L'historique (RendezVous) est lu en une seule passe, par lots, dans des
+colonnes NumPy (jour, minute, opération, statut). Les cartes de chaleur jour
+de semaine × créneau × opération et les séries hebdomadaires sont des
+comptages vectorisés (np.bincount) sur un index de case aplati. Le résultat est
+gardé dans un fichier .npz (ANALYSE_REPERTOIRE) pendant ANALYSE_DUREE_CACHE
+secondes, partagé par la commande analyze_load et GET /api/stats/charge/.
+
+L'historique couvre des semaines entières jusqu'au dimanche dernier. Une
+absence est un rendez-vous de l'historique resté en attente ou validé, jamais
+terminé. La prévision des semaines à venir (semaine en cours comprise) est la
+moyenne exponentielle des semaines passées de chaque case, corrigée de la
+tendance des totaux hebdomadaires, et au moins égale aux réservations déjà
+prises.
+
+NumPy n'est importé qu'à l'appel : le chargement de l'URLconf ne le paie pas.
+"""
+import json
+import os
+import time
+from datetime import date, timedelta
+from itertools import islice
+
+from django.conf import settings
+from django.utils import timezone
+
+from .creneaux import CRENEAUX, DUREE_CRENEAU
+from .models import STATUTS_ACTIFS, RendezVous
+
+JOURS_SEMAINE = ('lundi', 'mardi', 'mercredi', 'jeudi', 'vendredi', 'samedi', 'dimanche')
+OPERATIONS = tuple(code for code, _ in RendezVous.OPERATION_CHOICES)
+STATUTS = tuple(code for code, _ in RendezVous.STATUT_CHOICES)
+FORME = (len(JOURS_SEMAINE), len(CRENEAUX), len(OPERATIONS))
+NB_CASES = FORME[0] * FORME[1] * FORME[2]
+# Poids de la semaine la plus récente dans la moyenne exponentielle
+LISSAGE = 0.3
+TAILLE_LOT = 20000
+
+
+def charger(du, au):
+    """Rendez-vous datés de du à au : tableau structuré (jour ordinal, minute, operation, statut)"""
+    import numpy as np
+
+    type_ligne = np.dtype([('jour', 'i4'), ('minute', 'i2'), ('operation', 'i1'), ('statut', 'i1')])
+    operations = {code: i for i, code in enumerate(OPERATIONS)}
+    statuts = {code: i for i, code in enumerate(STATUTS)}
+    lignes = RendezVous.objects.filter(date_rdv__range=(du, au)).order_by().values_list(
+        'date_rdv', 'heure_rdv', 'operation', 'statut',
+    ).iterator(chunk_size=TAILLE_LOT)
+    lots = []
+    while lot := list(islice(lignes, TAILLE_LOT)):
+        lots.append(np.fromiter(
+            ((d.toordinal(), h.hour * 60 + h.minute, operations[o], statuts[s]) for d, h, o, s in lot),
+            dtype=type_ligne, count=len(lot),
+        ))
+    return np.concatenate(lots) if lots else np.empty(0, dtype=type_ligne)
+
+
+def calculer(jours, semaines, aujourd_hui):
+    """Cartes de chaleur et prévisions : {nom: tableau}, plus 'meta' (dict)"""
+    import numpy as np
+
+    debut_prevision = aujourd_hui - timedelta(days=aujourd_hui.weekday())
+    du = debut_prevision - timedelta(weeks=max(1, -(-jours // 7)))
+    au = debut_prevision + timedelta(weeks=semaines, days=-1)
+    semaines_historique = (debut_prevision - du).days // 7
+
+    debut = time.perf_counter()
+    rdv = charger(du, au)
+    duree_chargement = time.perf_counter() - debut
+
+    jour = rdv['jour'] - du.toordinal()
+    premier_creneau = CRENEAUX[0].hour * 60 + CRENEAUX[0].minute
+    creneau = np.clip((rdv['minute'] - premier_creneau) // int(DUREE_CRENEAU.total_seconds() // 60),
+                      0, len(CRENEAUX) - 1)
+    case = ((jour % 7) * FORME[1] + creneau) * FORME[2] + rdv['operation']
+    semaine = jour // 7
+    passe = semaine < semaines_historique
+    annule = rdv['statut'] == STATUTS.index('annule')
+    actif = np.isin(rdv['statut'], [STATUTS.index(statut) for statut in STATUTS_ACTIFS])
+
+    def carte(masque):
+        return np.bincount(case[masque], minlength=NB_CASES).reshape(FORME)
+
+    def par_semaine(masque, decalage, nombre):
+        indices = (semaine[masque] - decalage) * NB_CASES + case[masque]
+        return np.bincount(indices, minlength=nombre * NB_CASES).reshape(nombre, NB_CASES)
+
+    reservations = carte(passe)
+    annulations = carte(passe & annule)
+    absences = carte(passe & actif)
+
+    # Demande hebdomadaire de chaque case (rendez-vous non annulés)
+    serie = par_semaine(passe & ~annule, 0, semaines_historique).astype(float)
+    poids = LISSAGE * (1 - LISSAGE) ** np.arange(semaines_historique - 1, -1, -1)
+    niveau = poids @ serie / poids.sum()
+    totaux = serie.sum(axis=1)
+    croissance = 0.0
+    if semaines_historique >= 4 and totaux.mean() > 0:
+        # Pente des totaux hebdomadaires, en part de la moyenne, par semaine
+        croissance = float(np.clip(np.polyfit(np.arange(semaines_historique), totaux, 1)[0] / totaux.mean(),
+                                   -0.2, 0.2))
+    facteur = np.clip(1 + croissance * np.arange(1, semaines + 1), 0, None)
+    deja_reserves = par_semaine(~passe & ~annule, semaines_historique, semaines)
+    prevision = np.maximum(niveau[None, :] * facteur[:, None], deja_reserves)
+
+    return {
+        'reservations': reservations,
+        'annulations': annulations,
+        'absences': absences,
+        'prevision': prevision.reshape(semaines, *FORME),
+        'deja_reserves': deja_reserves.reshape(semaines, *FORME),
+        'ecart_type': serie.std(axis=0).reshape(FORME),
+        'totaux_hebdomadaires': totaux,
+        'meta': {
+            'du': du.isoformat(), 'au': au.isoformat(), 'aujourd_hui': aujourd_hui.isoformat(),
+            'debut_prevision': debut_prevision.isoformat(), 'semaines_historique': semaines_historique,
+            'semaines_prevision': semaines, 'croissance_hebdomadaire': croissance,
+            'rendez_vous': int(len(rdv)), 'capacite_creneau': settings.CAPACITE_CRENEAU,
+            'duree_chargement': round(duree_chargement, 3),
+            'duree_calcul': round(time.perf_counter() - debut - duree_chargement, 3),
+            'calcule_le': timezone.now().isoformat(),
+        },
+    }
+
+
+def _chemin(jours, semaines, aujourd_hui):
+    return os.path.join(settings.ANALYSE_REPERTOIRE, f'charge_{aujourd_hui.isoformat()}_{jours}j_{semaines}s.npz')
+
+
+def enregistrer(chemin, resultat):
+    """Écrit l'artefact .npz (remplacement atomique) et retire ceux qui ont expiré"""
+    import numpy as np
+
+    os.makedirs(os.path.dirname(chemin), exist_ok=True)
+    provisoire = f'{chemin}.{os.getpid()}.tmp'
+    tableaux = {nom: valeur for nom, valeur in resultat.items() if nom != 'meta'}
+    with open(provisoire, 'wb') as fichier:
+        np.savez_compressed(fichier, meta=np.array(json.dumps(resultat['meta'])), **tableaux)
+    os.replace(provisoire, chemin)
+    limite = time.time() - settings.ANALYSE_DUREE_CACHE
+    for entree in os.scandir(os.path.dirname(chemin)):
+        if entree.name.startswith('charge_') and entree.path != chemin and entree.stat().st_mtime < limite:
+            os.unlink(entree.path)
+
+
+def lire(chemin):
+    import numpy as np
+
+    with np.load(chemin, allow_pickle=False) as artefact:
+        resultat = {nom: artefact[nom] for nom in artefact.files if nom != 'meta'}
+        resultat['meta'] = json.loads(str(artefact['meta']))
+    return resultat
+
+
+def analyse(jours=365, semaines=4, recalculer=False, aujourd_hui=None):
+    """Analyse depuis l'artefact en cache s'il a moins de ANALYSE_DUREE_CACHE secondes, sinon recalculée"""
+    aujourd_hui = aujourd_hui or timezone.localdate()
+    chemin = _chemin(jours, semaines, aujourd_hui)
+    try:
+        if not recalculer and time.time() - os.stat(chemin).st_mtime < settings.ANALYSE_DUREE_CACHE:
+            resultat = lire(chemin)
+            resultat['meta']['artefact'] = chemin
+            return resultat
+    except (OSError, ValueError):
+        # Absent, illisible ou écrit par une autre version : recalculé
+        pass
+    resultat = calculer(jours, semaines, aujourd_hui)
+    enregistrer(chemin, resultat)
+    resultat['meta']['artefact'] = chemin
+    return resultat
+
+
+def en_json(resultat):
+    """Réponse de l'API : tableaux [jour][créneau][opération], taux et prévisions par semaine"""
+    import numpy as np
+
+    reservations = resultat['reservations']
+    semaines_historique = max(resultat['meta']['semaines_historique'], 1)
+    prises = reservations - resultat['annulations']
+    debut_prevision = date.fromisoformat(resultat['meta']['debut_prevision'])
+    capacite = resultat['meta']['capacite_creneau']
+    return {
+        **{cle: valeur for cle, valeur in resultat['meta'].items() if cle != 'artefact'},
+        'jours': JOURS_SEMAINE,
+        'creneaux': [heure.strftime('%H:%M') for heure in CRENEAUX],
+        'operations': OPERATIONS,
+        'historique': {
+            'reservations': reservations.tolist(),
+            'moyenne_hebdomadaire': np.round(reservations / semaines_historique, 2).tolist(),
+            'taux_annulation': np.round(resultat['annulations'] / np.maximum(reservations, 1), 3).tolist(),
+            'taux_absence': np.round(resultat['absences'] / np.maximum(prises, 1), 3).tolist(),
+            'totaux_hebdomadaires': resultat['totaux_hebdomadaires'].astype(int).tolist(),
+        },
+        'prevision': [
+            {
+                'semaine': (debut_prevision + timedelta(weeks=i)).isoformat(),
+                'demande': np.round(prevision, 1).tolist(),
+                'ecart_type': np.round(resultat['ecart_type'], 1).tolist(),
+                'deja_reserves': deja.tolist(),
+                # Toutes opérations confondues, rapporté à CAPACITE_CRENEAU : [jour][créneau]
+                'saturation': np.round(prevision.sum(axis=-1) / capacite, 2).tolist(),
+            }
+            for i, (prevision, deja) in enumerate(zip(resultat['prevision'], resultat['deja_reserves']))
+        ],
+    }
@@ -0,0 +1,73 @@
+"""
+Captures de profilage à la demande (voir ProfilageMiddleware).
+
+Chaque capture est une paire de fichiers dans settings.PROFILAGE_REPERTOIRE :
+<id>.prof (pstats, lisible par snakeviz / python -m pstats) et <id>.json
+(requête, durée, trace SQL). Seules les PROFILAGE_MAX_CAPTURES dernières sont gardées.
+"""
+import json
+import os
+import re
+import uuid
+from datetime import datetime
+
+from django.conf import settings
+from django.core import signing
+
+SEL_JETON = 'rendez_vous.profilage'
+FORMAT_ID = re.compile(r'^\d{8}-\d{12}-[\w.-]+-[0-9a-f]{8}$')
+EXTENSIONS = {'prof': '.prof', 'sql': '.json'}
+
+
+def creer_jeton():
+    """Jeton à envoyer dans l'en-tête X-Profilage, valable PROFILAGE_JETON_DUREE secondes"""
+    return signing.TimestampSigner(salt=SEL_JETON).sign(uuid.uuid4().hex)
+
+
+def jeton_valide(jeton):
+    try:
+        signing.TimestampSigner(salt=SEL_JETON).unsign(jeton, max_age=settings.PROFILAGE_JETON_DUREE)
+    except signing.BadSignature:
+        return False
+    return True
+
+
+def enregistrer_capture(profil, meta):
+    """Écrit la capture puis supprime les plus anciennes ; retourne son identifiant"""
+    repertoire = settings.PROFILAGE_REPERTOIRE
+    os.makedirs(repertoire, exist_ok=True)
+    vue = re.sub(r'[^\w.-]', '_', meta['vue'] or 'non_resolue')
+    identifiant = f"{datetime.now():%Y%m%d-%H%M%S%f}-{vue}-{uuid.uuid4().hex[:8]}"
+    profil.dump_stats(os.path.join(repertoire, identifiant + '.prof'))
+    with open(os.path.join(repertoire, identifiant + '.json'), 'w', encoding='utf-8') as f:
+        json.dump({'id': identifiant, **meta}, f, ensure_ascii=False, indent=1, default=str)
+
+    for ancien in lister_identifiants()[settings.PROFILAGE_MAX_CAPTURES:]:
+        for extension in EXTENSIONS.values():
+            try:
+                os.remove(os.path.join(repertoire, ancien + extension))
+            except FileNotFoundError:
+                pass
+    return identifiant
+
+
+def lister_identifiants():
+    """Identifiants des captures, de la plus récente à la plus ancienne"""
+    try:
+        noms = os.listdir(settings.PROFILAGE_REPERTOIRE)
+    except FileNotFoundError:
+        return []
+    return sorted((nom[:-5] for nom in noms if nom.endswith('.json') and FORMAT_ID.match(nom[:-5])), reverse=True)
+
+
+def lire_resume(identifiant):
+    with open(chemin_capture(identifiant, 'sql'), encoding='utf-8') as f:
+        meta = json.load(f)
+    return {cle: meta.get(cle) for cle in ('id', 'date', 'methode', 'chemin', 'vue', 'statut', 'duree_ms', 'sql_nb', 'declencheur')}
+
+
+def chemin_capture(identifiant, type_fichier):
+    """Chemin d'un fichier de capture ; None si l'identifiant ou le type est invalide"""
+    if not FORMAT_ID.match(identifiant) or type_fichier not in EXTENSIONS:
+        return None
+    return os.path.join(settings.PROFILAGE_REPERTOIRE, identifiant + EXTENSIONS[type_fichier])
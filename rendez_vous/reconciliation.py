@@ -0,0 +1,116 @@
+"""
+Réconciliation avec le portail interne par empreintes hiérarchiques.
+
+Chaque rendez-vous a une empreinte de 64 bits calculée sur ses champs envoyés
+au portail (CHAMPS_EMPREINTE). Un créneau (date, heure) est résumé par le
+nombre de ses rendez-vous et le XOR de leurs empreintes, un jour par le XOR de
+ses créneaux : le résumé ne dépend pas de l'ordre et les deux côtés le
+calculent chacun sur leurs données. On compare les jours, on ne descend que
+dans les jours différents, puis dans leurs créneaux différents, et seuls les
+rendez-vous de ces créneaux sont comparés un à un (GET /api/reconciliation/).
+
+Le portail interne expose le même endpoint sur ses données ; la commande
+`portal_stub` en simule un pour tester de bout en bout.
+"""
+import hashlib
+from collections import defaultdict
+from datetime import date, time
+
+from .models import RendezVous
+
+CHAMPS_EMPREINTE = (
+    'code_unique', 'cin', 'plaque_camion', 'numero_conteneur', 'type_conteneur',
+    'operation', 'sens_trafic', 'date_rdv', 'heure_rdv', 'statut',
+)
+
+
+def _texte(valeur):
+    if isinstance(valeur, date):
+        return valeur.isoformat()
+    if isinstance(valeur, time):
+        return valeur.strftime('%H:%M')
+    return '' if valeur is None else str(valeur)
+
+
+def empreinte_ligne(ligne):
+    """Empreinte (entier de 64 bits) d'un rendez-vous, dict ou payload du portail"""
+    canonique = '\x1f'.join(_texte(ligne.get(champ)) for champ in CHAMPS_EMPREINTE)
+    return int.from_bytes(hashlib.blake2b(canonique.encode(), digest_size=8).digest(), 'big')
+
+
+def _hex(empreinte):
+    return f'{empreinte:016x}'
+
+
+def resumer(lignes, date_rdv=None, heure_rdv=None):
+    """
+    Niveau de l'arbre demandé, sur des lignes déjà limitées à la période :
+    sans date, résumé par jour ; avec date, par créneau ; avec date et heure,
+    empreinte de chaque rendez-vous ({code_unique: empreinte}).
+    """
+    if date_rdv is not None and heure_rdv is not None:
+        return {'lignes': {_texte(ligne['code_unique']): _hex(empreinte_ligne(ligne)) for ligne in lignes}}
+    niveau = 'heure_rdv' if date_rdv is not None else 'date_rdv'
+    noeuds = defaultdict(lambda: [0, 0])
+    for ligne in lignes:
+        noeud = noeuds[_texte(ligne[niveau])]
+        noeud[0] += 1
+        noeud[1] ^= empreinte_ligne(ligne)
+    cle = 'creneaux' if date_rdv is not None else 'jours'
+    return {cle: {nom: {'n': n, 'empreinte': _hex(x)} for nom, (n, x) in sorted(noeuds.items())}}
+
+
+def lignes_locales(du=None, au=None, date_rdv=None, heure_rdv=None):
+    rendez_vous = RendezVous.objects.order_by()
+    if date_rdv is not None:
+        rendez_vous = rendez_vous.filter(date_rdv=date_rdv)
+        if heure_rdv is not None:
+            rendez_vous = rendez_vous.filter(heure_rdv=heure_rdv)
+    else:
+        rendez_vous = rendez_vous.filter(date_rdv__range=(du, au))
+    return rendez_vous.values(*CHAMPS_EMPREINTE).iterator(chunk_size=5000)
+
+
+def resume_local(du=None, au=None, date_rdv=None, heure_rdv=None):
+    return resumer(lignes_locales(du, au, date_rdv, heure_rdv), date_rdv, heure_rdv)
+
+
+def _differents(locaux, distants):
+    return sorted(nom for nom in locaux.keys() | distants.keys() if locaux.get(nom) != distants.get(nom))
+
+
+def comparer(local, distant, du, au):
+    """
+    Parcourt les deux arbres ; local et distant sont des fonctions
+    (du, au, date, heure) -> niveau de resumer(). Retourne les codes des
+    rendez-vous absents du portail, différents, ou présents seulement chez lui,
+    et le nombre de noeuds et de lignes échangés.
+    """
+    ecarts = {'manquants': [], 'perimes': [], 'en_trop': []}
+    echanges = {'jours': 0, 'creneaux': 0, 'lignes': 0}
+    jours_locaux, jours_distants = local(du, au, None, None)['jours'], distant(du, au, None, None)['jours']
+    echanges['jours'] = len(jours_distants)
+    for jour in _differents(jours_locaux, jours_distants):
+        jour_date = date.fromisoformat(jour)
+        creneaux_locaux = local(None, None, jour_date, None)['creneaux']
+        creneaux_distants = distant(None, None, jour_date, None)['creneaux']
+        echanges['creneaux'] += len(creneaux_distants)
+        for creneau in _differents(creneaux_locaux, creneaux_distants):
+            heure_rdv = time.fromisoformat(creneau)
+            lignes_loc = local(None, None, jour_date, heure_rdv)['lignes']
+            lignes_dist = distant(None, None, jour_date, heure_rdv)['lignes']
+            echanges['lignes'] += len(lignes_dist)
+            for code in _differents(lignes_loc, lignes_dist):
+                if code not in lignes_dist:
+                    ecarts['manquants'].append(code)
+                elif code not in lignes_loc:
+                    ecarts['en_trop'].append(code)
+                else:
+                    ecarts['perimes'].append(code)
+    # Rendez-vous déplacé : absent du portail à sa nouvelle date, en trop à l'ancienne
+    deplaces = set(ecarts['manquants']) & set(ecarts['en_trop'])
+    if deplaces:
+        ecarts['manquants'] = [code for code in ecarts['manquants'] if code not in deplaces]
+        ecarts['en_trop'] = [code for code in ecarts['en_trop'] if code not in deplaces]
+        ecarts['perimes'] = sorted({*ecarts['perimes'], *deplaces})
+    return ecarts, echanges
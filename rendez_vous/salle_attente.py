@@ -0,0 +1,268 @@
+"""
+Salle d'attente virtuelle devant les réservations (pics d'ouverture des créneaux).
+
+Au plus SALLE_ATTENTE_CAPACITE requêtes protégées s'exécutent à la fois sur la
+machine. Au-delà, la requête reçoit un 503 avec un ticket signé (ordre
+d'arrivée, comme les tickets de boulangerie) et sa position. Le client consulte
+GET /api/file-attente/?jeton=... ; à son tour, une place lui est réservée
+SALLE_ATTENTE_DELAI_PASSAGE secondes. Il rejoue alors sa requête avec l'en-tête
+X-Salle-Attente, utilisable une seule fois. Un ticket qui n'est plus consulté
+depuis SALLE_ATTENTE_ABANDON secondes est sauté. File pleine (SALLE_ATTENTE_TAILLE_FILE) : 503 sans ticket.
+
+L'état (compteurs, baux des places, dernière consultation de chaque ticket)
+est dans un fichier projeté en mémoire et partagé par les workers, verrouillé
+par fcntl comme les seaux de limitation.py. Chaque place est un bail à
+échéance : un worker tué en pleine requête ne la bloque pas au-delà de
+SALLE_ATTENTE_DUREE_MAX. L'échéance identifie aussi le bail : une requête plus
+longue que SALLE_ATTENTE_DUREE_MAX ne libère pas, en sortant, la place déjà
+redonnée à une autre.
+"""
+import fcntl
+import math
+import mmap
+import os
+import struct
+import threading
+import time
+from dataclasses import dataclass
+from functools import wraps
+
+from asgiref.sync import iscoroutinefunction
+from django.conf import settings
+from django.core import signing
+from django.http import JsonResponse
+
+SEL_JETON = 'rendez_vous.salle_attente'
+EN_TETE_PASSAGE = 'X-Salle-Attente'
+
+ENTETE = struct.Struct('<qqd')   # prochain ticket, frontière (premier ticket non traité), durée moyenne
+BAIL = struct.Struct('<qd')      # ticket (-1 : entrée directe), échéance (0 : libre)
+TICKET = struct.Struct('<qd')    # ticket, dernière consultation
+LISSAGE = 0.1
+CONSULTATION_MIN = 0.2
+
+
+@dataclass
+class Decision:
+    entree: int = None            # indice de place si la requête passe
+    bail: float = None            # échéance du bail de cette place, à rendre à la sortie
+    ticket: int = None
+    position: int = None
+    attente: float = None         # secondes estimées (Retry-After)
+
+
+class SalleAttente:
+    def __init__(self, chemin, capacite, taille_file):
+        self.chemin = chemin
+        self.capacite = capacite
+        self.taille_file = taille_file
+        self._verrou = threading.Lock()
+        self._fd = None
+        self._carte = None
+
+    def _ouvrir(self):
+        taille = ENTETE.size + self.capacite * BAIL.size + self.taille_file * TICKET.size
+        fd = os.open(self.chemin, os.O_RDWR | os.O_CREAT, 0o600)
+        if os.fstat(fd).st_size < taille:
+            os.ftruncate(fd, taille)
+        self._carte = mmap.mmap(fd, taille)
+        self._fd = fd
+
+    def _transaction(self, operation, *args):
+        with self._verrou:
+            if self._carte is None:
+                self._ouvrir()
+            fcntl.lockf(self._fd, fcntl.LOCK_EX)
+            try:
+                return operation(time.time(), *args)
+            finally:
+                fcntl.lockf(self._fd, fcntl.LOCK_UN)
+
+    # Accès au fichier (sous verrou)
+
+    def _bail(self, place):
+        return BAIL.unpack_from(self._carte, ENTETE.size + place * BAIL.size)
+
+    def _poser_bail(self, place, ticket, echeance):
+        BAIL.pack_into(self._carte, ENTETE.size + place * BAIL.size, ticket, echeance)
+
+    def _position_ticket(self, ticket):
+        return ENTETE.size + self.capacite * BAIL.size + (ticket % self.taille_file) * TICKET.size
+
+    def _places_libres(self, maintenant):
+        return [place for place in range(self.capacite) if self._bail(place)[1] < maintenant]
+
+    def _avancer(self, maintenant):
+        """Réserve les places libres aux tickets suivants encore présents ; retourne l'en-tête"""
+        prochain, frontiere, duree = ENTETE.unpack_from(self._carte, 0)
+        libres = self._places_libres(maintenant)
+        while libres and frontiere < prochain:
+            ticket, frontiere = frontiere, frontiere + 1
+            numero, vu = TICKET.unpack_from(self._carte, self._position_ticket(ticket))
+            if numero != ticket or vu < maintenant - settings.SALLE_ATTENTE_ABANDON:
+                continue  # client parti
+            self._poser_bail(libres.pop(), ticket, maintenant + settings.SALLE_ATTENTE_DELAI_PASSAGE)
+        ENTETE.pack_into(self._carte, 0, prochain, frontiere, duree)
+        return prochain, frontiere, duree, libres
+
+    def _estimation(self, position, duree):
+        return position * (duree or 1.0) / self.capacite
+
+    def _entrer(self, maintenant, passage):
+        prochain, frontiere, duree, libres = self._avancer(maintenant)
+        if passage is not None:
+            ticket, place = passage
+            if 0 <= place < self.capacite and self._bail(place)[0] == ticket and self._bail(place)[1] >= maintenant:
+                # Ticket consommé : rejoué, le même jeton ne donne plus cette place
+                # et la requête est traitée comme une nouvelle arrivée
+                return self._occuper(maintenant, place)
+        if libres and frontiere == prochain:
+            # Personne n'attend : entrée directe
+            return self._occuper(maintenant, libres[0])
+        position = prochain - frontiere + 1
+        if position > self.taille_file:
+            return Decision(attente=self._estimation(position, duree))
+        TICKET.pack_into(self._carte, self._position_ticket(prochain), prochain, maintenant)
+        ENTETE.pack_into(self._carte, 0, prochain + 1, frontiere, duree)
+        return Decision(ticket=prochain, position=position, attente=self._estimation(position, duree))
+
+    def _occuper(self, maintenant, place):
+        echeance = maintenant + settings.SALLE_ATTENTE_DUREE_MAX
+        self._poser_bail(place, -1, echeance)
+        return Decision(entree=place, bail=echeance)
+
+    def _sortir(self, maintenant, place, bail, ecoule):
+        if self._bail(place) == (-1, bail):
+            self._poser_bail(place, 0, 0.0)
+        prochain, frontiere, duree = ENTETE.unpack_from(self._carte, 0)
+        duree = ecoule if not duree else duree + LISSAGE * (ecoule - duree)
+        ENTETE.pack_into(self._carte, 0, prochain, frontiere, duree)
+        self._avancer(maintenant)
+
+    def _consulter(self, maintenant, ticket):
+        prochain, frontiere, duree, _ = self._avancer(maintenant)
+        if ticket >= frontiere:
+            if ticket < prochain:
+                TICKET.pack_into(self._carte, self._position_ticket(ticket), ticket, maintenant)
+            position = ticket - frontiere + 1
+            return Decision(ticket=ticket, position=position, attente=self._estimation(position, duree))
+        for place in range(self.capacite):
+            numero, echeance = self._bail(place)
+            if numero == ticket and echeance >= maintenant:
+                return Decision(ticket=ticket, entree=place, position=0)
+        return Decision(ticket=ticket)  # passé son tour
+
+    # API
+
+    def entrer(self, passage=None):
+        return self._transaction(self._entrer, passage)
+
+    def sortir(self, place, bail, ecoule):
+        """Libère la place si le bail `bail` (Decision.bail) la tient encore"""
+        self._transaction(self._sortir, place, bail, ecoule)
+
+    def consulter(self, ticket):
+        return self._transaction(self._consulter, ticket)
+
+
+_salle = None
+
+
+def salle():
+    global _salle
+    if _salle is None:
+        chemin = settings.SALLE_ATTENTE_FICHIER or os.path.join(settings.ETAT_REPERTOIRE, 'salle-attente.bin')
+        os.makedirs(os.path.dirname(chemin), 0o700, exist_ok=True)
+        _salle = SalleAttente(chemin, settings.SALLE_ATTENTE_CAPACITE, settings.SALLE_ATTENTE_TAILLE_FILE)
+    return _salle
+
+
+def jeton_ticket(ticket):
+    return signing.dumps({'t': ticket}, salt=SEL_JETON)
+
+
+def jeton_passage(ticket, place):
+    return signing.dumps({'t': ticket, 'p': place}, salt=SEL_JETON + '.passage')
+
+
+def lire_ticket(jeton):
+    try:
+        return signing.loads(jeton, salt=SEL_JETON, max_age=settings.SALLE_ATTENTE_DUREE_TICKET)['t']
+    except (signing.BadSignature, KeyError, TypeError):
+        return None
+
+
+def lire_passage(jeton):
+    try:
+        donnees = signing.loads(jeton, salt=SEL_JETON + '.passage', max_age=settings.SALLE_ATTENTE_DELAI_PASSAGE)
+        return donnees['t'], donnees['p']
+    except (signing.BadSignature, KeyError, TypeError):
+        return None
+
+
+def etat_file(decision):
+    """
+    Position et attente estimée d'un ticket. `consulter_dans` (secondes) espace
+    les consultations selon la position : fréquentes en tête de file pour
+    reprendre vite une place libérée, rares au-delà pour ne pas charger le serveur.
+    """
+    return {
+        'position': decision.position,
+        'attente_estimee': math.ceil(decision.attente),
+        'consulter_dans': round(min(settings.SALLE_ATTENTE_INTERVALLE,
+                                    max(CONSULTATION_MIN, decision.attente / 2)), 2),
+    }
+
+
+def _refus(decision):
+    """503 d'une requête mise en file, ou refusée sans ticket si la file est pleine"""
+    if decision.ticket is None:
+        response = JsonResponse({'error': "Service saturé, réessayez dans quelques instants"}, status=503)
+        response['Retry-After'] = str(max(1, math.ceil(decision.attente)))
+        return response
+    etat = etat_file(decision)
+    response = JsonResponse({'file_attente': {'jeton': jeton_ticket(decision.ticket), **etat}}, status=503)
+    response['Retry-After'] = str(math.ceil(etat['consulter_dans']))
+    return response
+
+
+def file_attente(methode):
+    """
+    Décorateur de vue (méthode DRF ou vue asynchrone) : la requête ne s'exécute
+    que si elle obtient une place, sinon 503 avec ticket (_refus).
+    """
+    def admettre(request):
+        if not settings.SALLE_ATTENTE_ACTIVE:
+            return None, None
+        jeton = request.headers.get(EN_TETE_PASSAGE)
+        decision = salle().entrer(lire_passage(jeton) if jeton else None)
+        if decision.entree is None:
+            return None, _refus(decision)
+        return decision, None
+
+    if iscoroutinefunction(methode):
+        @wraps(methode)
+        async def enveloppe_async(self, request, *args, **kwargs):
+            admis, refus = admettre(request)
+            if refus is not None:
+                return refus
+            debut = time.perf_counter()
+            try:
+                return await methode(self, request, *args, **kwargs)
+            finally:
+                if admis is not None:
+                    salle().sortir(admis.entree, admis.bail, time.perf_counter() - debut)
+        return enveloppe_async
+
+    @wraps(methode)
+    def enveloppe(self, request, *args, **kwargs):
+        admis, refus = admettre(request)
+        if refus is not None:
+            return refus
+        debut = time.perf_counter()
+        try:
+            return methode(self, request, *args, **kwargs)
+        finally:
+            if admis is not None:
+                salle().sortir(admis.entree, admis.bail, time.perf_counter() - debut)
+    return enveloppe
@@ -1,9 +1,11 @@
 from rest_framework import serializers
+from .instrumentation import SerialisationMesuree
+from .metriques import CONFLITS_REJETES
 from .models import RendezVous
 from datetime import datetime, timedelta
 from django.utils import timezone
 
-class RendezVousSerializer(serializers.ModelSerializer):
+class RendezVousSerializer(SerialisationMesuree, serializers.ModelSerializer):
     qr_code_url = serializers.SerializerMethodField()
     intervalle_rdv = serializers.SerializerMethodField()
     description_operation = serializers.SerializerMethodField()
@@ -19,12 +21,7 @@ class RendezVousSerializer(serializers.ModelSerializer):
         read_only_fields = ['id', 'code_unique', 'qr_code_url', 'statut', 'date_creation']
     
     def get_qr_code_url(self, obj):
-        if obj.qr_code:
-            request = self.context.get('request')
-            if request:
-                return request.build_absolute_uri(obj.qr_code.url)
-            return obj.qr_code.url
-        return None
+        return obj.get_qr_code_url(self.context.get('request'))
     
     def get_intervalle_rdv(self, obj):
         return obj.get_intervalle_rdv()
@@ -131,6 +128,7 @@ class RendezVousCreateSerializer(serializers.ModelSerializer):
                 
                 # Vérifier s'il y a chevauchement
                 if (heure_debut_nouveau < heure_fin_conflit and heure_fin_nouveau > heure_debut_conflit):
+                    CONFLITS_REJETES.inc()
                     raise serializers.ValidationError(
                         f"Conflit de rendez-vous : ce camion a déjà un rendez-vous le {date_rdv} "
                         f"entre {heure_debut_conflit.strftime('%H:%M')} et {heure_fin_conflit.strftime('%H:%M')}"
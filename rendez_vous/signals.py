@@ -0,0 +1,103 @@
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_delete, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+
+from .authentication import invalider_utilisateur, normaliser_email
+from .instrumentation import chronometrer_sql
+from .metriques import RESERVATIONS_CREEES
+from . import fichiers, statistiques, synchro
+from .models import RendezVous, rendez_vous_supprimes, statuts_modifies
+
+
+@receiver(pre_save, sender=User)
+def normaliser_email_utilisateur(sender, instance, **kwargs):
+    """Admin, createsuperuser, shell... : l'email est stocké sous la forme cherchée à la connexion"""
+    instance.email = normaliser_email(instance.email)
+
+
+@receiver(post_save, sender=User)
+def invalider_cache_utilisateur(sender, instance, **kwargs):
+    """Mot de passe changé, compte désactivé... : le cache JWT doit être relu"""
+    invalider_utilisateur(instance.pk)
+
+
+@receiver(post_save, sender=RendezVous)
+def compter_reservation(sender, instance, created, **kwargs):
+    if created:
+        RESERVATIONS_CREEES.labels(instance.operation, instance.sens_trafic).inc()
+
+
+@receiver(pre_save, sender=RendezVous)
+def memoriser_cle_statistique(sender, instance, update_fields=None, **kwargs):
+    statistiques.memoriser_cle(instance, update_fields)
+
+
+@receiver(pre_delete, sender=RendezVous)
+def memoriser_cle_suppression(sender, instance, **kwargs):
+    statistiques.memoriser_cle(instance)
+
+
+@receiver(post_save, sender=RendezVous)
+def statistiques_enregistrement(sender, instance, created, update_fields, **kwargs):
+    statistiques.apres_enregistrement(instance, created, update_fields)
+
+
+@receiver(post_delete, sender=RendezVous)
+def statistiques_suppression(sender, instance, **kwargs):
+    statistiques.apres_suppression(instance)
+
+
+@receiver(statuts_modifies, sender=RendezVous)
+def statistiques_changement_statut(sender, anciens_statuts, nouveau_statut, **kwargs):
+    statistiques.apres_changement_statut(anciens_statuts, nouveau_statut)
+
+
+@receiver(post_save, sender=RendezVous)
+def synchro_enregistrement(sender, instance, created, update_fields, **kwargs):
+    synchro.apres_enregistrement(instance, created, update_fields)
+
+
+@receiver(post_delete, sender=RendezVous)
+def synchro_suppression(sender, instance, **kwargs):
+    synchro.apres_suppression(instance)
+
+
+@receiver(post_delete, sender=RendezVous)
+def supprimer_qr_code(sender, instance, **kwargs):
+    """Le PNG du rendez-vous supprimé est retiré en arrière-plan après le commit"""
+    if instance.qr_code:
+        fichiers.supprimer_apres_commit(instance.qr_code.storage, [instance.qr_code.name])
+
+
+@receiver(statuts_modifies, sender=RendezVous)
+def synchro_changement_statut(sender, anciens_statuts, nouveau_statut, **kwargs):
+    synchro.apres_changement_statut(anciens_statuts)
+
+
+@receiver(rendez_vous_supprimes, sender=RendezVous)
+def suppression_en_masse(sender, rendez_vous, **kwargs):
+    """Un lot de RendezVousQuerySet.supprimer : compteurs, journal et PNG en une fois"""
+    statistiques.apres_suppression_en_masse(rendez_vous)
+    synchro.apres_suppression_en_masse(rendez_vous)
+    noms = [rdv.qr_code.name for rdv in rendez_vous if rdv.qr_code]
+    if noms:
+        fichiers.supprimer_apres_commit(RendezVous._meta.get_field('qr_code').storage, noms)
+
+
+@receiver(connection_created)
+def configurer_sqlite(sender, connection, **kwargs):
+    """Applique settings.SQLITE_PRAGMAS aux nouvelles connexions SQLite"""
+    if connection.vendor != 'sqlite':
+        return
+    with connection.cursor() as cursor:
+        for pragma, valeur in settings.SQLITE_PRAGMAS.items():
+            cursor.execute(f'PRAGMA {pragma} = {valeur}')
+
+
+@receiver(connection_created)
+def instrumenter_connexion(sender, connection, **kwargs):
+    """Chronomètre les requêtes SQL pour InstrumentationMiddleware"""
+    if chronometrer_sql not in connection.execute_wrappers:
+        connection.execute_wrappers.append(chronometrer_sql)
@@ -0,0 +1,154 @@
+"""
+Compteurs de rendez-vous par date, créneau, opération, sens, type et statut.
+
+StatistiqueRendezVous est ajustée dans la transaction de chaque écriture :
+création et modification (RendezVous.save l'ouvre), suppression (celle du
+Collector de Django), changements de statut et suppressions en masse
+(RendezVousQuerySet.changer_statut et .supprimer, actions de l'admin). Ce qui contourne les
+signaux (bulk_create, update() direct, SQL brut, seed_rendezvous) se rattrape
+avec `manage.py rebuild_stats`.
+"""
+from collections import Counter
+from functools import partial
+
+from django.db import IntegrityError, connection, transaction
+from django.db.models import Count, F
+
+from .diffusion import diffuseur
+from .models import DIMENSIONS_STATISTIQUES, STATUTS_ACTIFS, RendezVous, StatistiqueRendezVous
+
+
+def cle(rendez_vous):
+    return tuple(getattr(rendez_vous, champ) for champ in DIMENSIONS_STATISTIQUES)
+
+
+def ajuster(deltas):
+    """
+    Applique {clé: variation}, en créant les compteurs absents ; l'occupation
+    des créneaux touchés est diffusée au commit.
+    """
+    for cle_stat, delta in deltas.items():
+        if not delta:
+            continue
+        filtre = dict(zip(DIMENSIONS_STATISTIQUES, cle_stat))
+        compteur = StatistiqueRendezVous.objects.filter(**filtre)
+        if compteur.update(nombre=F('nombre') + delta):
+            continue
+        try:
+            with transaction.atomic():
+                StatistiqueRendezVous.objects.create(**filtre, nombre=delta)
+        except IntegrityError:
+            # Créé entre-temps par une transaction concurrente
+            compteur.update(nombre=F('nombre') + delta)
+
+    creneaux = {cle_stat[:2] for cle_stat, delta in deltas.items() if delta and cle_stat[-1] in STATUTS_ACTIFS}
+    if creneaux:
+        # Hors transaction, exécuté tout de suite : donc après les mises à jour
+        transaction.on_commit(partial(diffuseur.publier, creneaux), robust=True)
+
+
+def _touche_la_cle(update_fields):
+    return update_fields is None or not update_fields.isdisjoint(DIMENSIONS_STATISTIQUES)
+
+
+def memoriser_cle(rendez_vous, update_fields=None):
+    """
+    pre_save / pre_delete : clé actuellement en base, relue plutôt que prise sur
+    l'instance, qui a pu être chargée avant un changer_statut.
+    """
+    rendez_vous._cle_statistique = None
+    if rendez_vous._state.adding or not _touche_la_cle(update_fields):
+        return
+    lecture = RendezVous.objects.filter(pk=rendez_vous.pk)
+    if connection.in_atomic_block:
+        # Ligne verrouillée jusqu'à la fin de la transaction (PostgreSQL)
+        lecture = lecture.select_for_update()
+    rendez_vous._cle_statistique = lecture.values_list(*DIMENSIONS_STATISTIQUES).first()
+
+
+def apres_enregistrement(rendez_vous, created, update_fields):
+    if not _touche_la_cle(update_fields):
+        return
+    ancienne = None if created else rendez_vous._cle_statistique
+    nouvelle = cle(rendez_vous)
+    if ancienne is not None and update_fields is not None:
+        # Seuls les champs listés ont été écrits
+        nouvelle = tuple(
+            valeur if champ in update_fields else avant
+            for champ, avant, valeur in zip(DIMENSIONS_STATISTIQUES, ancienne, nouvelle)
+        )
+    if nouvelle != ancienne:
+        deltas = Counter({nouvelle: 1})
+        if ancienne is not None:
+            deltas[ancienne] -= 1
+        ajuster(deltas)
+
+
+def apres_suppression(rendez_vous):
+    if rendez_vous._cle_statistique is not None:
+        ajuster({rendez_vous._cle_statistique: -1})
+
+
+def apres_suppression_en_masse(rendez_vous):
+    """Un lot de RendezVousQuerySet.supprimer : un ajustement par compteur touché"""
+    ajuster(Counter({cle_stat: -nombre for cle_stat, nombre in Counter(map(cle, rendez_vous)).items()}))
+
+
+def apres_changement_statut(anciens_statuts, nouveau_statut):
+    """Un lot de changer_statut : une lecture des clés, un ajustement par compteur touché"""
+    deltas = Counter()
+    lignes = RendezVous.objects.filter(pk__in=anciens_statuts).order_by().values_list(
+        'pk', 'date_rdv', 'heure_rdv', 'operation', 'sens_trafic', 'type_conteneur'
+    )
+    for pk, *reste in lignes:
+        deltas[(*reste, anciens_statuts[pk])] -= 1
+        deltas[(*reste, nouveau_statut)] += 1
+    ajuster(deltas)
+
+
+def _periode(queryset, du, au):
+    if du:
+        queryset = queryset.filter(date_rdv__gte=du)
+    if au:
+        queryset = queryset.filter(date_rdv__lte=au)
+    return queryset
+
+
+def compter_depuis_rendez_vous(du=None, au=None):
+    """Compteurs attendus, recalculés sur RendezVous : {clé: nombre}"""
+    lignes = _periode(RendezVous.objects.order_by(), du, au).values_list(
+        *DIMENSIONS_STATISTIQUES).annotate(nombre=Count('id'))
+    return {tuple(ligne[:-1]): ligne[-1] for ligne in lignes}
+
+
+def ecarts(du=None, au=None):
+    """Compteurs qui ont dérivé : [(clé, attendu, enregistré)]"""
+    attendus = compter_depuis_rendez_vous(du, au)
+    enregistres = {
+        tuple(ligne[:-1]): ligne[-1]
+        for ligne in _periode(StatistiqueRendezVous.objects.all(), du, au).values_list(
+            *DIMENSIONS_STATISTIQUES, 'nombre')
+    }
+    return sorted(
+        (cle_stat, attendus.get(cle_stat, 0), enregistres.get(cle_stat, 0))
+        for cle_stat in attendus.keys() | enregistres.keys()
+        if attendus.get(cle_stat, 0) != enregistres.get(cle_stat, 0)
+    )
+
+
+def reconstruire(du=None, au=None):
+    """Recalcule les compteurs (tous, ou ceux de la période) ; retourne le nombre de lignes"""
+    with transaction.atomic():
+        if connection.vendor == 'postgresql':
+            # Gèle les écritures de rendez-vous pendant le recalcul : un ajustement
+            # concurrent serait sinon perdu ou compté deux fois. (SQLite n'a qu'un
+            # écrivain à la fois.)
+            with connection.cursor() as cursor:
+                cursor.execute(f'LOCK TABLE {connection.ops.quote_name(RendezVous._meta.db_table)} IN SHARE MODE')
+        _periode(StatistiqueRendezVous.objects.all(), du, au).delete()
+        lignes = [
+            StatistiqueRendezVous(**dict(zip(DIMENSIONS_STATISTIQUES, cle_stat)), nombre=nombre)
+            for cle_stat, nombre in compter_depuis_rendez_vous(du, au).items()
+        ]
+        StatistiqueRendezVous.objects.bulk_create(lignes, batch_size=1000)
+    return len(lignes)
@@ -0,0 +1,115 @@
+"""
+Journal des changements de rendez-vous pour le portail interne.
+
+Chaque création, modification, changement de statut (y compris en masse) et
+suppression ajoute un EvenementSynchro dans la transaction qui l'a causé
+(ouverte par RendezVous.save, par le Collector de Django pour une suppression,
+par lot dans changer_statut et supprimer) : un événement existe si et seulement si le
+changement est validé. Le portail lit
+le journal par lots ordonnés (/api/sync/changes/?since=<sequence>) et reprend
+après une coupure à partir de la dernière séquence traitée.
+
+Sous PostgreSQL une séquence plus petite peut être validée après une plus
+grande (ordre des transactions et des séquences indépendants). Une séquence
+manquante est donc soit encore en cours, soit annulée : la lecture s'arrête au
+premier trou, sauf si l'événement qui le suit a plus de SYNCHRO_DELAI_TROU
+secondes (plus que la plus longue transaction qui journalise), pour qu'un
+curseur ne saute jamais un événement validé plus tard. Un trou en tête de
+lecture (since=0) n'est pas détecté : il est confondu avec une purge.
+SQLite n'a qu'un écrivain à la fois, sans trou en cours.
+
+Comme pour les statistiques, ce qui contourne les signaux (bulk_create,
+update() direct, seed_rendezvous) n'est pas journalisé.
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.utils import timezone
+
+from .models import DIMENSIONS_STATISTIQUES, EvenementSynchro, RendezVous
+
+CHAMPS_SYNCHRO = (
+    'code_unique', 'cin', 'plaque_camion', 'numero_conteneur', 'sens_trafic', 'type_conteneur',
+    'operation', 'date_rdv', 'heure_rdv', 'statut', 'user_id', 'date_creation', 'date_modification',
+)
+# Champs dont l'écriture seule (update_fields) ne produit pas d'événement
+CHAMPS_IGNORES = {'qr_code'}
+
+
+def etat(rendez_vous):
+    return {champ: getattr(rendez_vous, champ) for champ in CHAMPS_SYNCHRO}
+
+
+def journaliser(evenements):
+    """Ajoute [(type, rendez_vous_id, donnees)] au journal"""
+    EvenementSynchro.objects.bulk_create([
+        EvenementSynchro(type=type_evenement, rendez_vous_id=pk, donnees=donnees)
+        for type_evenement, pk, donnees in evenements
+    ])
+
+
+def apres_enregistrement(rendez_vous, created, update_fields):
+    if update_fields is not None and update_fields <= CHAMPS_IGNORES:
+        return
+    if created:
+        type_evenement = 'creation'
+    else:
+        # Clé (dimensions + statut) relue avant l'écriture par statistiques.memoriser_cle
+        ancienne = rendez_vous._cle_statistique
+        nouvelle = tuple(getattr(rendez_vous, champ) for champ in DIMENSIONS_STATISTIQUES)
+        statut_seul = ancienne is not None and ancienne[:-1] == nouvelle[:-1] and ancienne[-1] != nouvelle[-1]
+        type_evenement = 'statut' if statut_seul else 'modification'
+    journaliser([(type_evenement, rendez_vous.pk, etat(rendez_vous))])
+
+
+def apres_suppression(rendez_vous):
+    journaliser([('suppression', rendez_vous.pk, etat(rendez_vous))])
+
+
+def apres_suppression_en_masse(rendez_vous):
+    """Un lot de RendezVousQuerySet.supprimer : un événement par rendez-vous, une insertion"""
+    journaliser([('suppression', rdv.pk, etat(rdv)) for rdv in rendez_vous])
+
+
+def apres_changement_statut(anciens_statuts):
+    """Un lot de changer_statut : un événement 'statut' par rendez-vous, une lecture"""
+    lignes = RendezVous.objects.filter(pk__in=anciens_statuts).order_by('pk').values('pk', *CHAMPS_SYNCHRO)
+    journaliser([('statut', ligne.pop('pk'), ligne) for ligne in lignes])
+
+
+def plus_ancienne_sequence():
+    return EvenementSynchro.objects.order_by('sequence').values_list('sequence', flat=True).first()
+
+
+def lire(depuis, limite):
+    """Événements de séquence > depuis, dans l'ordre, sans trou récent : (liste, suite)"""
+    evenements = list(
+        EvenementSynchro.objects.filter(sequence__gt=depuis).order_by('sequence')
+        .values('sequence', 'type', 'rendez_vous_id', 'date', 'donnees')[:limite + 1]
+    )
+    suite = len(evenements) > limite
+    del evenements[limite:]
+    recent = timezone.now() - timedelta(seconds=settings.SYNCHRO_DELAI_TROU)
+    attendue = depuis + 1 if depuis else None
+    for i, evenement in enumerate(evenements):
+        if attendue is not None and evenement['sequence'] != attendue and evenement['date'] > recent:
+            # Séquence manquante peut-être pas encore validée : au prochain appel
+            del evenements[i:]
+            suite = True
+            break
+        attendue = evenement['sequence'] + 1
+    return evenements, suite
+
+
+def purger(jours):
+    """
+    Supprime les événements de plus de `jours` jours, sauf le dernier : sous
+    SQLite la séquence repartirait sinon de 1. Retourne le nombre supprimé.
+    """
+    dernier = EvenementSynchro.objects.order_by('-sequence').values_list('sequence', flat=True).first()
+    if dernier is None:
+        return 0
+    supprimes, _ = EvenementSynchro.objects.filter(
+        date__lt=timezone.now() - timedelta(days=jours), sequence__lt=dernier
+    ).delete()
+    return supprimes
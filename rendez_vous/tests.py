@@ -1,3 +1,1170 @@
-from django.test import TestCase
+import io
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import uuid
+from datetime import date, datetime, time, timedelta
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import async_to_sync, sync_to_async
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import caches
+from django.core.management import call_command
+from django.db import DatabaseError, IntegrityError, connection, transaction
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+from django.utils.cache import has_vary_header
+from rest_framework.test import APIClient
+
+from . import import_comptes, limitation, statistiques, synchro
+from .authentication import generer_tokens
+from .creneaux import masque_chevauchements, masque_commences, prochains_creneaux
+from .diffusion import diffuseur
+from .fichiers import attendre_suppressions
+from .import_comptes import importer_comptes
+from .management.commands._bench import profiler_imports
+from .models import CleIdempotence, EvenementSynchro, Profil, RendezVous, StatistiqueRendezVous
+from .profilage import creer_jeton, lire_resume, lister_identifiants
+from .reconciliation import comparer, resume_local, resumer
+from .salle_attente import SalleAttente
+from .views import RendezVousViewSet
+
+
+# Cache propre au processus de test : les entrées ne vont pas dans le cache partagé
+@override_settings(CACHES={**settings.CACHES, 'authentification': {
+    'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'tests-authentification',
+}})
+class JWTAuthenticationCacheTests(TestCase):
+    def setUp(self):
+        caches['authentification'].clear()
+        self.user = User.objects.create_user(
+            username='chauffeur@test.ma', email='chauffeur@test.ma', password='MotDePasse-123'
+        )
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {generer_tokens(self.user)['access']}")
+
+    def test_requete_authentifiee_sans_lecture_de_auth_user(self):
+        self.client.get('/api/mes-rendez-vous/')  # remplit le cache utilisateur
+        # Seule la liste des rendez-vous est lue
+        with self.assertNumQueries(1):
+            response = self.client.get('/api/mes-rendez-vous/')
+        self.assertEqual(response.status_code, 200)
+
+    def test_changement_de_mot_de_passe_revoque_les_tokens(self):
+        self.client.get('/api/mes-rendez-vous/')
+        response = self.client.post('/api/auth/change-password/', {
+            'old_password': 'MotDePasse-123',
+            'new_password': 'Nouveau-456',
+            'new_password_confirm': 'Nouveau-456',
+        }, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.client.get('/api/mes-rendez-vous/').status_code, 401)
+
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {response.data['access']}")
+        self.assertEqual(self.client.get('/api/mes-rendez-vous/').status_code, 200)
+
+    def test_desactivation_invalide_le_cache(self):
+        self.client.get('/api/mes-rendez-vous/')
+        self.user.is_active = False
+        self.user.save()
+        self.assertEqual(self.client.get('/api/mes-rendez-vous/').status_code, 401)
+
+
+class CacheAuthentificationPartageTests(SimpleTestCase):
+    """Une invalidation faite par un worker doit valoir pour les autres processus"""
+
+    def test_cache_partage_entre_processus(self):
+        # Configuration par défaut (fichiers), dans un répertoire temporaire plutôt que le vrai cache
+        with tempfile.TemporaryDirectory() as repertoire, override_settings(CACHES={
+            **settings.CACHES,
+            'authentification': {
+                'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache', 'LOCATION': repertoire,
+            },
+        }):
+            cache = caches['authentification']
+            cle = f'test-partage:{uuid.uuid4().hex}'
+            cache.set(cle, 'ecrit par le parent', 60)
+            autre_worker = subprocess.run([sys.executable, '-c', (
+                'import django; django.setup()\n'
+                'from django.core.cache import caches\n'
+                f'print(caches["authentification"].get({cle!r}))\n'
+                f'caches["authentification"].delete({cle!r})'
+            )], cwd=settings.BASE_DIR, capture_output=True, text=True, check=True, env={
+                **os.environ, 'CACHE_AUTHENTIFICATION_URL': '', 'CACHE_AUTHENTIFICATION_REPERTOIRE': repertoire,
+            })
+            self.assertEqual(autre_worker.stdout.strip(), 'ecrit par le parent')
+            self.assertIsNone(cache.get(cle))
+            self.assertEqual(os.listdir(repertoire), [])
+
+    def test_emplacement_par_defaut_hors_du_code(self):
+        env = {cle: valeur for cle, valeur in os.environ.items() if not cle.startswith('CACHE_AUTHENTIFICATION')}
+        worker = subprocess.run([sys.executable, '-c', (
+            'from django.conf import settings\n'
+            'print(settings.CACHES["authentification"]["LOCATION"])'
+        )], cwd=settings.BASE_DIR, env=env, capture_output=True, text=True, check=True)
+        emplacement = os.path.realpath(worker.stdout.strip())
+        self.assertFalse(emplacement.startswith(os.path.realpath(settings.BASE_DIR) + os.sep))
+
+
+class TempsImportTests(SimpleTestCase):
+    """django.setup() est payé par chaque worker, commande manage.py et lancement des tests"""
+    # Dépendances chargées à leur premier usage seulement (rendu QR, envoi au portail...)
+    # Le budget en temps est vérifié par `bench_startup --budget-ms`, pas ici
+    IMPORTS_DIFFERES = {'qrcode', 'PIL', 'httpx', 'numpy'}
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.imports = profiler_imports('import django; django.setup()')
+
+    def test_dependances_lourdes_differees(self):
+        charges = {module.split('.')[0] for _, module, _, _ in self.imports}
+        self.assertFalse(charges & self.IMPORTS_DIFFERES)
+
+
+class NormalisationEmailTests(TestCase):
+    def test_email_normalise_hors_api(self):
+        # Comme createsuperuser ou le formulaire de l'admin : sans passer par les serializers
+        user = User.objects.create_superuser('admin', email='  Admin@Port.MA ', password='MotDePasse-123')
+        user.refresh_from_db()
+        self.assertEqual(user.email, 'admin@port.ma')
+
+        response = APIClient().post('/api/auth/login/', {
+            'email': 'ADMIN@port.ma', 'password': 'MotDePasse-123',
+        }, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('access', response.json())
+
+
+class ImportComptesTests(TestCase):
+    def test_username_deja_pris_par_un_autre_compte(self):
+        # Username égal à l'email du roster, mais compte sans email
+        User.objects.create_user(username='transport@atlas.ma', email='', password='x')
+        rapport = importer_comptes([
+            {'email': 'Transport@Atlas.ma', 'password': 'MotDePasse-123'},
+            {'email': 'nouveau@atlas.ma', 'password': 'MotDePasse-123'},
+        ], processus=1)
+        self.assertEqual([ligne['statut'] for ligne in rapport['lignes']], ['existant', 'cree'])
+
+    def test_mot_de_passe_non_textuel_refuse(self):
+        rapport = importer_comptes([
+            {'email': 'a@atlas.ma', 'password': 123456},
+            {'email': 'b@atlas.ma', 'password': ['x']},
+            {'email': 42, 'password': 'MotDePasse-123'},
+        ], processus=2)
+        self.assertEqual(rapport['erreurs'], 3)
+        self.assertFalse(User.objects.exists())
+
+    @override_settings(LIMITATION_ACTIVE=False)
+    def test_champs_non_textuels_en_erreur_de_ligne(self):
+        admin = User.objects.create_superuser('admin', email='admin@port.ma', password='x')
+        client = APIClient()
+        client.force_authenticate(admin)
+        response = client.post('/api/comptes/import/', {'comptes': [
+            {'email': 'a@atlas.ma', 'password': 'MotDePasse-123', 'first_name': 12},
+            {'email': 'b@atlas.ma', 'password': 'MotDePasse-123', 'telephone': {'fixe': '0522'}},
+            {'email': 'c@atlas.ma', 'password': 'MotDePasse-123', 'last_name': None},
+        ]}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([ligne['statut'] for ligne in response.json()['lignes']], ['erreur', 'erreur', 'cree'])
+        self.assertIn('first_name', response.json()['lignes'][0]['detail'])
+
+    def test_second_conflit_a_l_insertion(self):
+        inserer = import_comptes._inserer_lot
+        appels = []
+
+        def inserer_avec_conflits(lot):
+            # Deux conflits de suite sur le lot entier, puis 'b' pris par un autre import
+            appels.append(len(lot))
+            if len(appels) <= 2 or lot[0][1] == 'b@atlas.ma':
+                raise IntegrityError
+            return inserer(lot)
+
+        with mock.patch('rendez_vous.import_comptes._inserer_lot', side_effect=inserer_avec_conflits):
+            rapport = importer_comptes([
+                {'email': 'a@atlas.ma', 'password': 'MotDePasse-123'},
+                {'email': 'b@atlas.ma', 'password': 'MotDePasse-123'},
+            ], processus=1)
+        self.assertEqual([ligne['statut'] for ligne in rapport['lignes']], ['cree', 'erreur'])
+        self.assertEqual(list(User.objects.values_list('email', flat=True)), ['a@atlas.ma'])
+
+
+class MediaTemporaireMixin:
+    """QR codes écrits dans un répertoire temporaire"""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        media = tempfile.TemporaryDirectory()
+        cls.addClassCleanup(media.cleanup)
+        cls.media = media.name
+        reglages = override_settings(MEDIA_ROOT=cls.media)
+        reglages.enable()
+        cls.addClassCleanup(reglages.disable)
+
+    def creer_rdv(self, **champs):
+        return RendezVous.objects.create(**{
+            'cin': 'AB123456', 'plaque_camion': '123-A-45', 'numero_conteneur': 'MSCU1234567',
+            'sens_trafic': 'entree', 'type_conteneur': 'plein', 'operation': 'import',
+            'date_rdv': date(2030, 1, 7), 'heure_rdv': time(8), **champs,
+        })
+
+
+class RendezVousTestCase(MediaTemporaireMixin, TestCase):
+    pass
+
+
+class StatistiquesTransactionTests(RendezVousTestCase):
+    def test_echec_du_compteur_annule_la_creation(self):
+        with mock.patch('rendez_vous.statistiques.ajuster', side_effect=DatabaseError):
+            with self.assertRaises(DatabaseError):
+                self.creer_rdv()
+        self.assertFalse(RendezVous.objects.exists())
+
+    def test_echec_du_compteur_annule_la_modification(self):
+        rdv = self.creer_rdv()
+        rdv.statut = 'valide'
+        with mock.patch('rendez_vous.statistiques.ajuster', side_effect=DatabaseError):
+            with self.assertRaises(DatabaseError):
+                rdv.save()
+        self.assertEqual(RendezVous.objects.get().statut, 'en_attente')
+        self.assertEqual(StatistiqueRendezVous.objects.get().statut, 'en_attente')
+
+
+CORPS_RDV = {
+    'cin': 'AB123456', 'plaque_camion': '123-A-45', 'numero_conteneur': 'MSCU1234567',
+    'sens_trafic': 'entree', 'type_conteneur': 'plein', 'operation': 'import',
+    'date_rdv': '2030-01-07', 'heure_rdv': '08:00',
+}
+
+
+@override_settings(LIMITATION_ACTIVE=False, SALLE_ATTENTE_ACTIVE=False, PORTAIL_INTERNE_URL='')
+class IdempotenceTests(RendezVousTestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create_user('chauffeur', password='x'))
+
+    def creer(self, corps=CORPS_RDV, cle='cle-1'):
+        return self.client.post('/api/rendez-vous/', corps, format='json', HTTP_IDEMPOTENCY_KEY=cle)
+
+    def test_requete_rejouee(self):
+        premiere = self.creer()
+        self.assertEqual(premiere.status_code, 201)
+        rejouee = self.creer()
+        self.assertEqual(rejouee.status_code, 201)
+        self.assertEqual(rejouee['Idempotent-Replayed'], 'true')
+        self.assertEqual(rejouee.json(), premiere.json())
+        self.assertEqual(RendezVous.objects.count(), 1)
+
+    def test_meme_cle_autre_corps(self):
+        self.creer()
+        response = self.creer({**CORPS_RDV, 'heure_rdv': '10:00'})
+        self.assertEqual(response.status_code, 422)
+        self.assertEqual(RendezVous.objects.count(), 1)
+
+    def test_qr_code_ecrit_au_commit_seulement(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            rdv = self.creer_rdv()
+        self.assertTrue(os.path.exists(rdv.qr_code.path))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            try:
+                with transaction.atomic():
+                    annule = self.creer_rdv(numero_conteneur='MSCU7654321')
+                    raise DatabaseError
+            except DatabaseError:
+                pass
+        self.assertFalse(os.path.exists(annule.qr_code.path))
+
+
+@override_settings(LIMITATION_ACTIVE=False, SALLE_ATTENTE_ACTIVE=False, PORTAIL_INTERNE_URL='')
+class IdempotenceConcurrenteTests(MediaTemporaireMixin, TransactionTestCase):
+    def test_nouvel_essai_pendant_la_premiere_requete(self):
+        user = User.objects.create_user('chauffeur', password='x')
+        en_cours, liberer = threading.Event(), threading.Event()
+        get_serializer = RendezVousViewSet.get_serializer
+        reponses = {}
+
+        def bloquer(vue, *args, **kwargs):
+            # La première requête garde le verrou de la clé jusqu'à `liberer`
+            en_cours.set()
+            liberer.wait(10)
+            return get_serializer(vue, *args, **kwargs)
+
+        def premiere():
+            client = APIClient()
+            client.force_authenticate(user)
+            try:
+                reponses['premiere'] = client.post('/api/rendez-vous/', CORPS_RDV, format='json',
+                                                   HTTP_IDEMPOTENCY_KEY='cle-1')
+            finally:
+                connection.close()
+
+        client = APIClient()
+        client.force_authenticate(user)
+        with mock.patch.object(RendezVousViewSet, 'get_serializer', autospec=True, side_effect=bloquer):
+            thread = threading.Thread(target=premiere)
+            thread.start()
+            try:
+                self.assertTrue(en_cours.wait(10))
+                if connection.vendor == 'sqlite':
+                    # Verrou d'écriture tenu par la première requête : 409, pas 500
+                    essai = client.post('/api/rendez-vous/', CORPS_RDV, format='json',
+                                        HTTP_IDEMPOTENCY_KEY='cle-1')
+                    self.assertEqual(essai.status_code, 409)
+                    self.assertIn('Retry-After', essai)
+            finally:
+                liberer.set()
+                thread.join()
+        self.assertEqual(reponses['premiere'].status_code, 201)
+
+        # Une fois la première validée, le nouvel essai reçoit sa réponse
+        rejouee = client.post('/api/rendez-vous/', CORPS_RDV, format='json', HTTP_IDEMPOTENCY_KEY='cle-1')
+        self.assertEqual(rejouee['Idempotent-Replayed'], 'true')
+        self.assertEqual(RendezVous.objects.count(), 1)
+        self.assertEqual(CleIdempotence.objects.get().statut, 201)
+
+
+class SeauxPartagesTests(SimpleTestCase):
+    def setUp(self):
+        dossier = tempfile.TemporaryDirectory()
+        self.addCleanup(dossier.cleanup)
+        self.seaux = limitation.SeauxPartages(os.path.join(dossier.name, 'seaux.bin'), 16)
+        horloge = mock.patch('rendez_vous.limitation.time.time', return_value=1000.0)
+        self.time = horloge.start()
+        self.addCleanup(horloge.stop)
+
+    def test_rafale_puis_recharge(self):
+        self.assertEqual(self.seaux.prendre('a', 2, 1), 0)
+        self.assertEqual(self.seaux.prendre('a', 2, 1), 0)
+        self.assertAlmostEqual(self.seaux.prendre('a', 2, 1), 1.0)
+        self.time.return_value = 1000.5
+        self.assertAlmostEqual(self.seaux.prendre('a', 2, 1), 0.5)
+        self.time.return_value = 1001.5
+        self.assertEqual(self.seaux.prendre('a', 2, 1), 0)
+        # Recharge plafonnée à la capacité
+        self.time.return_value = 2000.0
+        for _ in range(2):
+            self.assertEqual(self.seaux.prendre('a', 2, 1), 0)
+        self.assertGreater(self.seaux.prendre('a', 2, 1), 0)
+
+    def test_seaux_independants(self):
+        self.seaux.prendre('a', 1, 0.1)
+        self.assertGreater(self.seaux.prendre('a', 1, 0.1), 0)
+        self.assertEqual(self.seaux.prendre('b', 1, 0.1), 0)
+
+    def test_eviction_dans_un_ensemble_plein(self):
+        # Un seul ensemble : le seau resté inactif le plus longtemps est remplacé
+        seaux = limitation.SeauxPartages(self.seaux.chemin + '.1', 1)
+        for i in range(limitation.VOIES):
+            self.time.return_value = 1000.0 + i
+            seaux.prendre(f'cle{i}', 1, 0.001)
+        self.time.return_value = 1010.0
+        self.assertEqual(seaux.prendre('nouvelle', 1, 0.001), 0)
+        self.assertEqual(seaux.prendre('cle0', 1, 0.001), 0)   # évincé : seau neuf, plein
+        self.assertGreater(seaux.prendre('cle3', 1, 0.001), 0)
+
+
+@override_settings(LIMITATION_ACTIVE=True, SALLE_ATTENTE_ACTIVE=False, PORTAIL_INTERNE_URL='')
+class LimitationPortiqueTests(RendezVousTestCase):
+    def setUp(self):
+        dossier = tempfile.TemporaryDirectory()
+        self.addCleanup(dossier.cleanup)
+        reglages = override_settings(LIMITATION_FICHIER=os.path.join(dossier.name, 'seaux.bin'))
+        reglages.enable()
+        self.addCleanup(reglages.disable)
+        seaux = mock.patch.object(limitation, '_seaux', None)
+        seaux.start()
+        self.addCleanup(seaux.stop)
+
+    def test_portique_non_limite_a_debit_reel(self):
+        # Un terminal de portique anonyme (une IP) traite 30 camions d'affilée
+        client = APIClient()
+        for i in range(30):
+            rdv = self.creer_rdv(numero_conteneur=f'MSCU{i:07d}')
+            self.assertEqual(client.post(f'/api/rendez-vous/{rdv.pk}/valider/').status_code, 200)
+            self.assertEqual(client.post(f'/api/rendez-vous/{rdv.pk}/terminer/').status_code, 200)
+
+    def test_x_forwarded_for_ne_donne_pas_un_seau_neuf(self):
+        rdv = self.creer_rdv()
+        statuts = [
+            APIClient().delete(f'/api/rendez-vous/{rdv.pk}/', HTTP_X_FORWARDED_FOR=f'203.0.113.{i}').status_code
+            for i in range(7)
+        ]
+        self.assertIn(429, statuts)
+
+    @override_settings(REST_FRAMEWORK={**settings.REST_FRAMEWORK, 'NUM_PROXIES': 1})
+    def test_adresse_du_client_derriere_un_proxy(self):
+        # Derrière un proxy de confiance, deux clients réels ont chacun leur seau
+        rdv = self.creer_rdv()
+        for adresse in ('203.0.113.1', '203.0.113.2'):
+            statuts = [
+                APIClient().delete(f'/api/rendez-vous/{rdv.pk}/', HTTP_X_FORWARDED_FOR=adresse).status_code
+                for _ in range(5)
+            ]
+            self.assertNotIn(429, statuts)
+
+    def test_ecritures_anonymes_toujours_limitees(self):
+        rdv = self.creer_rdv()
+        statuts = [APIClient().delete(f'/api/rendez-vous/{rdv.pk}/').status_code for _ in range(7)]
+        self.assertIn(429, statuts)
+
+
+class SalleAttenteTests(SimpleTestCase):
+    def setUp(self):
+        dossier = tempfile.TemporaryDirectory()
+        self.addCleanup(dossier.cleanup)
+        self.salle = SalleAttente(os.path.join(dossier.name, 'salle.bin'), capacite=1, taille_file=10)
+
+    def test_jeton_de_passage_utilisable_une_fois(self):
+        premier = self.salle.entrer()
+        self.assertEqual(premier.entree, 0)
+        en_file = self.salle.entrer()
+        self.assertIsNone(en_file.entree)
+        self.salle.sortir(premier.entree, premier.bail, 0.1)
+
+        appel = self.salle.consulter(en_file.ticket)
+        self.assertEqual(appel.entree, 0)
+        passage = (en_file.ticket, appel.entree)
+        self.assertEqual(self.salle.entrer(passage).entree, 0)
+
+        # Rejoué pendant la requête : pas de seconde place, un nouveau ticket
+        rejoue = self.salle.entrer(passage)
+        self.assertIsNone(rejoue.entree)
+        self.assertIsNotNone(rejoue.ticket)
+
+    @override_settings(SALLE_ATTENTE_DUREE_MAX=30)
+    def test_sortie_tardive_ne_libere_pas_la_place_d_un_autre(self):
+        with mock.patch('rendez_vous.salle_attente.time.time', return_value=1000.0) as horloge:
+            lente = self.salle.entrer()
+            horloge.return_value = 1031.0   # bail de la requête lente échu
+            suivante = self.salle.entrer()
+            self.assertEqual(suivante.entree, lente.entree)
+            self.salle.sortir(lente.entree, lente.bail, 31.0)
+            # La place est toujours à la requête suivante
+            en_file = self.salle.entrer()
+            self.assertIsNone(en_file.entree)
+            self.salle.sortir(suivante.entree, suivante.bail, 0.1)
+            self.assertEqual(self.salle.consulter(en_file.ticket).entree, 0)
+
+
+@override_settings(SALLE_ATTENTE_ACTIVE=True, LIMITATION_ACTIVE=False)
+class SalleAttenteVuesTests(TestCase):
+    def setUp(self):
+        dossier = tempfile.TemporaryDirectory()
+        self.addCleanup(dossier.cleanup)
+        pleine = SalleAttente(os.path.join(dossier.name, 'salle.bin'), capacite=1, taille_file=10)
+        pleine.entrer()
+        remplacee = mock.patch('rendez_vous.salle_attente._salle', pleine)
+        remplacee.start()
+        self.addCleanup(remplacee.stop)
+        user = User.objects.create_user('chauffeur', email='chauffeur@atlas.ma', password='x')
+        self.client.defaults['HTTP_AUTHORIZATION'] = f"Bearer {generer_tokens(user)['access']}"
+
+    def test_disponibilites_derriere_la_salle_d_attente(self):
+        for url in ('/api/rdv/prochains-creneaux/', '/api/rdv/creneaux-pleins/?date=2030-01-07'):
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 503, url)
+            self.assertIn('file_attente', response.json())
+
+
+@override_settings(SYNCHRO_JETON='jeton-synchro')
+class JournalSynchroTests(RendezVousTestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION='Bearer jeton-synchro')
+
+    def changements(self, depuis, limite=100):
+        return self.client.get(f'/api/sync/changes/?since={depuis}&limit={limite}')
+
+    def test_echec_du_journal_annule_l_ecriture(self):
+        with mock.patch('rendez_vous.synchro.journaliser', side_effect=DatabaseError):
+            with self.assertRaises(DatabaseError):
+                self.creer_rdv()
+        self.assertFalse(RendezVous.objects.exists())
+
+        rdv = self.creer_rdv()
+        rdv.statut = 'valide'
+        with mock.patch('rendez_vous.synchro.journaliser', side_effect=DatabaseError):
+            with self.assertRaises(DatabaseError):
+                rdv.save()
+            # Le Collector n'ouvre pas de point de sauvegarde : bloc propre, comme une requête
+            with self.assertRaises(DatabaseError), transaction.atomic():
+                RendezVous.objects.get().delete()
+        self.assertEqual(RendezVous.objects.get().statut, 'en_attente')
+        self.assertEqual(list(EvenementSynchro.objects.values_list('type', flat=True)), ['creation'])
+
+    def test_curseur_apres_purge(self):
+        for i in range(4):
+            self.creer_rdv(numero_conteneur=f'MSCU{i:07d}')
+        sequences = list(EvenementSynchro.objects.values_list('sequence', flat=True))
+        EvenementSynchro.objects.filter(sequence__in=sequences[:2]).update(date=timezone.now() - timedelta(days=40))
+        call_command('prune_sync_events', jours=30, stdout=io.StringIO())
+        self.assertEqual(synchro.plus_ancienne_sequence(), sequences[2])
+
+        # Dernière séquence traitée juste avant la plus ancienne conservée : rien de perdu
+        response = self.changements(sequences[1])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([e['sequence'] for e in response.json()['evenements']], sequences[2:])
+        self.assertEqual(self.changements(sequences[0]).status_code, 410)
+        self.assertEqual(self.changements(0).status_code, 200)
+
+    def test_lecture_par_lots(self):
+        for i in range(3):
+            self.creer_rdv(numero_conteneur=f'MSCU{i:07d}')
+        sequences = list(EvenementSynchro.objects.values_list('sequence', flat=True))
+        premier = self.changements(0, limite=2).json()
+        self.assertEqual(premier['curseur'], sequences[1])
+        self.assertTrue(premier['suite'])
+        second = self.changements(premier['curseur'], limite=2).json()
+        self.assertEqual([e['sequence'] for e in second['evenements']], sequences[2:])
+        self.assertFalse(second['suite'])
+
+    def test_trou_recent_arrete_la_lecture(self):
+        for i in range(3):
+            self.creer_rdv(numero_conteneur=f'MSCU{i:07d}')
+        sequences = list(EvenementSynchro.objects.values_list('sequence', flat=True))
+        # Séquence du milieu invisible : transaction encore en cours (PostgreSQL),
+        # alors que la suivante, d'une autre transaction, est déjà validée
+        EvenementSynchro.objects.filter(sequence=sequences[1]).delete()
+        evenements, suite = synchro.lire(sequences[0], 100)
+        self.assertEqual(evenements, [])
+        self.assertTrue(suite)
+        evenements, suite = synchro.lire(0, 100)
+        self.assertEqual([e['sequence'] for e in evenements], sequences[:1])
+        self.assertTrue(suite)
+        self.assertEqual(self.changements(sequences[0]).json()['curseur'], sequences[0])
+
+    @override_settings(SYNCHRO_DELAI_TROU=60)
+    def test_trou_ancien_tenu_pour_annule(self):
+        for i in range(3):
+            self.creer_rdv(numero_conteneur=f'MSCU{i:07d}')
+        sequences = list(EvenementSynchro.objects.values_list('sequence', flat=True))
+        EvenementSynchro.objects.filter(sequence=sequences[1]).delete()
+        EvenementSynchro.objects.update(date=timezone.now() - timedelta(seconds=61))
+        evenements, suite = synchro.lire(sequences[0], 100)
+        self.assertEqual([e['sequence'] for e in evenements], sequences[2:])
+        self.assertFalse(suite)
+
+
+class MasquesCreneauxTests(SimpleTestCase):
+    def test_chevauchements(self):
+        # Créneaux 06:00, 08:00, 10:00... : bit i pour le i-ème
+        self.assertEqual(masque_chevauchements(time(8)), 0b10)
+        self.assertEqual(masque_chevauchements(time(9)), 0b110)
+        self.assertEqual(masque_chevauchements(time(20, 30)), 0b10000000)
+
+    def test_commences(self):
+        self.assertEqual(masque_commences(time(5, 59)), 0)
+        self.assertEqual(masque_commences(time(8)), 0b11)
+        self.assertEqual(masque_commences(time(9, 30)), 0b11)
+
+
+@override_settings(CAPACITE_CRENEAU=2, CAPACITE_CRENEAU_PAR_OPERATION={})
+class ProchainsCreneauxTests(RendezVousTestCase):
+    JOUR = date(2030, 1, 7)
+
+    def setUp(self):
+        # Le 7 à 9h30 : 06:00 et 08:00 sont commencés ; 10:00 complet, 12:00 à moitié
+        self.creer_rdv(heure_rdv=time(10), plaque_camion='111-A-11', numero_conteneur='MSCU0000001')
+        self.creer_rdv(heure_rdv=time(10), plaque_camion='222-A-22', numero_conteneur='MSCU0000002')
+        self.creer_rdv(heure_rdv=time(12), plaque_camion='333-A-33', numero_conteneur='MSCU0000003')
+        # Rendez-vous du camion hors grille : ne compte dans aucun créneau, mais chevauche 14:00 et 16:00
+        self.creer_rdv(heure_rdv=time(15), plaque_camion='999-B-11', numero_conteneur='MSCU0000004')
+        horloge = mock.patch('rendez_vous.creneaux.timezone.localtime', return_value=datetime(2030, 1, 7, 9, 30))
+        horloge.start()
+        self.addCleanup(horloge.stop)
+
+    def chercher(self, nombre, **options):
+        creneaux = async_to_sync(prochains_creneaux)(nombre, self.JOUR, **options)
+        return [(c['date'], c['heure'], c['places']) for c in creneaux]
+
+    def test_creneaux_commences_et_complets_ignores(self):
+        self.assertEqual(self.chercher(3), [
+            ('2030-01-07', '12:00', 1), ('2030-01-07', '14:00', 2), ('2030-01-07', '16:00', 2),
+        ])
+
+    def test_chevauchement_du_camion(self):
+        self.assertEqual(self.chercher(5, plaque='999-B-11'), [
+            ('2030-01-07', '12:00', 1), ('2030-01-07', '18:00', 2), ('2030-01-07', '20:00', 2),
+            # Le lendemain n'est pas « aujourd'hui » : tous les créneaux sont ouverts
+            ('2030-01-08', '06:00', 2), ('2030-01-08', '08:00', 2),
+        ])
+
+    @override_settings(CAPACITE_CRENEAU_PAR_OPERATION={'import': 1})
+    def test_capacite_par_operation(self):
+        self.assertEqual(self.chercher(2, operation='import'), [('2030-01-07', '14:00', 1), ('2030-01-07', '16:00', 1)])
+        self.assertEqual(self.chercher(1, operation='export'), [('2030-01-07', '12:00', 1)])
+
+    def test_annulation_libere_la_place(self):
+        rdv = RendezVous.objects.get(numero_conteneur='MSCU0000001')
+        rdv.statut = 'annule'
+        rdv.save()
+        self.assertEqual(self.chercher(1), [('2030-01-07', '10:00', 1)])
+
+
+@override_settings(PORTAIL_INTERNE_URL='')
+class SuppressionEnMasseTests(RendezVousTestCase):
+    def setUp(self):
+        self.admin = User.objects.create_superuser('admin', email='admin@port.ma', password='x')
+        self.client.force_login(self.admin)
+        # QR codes écrits au commit
+        with self.captureOnCommitCallbacks(execute=True):
+            self.rdvs = [self.creer_rdv(numero_conteneur=f'MSCU{i:07d}', heure_rdv=time(8 + 2 * (i % 2)))
+                         for i in range(5)]
+
+    def supprimer_depuis_l_admin(self, pks):
+        return self.client.post('/admin/rendez_vous/rendezvous/', {
+            'action': 'delete_selected', '_selected_action': pks, 'post': 'yes',
+        })
+
+    def test_action_de_l_admin_par_lots(self):
+        gardes = self.rdvs[4]
+        fichiers_qr = [os.path.join(self.media, rdv.qr_code.name) for rdv in self.rdvs[:4]]
+        self.assertTrue(all(os.path.exists(chemin) for chemin in fichiers_qr))
+        confirmation = self.client.post('/admin/rendez_vous/rendezvous/', {
+            'action': 'delete_selected', '_selected_action': [rdv.pk for rdv in self.rdvs[:4]],
+        })
+        self.assertContains(confirmation, '4 rendez-vous')
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.supprimer_depuis_l_admin([rdv.pk for rdv in self.rdvs[:4]])
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(list(RendezVous.objects.values_list('pk', flat=True)), [gardes.pk])
+        self.assertEqual(statistiques.ecarts(), [])
+        self.assertEqual(EvenementSynchro.objects.filter(type='suppression').count(), 4)
+        attendre_suppressions()
+        self.assertFalse(any(os.path.exists(chemin) for chemin in fichiers_qr))
+        self.assertTrue(os.path.exists(os.path.join(self.media, gardes.qr_code.name)))
+
+    def test_requetes_par_lot(self):
+        with self.assertNumQueries(8):
+            # Lecture des pks ; par lot : point de sauvegarde, lecture, DELETE, un
+            # UPDATE par compteur (2 créneaux), journal, fin du point de sauvegarde
+            RendezVous.objects.all().supprimer(taille_lot=5)
+        self.assertFalse(RendezVous.objects.exists())
+
+
+class ServerTimingTests(TestCase):
+    @override_settings(SERVER_TIMING=True)
+    def test_en_tete_ascii(self):
+        response = self.client.get('/api/test/')
+        self.assertTrue(response['Server-Timing'].isascii())
+        self.assertIn('db;dur=', response['Server-Timing'])
+
+    @override_settings(SERVER_TIMING=False)
+    def test_en_tete_absent_hors_developpement(self):
+        self.assertNotIn('Server-Timing', self.client.get('/api/test/'))
+
+
+class MetriquesTests(TestCase):
+    @override_settings(METRIQUES_JETON='jeton-metriques')
+    def test_jeton_requis(self):
+        self.assertEqual(self.client.get('/metrics').status_code, 403)
+        self.assertEqual(self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer autre').status_code, 403)
+        response = self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer jeton-metriques')
+        self.assertEqual(response.status_code, 200)
+
+    @override_settings(METRIQUES_JETON='', DEBUG=False)
+    def test_sans_jeton_ferme_hors_debug(self):
+        self.assertEqual(self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer ').status_code, 403)
+
+    def test_demarrage_refuse_sans_jeton(self):
+        env = {**os.environ, 'DEBUG': 'False', 'METRIQUES_JETON': ''}
+        resultat = subprocess.run([sys.executable, '-c', 'import django; django.setup()'],
+                                  cwd=settings.BASE_DIR, env=env, capture_output=True, text=True)
+        self.assertNotEqual(resultat.returncode, 0)
+        self.assertIn('METRIQUES_JETON', resultat.stderr)
+
+
+@override_settings(LIMITATION_ACTIVE=False)
+class TableauDeBordTests(RendezVousTestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('chauffeur', email='chauffeur@atlas.ma', password='x')
+        Profil.objects.create(user=self.user, telephone='0600000000')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def creer_rdvs(self, nombre):
+        for i in range(nombre):
+            self.creer_rdv(user=self.user, numero_conteneur=f'MSCU{i:07d}', date_rdv=date(2030, 1, 7 + i % 5))
+
+    def test_nombre_de_requetes_constant(self):
+        self.creer_rdvs(3)
+        # Utilisateur et profil, compteurs, prochains, historique
+        with self.assertNumQueries(4):
+            response = self.client.get('/api/me/')
+        self.assertEqual(response.json()['compteurs']['total'], 3)
+        self.creer_rdvs(12)
+        with self.assertNumQueries(4):
+            response = self.client.get('/api/me/')
+        donnees = response.json()
+        self.assertEqual(donnees['compteurs']['total'], 12 + 3)
+        self.assertEqual(len(donnees['prochains']), 5)
+        self.assertEqual(len(donnees['historique']), 10)
+        self.assertEqual(donnees['profil']['telephone'], '0600000000')
+
+    def test_etag_et_304(self):
+        self.creer_rdvs(2)
+        response = self.client.get('/api/me/')
+        etag = response['ETag']
+        self.assertEqual(response['Cache-Control'], 'private, no-cache')
+        # Rien de changé : 304 sans lire les listes
+        with self.assertNumQueries(2):
+            response = self.client.get('/api/me/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+        rdv = RendezVous.objects.filter(user=self.user).first()
+        rdv.statut = 'annule'
+        rdv.save()
+        response = self.client.get('/api/me/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+
+@override_settings(LIMITATION_ACTIVE=False)
+class VuesAsyncTests(RendezVousTestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('chauffeur', email='chauffeur@atlas.ma', password='x')
+        self.autre = User.objects.create_user('autre', email='autre@atlas.ma', password='x')
+
+    def test_authentification_requise(self):
+        response = self.client.get('/api/mes-rendez-vous/')
+        self.assertEqual(response.status_code, 401)
+        self.assertEqual(response.json(), {'detail': "Informations d'authentification non fournies."})
+        self.assertTrue(response['WWW-Authenticate'].startswith('Bearer'))
+
+        response = self.client.get('/api/mes-rendez-vous/', HTTP_AUTHORIZATION='Bearer invalide')
+        self.assertEqual(response.status_code, 401)
+        self.assertEqual(response.json()['code'], 'token_not_valid')
+        self.assertIn('WWW-Authenticate', response)
+
+    def test_mes_rendez_vous(self):
+        premier = self.creer_rdv(user=self.user, numero_conteneur='MSCU0000001')
+        second = self.creer_rdv(user=self.user, numero_conteneur='MSCU0000002')
+        self.creer_rdv(user=self.autre, numero_conteneur='MSCU0000003')
+        response = self.client.get('/api/mes-rendez-vous/',
+                                   HTTP_AUTHORIZATION=f"Bearer {generer_tokens(self.user)['access']}")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([rdv['id'] for rdv in response.json()], [second.pk, premier.pk])
+
+    def test_par_date(self):
+        self.assertEqual(self.client.get('/api/rendez-vous/par_date/').status_code, 400)
+        self.assertEqual(self.client.get('/api/rendez-vous/par_date/?date=07/01/2030').status_code, 400)
+        tard = self.creer_rdv(heure_rdv=time(10), numero_conteneur='MSCU0000001')
+        tot = self.creer_rdv(heure_rdv=time(8), numero_conteneur='MSCU0000002')
+        self.creer_rdv(date_rdv=date(2030, 1, 8), numero_conteneur='MSCU0000003')
+        response = self.client.get('/api/rendez-vous/par_date/?date=2030-01-07')
+        self.assertEqual([(rdv['id'], rdv['heure_rdv']) for rdv in response.json()],
+                         [(tot.pk, '08:00:00'), (tard.pk, '10:00:00')])
+
+    @override_settings(LIMITATION_ACTIVE=True, LIMITATION_BUDGETS={
+        **settings.LIMITATION_BUDGETS, 'liste': {'anonyme': (2, 0.001), 'utilisateur': (2, 0.001)},
+    })
+    def test_limitation_de_debit(self):
+        dossier = tempfile.TemporaryDirectory()
+        self.addCleanup(dossier.cleanup)
+        with override_settings(LIMITATION_FICHIER=os.path.join(dossier.name, 'seaux.bin')), \
+                mock.patch.object(limitation, '_seaux', None):
+            statuts = [self.client.get('/api/rendez-vous/aujourd_hui/').status_code for _ in range(3)]
+            self.assertEqual(statuts, [200, 200, 429])
+            response = self.client.get('/api/rendez-vous/aujourd_hui/')
+        self.assertEqual(response.status_code, 429)
+        self.assertIn('detail', response.json())
+        self.assertGreaterEqual(int(response['Retry-After']), 1)
+
+
+class ServirQrCodeTests(SimpleTestCase):
+    NOM = 'qr_code_0ad752a8-4282-4f78-b946-7671ac18944d.png'
+    CONTENU = bytes(range(200))
+
+    def setUp(self):
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        os.mkdir(os.path.join(media.name, 'qr_codes'))
+        self.chemin = os.path.join(media.name, 'qr_codes', self.NOM)
+        with open(self.chemin, 'wb') as f:
+            f.write(self.CONTENU)
+        reglages = override_settings(MEDIA_ROOT=media.name, MEDIA_SENDFILE='')
+        reglages.enable()
+        self.addCleanup(reglages.disable)
+        self.url = f'/media/qr_codes/{self.NOM}'
+
+    def test_fichier_complet_et_cache(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b''.join(response.streaming_content), self.CONTENU)
+        self.assertEqual(response['Content-Type'], 'image/png')
+        self.assertEqual(response['Accept-Ranges'], 'bytes')
+        self.assertEqual(response['Cache-Control'], 'public, max-age=31536000, immutable')
+
+        etag = response['ETag']
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], etag)
+        response = self.client.get(self.url, HTTP_IF_MODIFIED_SINCE=response['Last-Modified'])
+        self.assertEqual(response.status_code, 304)
+
+    def test_plages(self):
+        response = self.client.get(self.url, HTTP_RANGE='bytes=10-19')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response.content, self.CONTENU[10:20])
+        self.assertEqual(response['Content-Range'], 'bytes 10-19/200')
+
+        response = self.client.get(self.url, HTTP_RANGE='bytes=-50')
+        self.assertEqual(response.content, self.CONTENU[-50:])
+        response = self.client.get(self.url, HTTP_RANGE='bytes=190-')
+        self.assertEqual(response['Content-Range'], 'bytes 190-199/200')
+
+        response = self.client.get(self.url, HTTP_RANGE='bytes=500-600')
+        self.assertEqual(response.status_code, 416)
+        self.assertEqual(response['Content-Range'], 'bytes */200')
+
+        # If-Range périmé : fichier complet
+        response = self.client.get(self.url, HTTP_RANGE='bytes=10-19', HTTP_IF_RANGE='"autre"')
+        self.assertEqual(response.status_code, 200)
+
+    def test_acces(self):
+        self.assertEqual(self.client.post(self.url).status_code, 405)
+        self.assertEqual(self.client.head(self.url).status_code, 200)
+        self.assertEqual(self.client.get('/media/qr_codes/qr_code_absent.png').status_code, 404)
+        # Seuls les noms de QR code sont servis : ni autre fichier, ni remontée d'arborescence
+        with open(os.path.join(settings.MEDIA_ROOT, 'qr_codes', 'notes.txt'), 'w') as f:
+            f.write('x')
+        self.assertEqual(self.client.get('/media/qr_codes/notes.txt').status_code, 404)
+        self.assertEqual(self.client.get('/media/qr_codes/qr_code_..%2F..%2Fsettings.png').status_code, 404)
+
+    def test_envoi_delegue_au_serveur_web(self):
+        with override_settings(MEDIA_SENDFILE='x-accel-redirect', MEDIA_SENDFILE_PREFIXE='/interne/'):
+            response = self.client.get(self.url)
+        self.assertEqual(response['X-Accel-Redirect'], f'/interne/qr_codes/{self.NOM}')
+        self.assertEqual(response.content, b'')
+        with override_settings(MEDIA_SENDFILE='x-sendfile'):
+            self.assertEqual(self.client.get(self.url)['X-Sendfile'], self.chemin)
+
+
+@override_settings(PROFILAGE_ACTIF=True, PROFILAGE_ECHANTILLONNAGE=0.0, PROFILAGE_MAX_CAPTURES=2)
+class ProfilageTests(TestCase):
+    def setUp(self):
+        repertoire = tempfile.TemporaryDirectory()
+        self.addCleanup(repertoire.cleanup)
+        reglages = override_settings(PROFILAGE_REPERTOIRE=repertoire.name)
+        reglages.enable()
+        self.addCleanup(reglages.disable)
+        self.repertoire = repertoire.name
+
+    def entete(self, user):
+        return {'HTTP_AUTHORIZATION': f"Bearer {generer_tokens(user)['access']}"}
+
+    def test_capture_sur_jeton(self):
+        self.assertNotIn('X-Profilage-Id', self.client.get('/api/test/'))
+        self.assertNotIn('X-Profilage-Id', self.client.get('/api/test/', HTTP_X_PROFILAGE='faux'))
+        self.assertEqual(os.listdir(self.repertoire), [])
+
+        response = self.client.get('/api/test/', HTTP_X_PROFILAGE=creer_jeton())
+        identifiant = response['X-Profilage-Id']
+        self.assertEqual(sorted(os.listdir(self.repertoire)), [identifiant + '.json', identifiant + '.prof'])
+        resume = lire_resume(identifiant)
+        self.assertEqual((resume['chemin'], resume['statut'], resume['declencheur']), ('/api/test/', 200, 'jeton'))
+
+    @override_settings(PROFILAGE_ECHANTILLONNAGE=1.0)
+    def test_echantillonnage_et_rotation(self):
+        identifiants = [self.client.get('/api/test/')['X-Profilage-Id'] for _ in range(3)]
+        # Seules les PROFILAGE_MAX_CAPTURES dernières sont gardées
+        self.assertEqual(lister_identifiants(), identifiants[:0:-1])
+        self.assertEqual(lire_resume(identifiants[-1])['declencheur'], 'echantillon')
+
+    @override_settings(PROFILAGE_ACTIF=False)
+    def test_middleware_retire_si_inactif(self):
+        self.assertNotIn('X-Profilage-Id', self.client.get('/api/test/', HTTP_X_PROFILAGE=creer_jeton()))
+        self.assertEqual(os.listdir(self.repertoire), [])
+
+    def test_telechargement_reserve_aux_administrateurs(self):
+        identifiant = self.client.get('/api/test/', HTTP_X_PROFILAGE=creer_jeton())['X-Profilage-Id']
+        url = f'/api/profils/{identifiant}/sql/'
+        chauffeur = User.objects.create_user('chauffeur', password='x')
+        admin = User.objects.create_user('admin', password='x', is_staff=True)
+
+        self.assertEqual(self.client.get('/api/profils/').status_code, 401)
+        self.assertEqual(self.client.get('/api/profils/', **self.entete(chauffeur)).status_code, 403)
+        self.assertEqual(self.client.get(url, **self.entete(chauffeur)).status_code, 403)
+
+        response = self.client.get('/api/profils/', **self.entete(admin))
+        self.assertEqual([capture['id'] for capture in response.json()], [identifiant])
+        response = self.client.get(url, **self.entete(admin))
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(f'filename="{identifiant}.json"', response['Content-Disposition'])
+        self.assertIn(b'"sql_nb"', b''.join(response.streaming_content))
+        response = self.client.get(f'/api/profils/{identifiant}/prof/', **self.entete(admin))
+        self.assertEqual(response.status_code, 200)
+        response.close()
+
+        # Type inconnu ou identifiant hors format : aucun accès au système de fichiers
+        self.assertEqual(self.client.get(f'/api/profils/{identifiant}/py/', **self.entete(admin)).status_code, 404)
+        self.assertEqual(self.client.get('/api/profils/..%2Fsettings/sql/', **self.entete(admin)).status_code, 404)
+
+
+@override_settings(LIMITATION_ACTIVE=False, PORTAIL_INTERNE_URL='', DIFFUSION_REPERTOIRE='',
+                   DIFFUSION_BATTEMENT=1, DIFFUSION_DUREE_MAX=10)
+class FluxCreneauxTests(RendezVousTestCase):
+    url = '/api/rdv/creneaux/flux/?date=2030-01-07'
+
+    def creer_rdv_commite(self, **champs):
+        with self.captureOnCommitCallbacks(execute=True):
+            return self.creer_rdv(**champs)
+
+    def test_instantane_sous_wsgi(self):
+        self.assertEqual(self.client.get('/api/rdv/creneaux/flux/').status_code, 400)
+        self.creer_rdv_commite(numero_conteneur='MSCU0000001')
+        self.creer_rdv_commite(numero_conteneur='MSCU0000002')
+        self.creer_rdv_commite(heure_rdv=time(10), numero_conteneur='MSCU0000003')
+        self.creer_rdv_commite(date_rdv=date(2030, 1, 8), numero_conteneur='MSCU0000004')
+
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        self.assertEqual(response['Cache-Control'], 'no-cache')
+        # Réponse complète, pas de flux : le navigateur se reconnecte après `retry`
+        self.assertFalse(response.streaming)
+        self.assertEqual(response.content.decode(), (
+            'retry: 1000\n\n'
+            'event: instantane\n'
+            'data: {"date": "2030-01-07", "capacite": %d, "creneaux": {"08:00": 2, "10:00": 1}}\n\n'
+        ) % settings.CAPACITE_CRENEAU)
+
+    def test_evenements_occupation(self):
+        self.creer_rdv_commite(numero_conteneur='MSCU0000001')
+
+        async def scenario():
+            response = await self.async_client.get(self.url)
+            self.assertTrue(response.streaming)
+            flux = aiter(response.streaming_content)
+            try:
+                evenements = [await anext(flux)]
+                self.assertEqual(diffuseur.nombre_abonnes(), 1)
+                # Deux commits avant la lecture : une seule valeur, la dernière
+                await sync_to_async(self.creer_rdv_commite)(numero_conteneur='MSCU0000002')
+                await sync_to_async(self.creer_rdv_commite)(numero_conteneur='MSCU0000003')
+                # Autre date : rien pour cet abonné
+                await sync_to_async(self.creer_rdv_commite)(date_rdv=date(2030, 1, 8),
+                                                           numero_conteneur='MSCU0000004')
+                while (suivant := await anext(flux)) == b': battement\n\n':
+                    pass
+                evenements.append(suivant)
+            finally:
+                await flux.aclose()
+            return evenements
+
+        instantane, occupation = async_to_sync(scenario)()
+        self.assertTrue(instantane.startswith(b'event: instantane\n'))
+        self.assertIn(b'"creneaux": {"08:00": 1}', instantane)
+        self.assertEqual(occupation, (
+            'event: occupation\n'
+            'data: {"date": "2030-01-07", "capacite": %d, "creneaux": {"08:00": 3}}\n\n'
+        % settings.CAPACITE_CRENEAU).encode())
+        self.assertEqual(diffuseur.nombre_abonnes(), 0)
+
+
+@override_settings(SYNCHRO_JETON='jeton-synchro', PORTAIL_INTERNE_URL='')
+class ReconciliationTests(RendezVousTestCase):
+    du, au = date(2030, 1, 1), date(2030, 1, 31)
+
+    def setUp(self):
+        self.rdvs = [
+            self.creer_rdv(numero_conteneur='MSCU0000001'),
+            self.creer_rdv(numero_conteneur='MSCU0000002'),
+            self.creer_rdv(heure_rdv=time(10), numero_conteneur='MSCU0000003'),
+            self.creer_rdv(date_rdv=date(2030, 1, 8), numero_conteneur='MSCU0000004'),
+            self.creer_rdv(date_rdv=date(2030, 1, 9), numero_conteneur='MSCU0000005'),
+        ]
+        # Copie du portail : les rendez-vous tels qu'il les a reçus
+        self.portail = {str(rdv.code_unique): rdv.donnees_portail() for rdv in self.rdvs}
+
+    def distant(self, du, au, date_rdv, heure_rdv):
+        """Même découpage que l'endpoint du portail (voir portal_stub)"""
+        lignes = list(self.portail.values())
+        if date_rdv is None:
+            return resumer([l for l in lignes if du.isoformat() <= l['date_rdv'] <= au.isoformat()])
+        lignes = [l for l in lignes if l['date_rdv'] == date_rdv.isoformat()]
+        if heure_rdv is not None:
+            lignes = [l for l in lignes if l['heure_rdv'] == heure_rdv.strftime('%H:%M')]
+        return resumer(lignes, date_rdv, heure_rdv)
+
+    def test_empreintes_identiques(self):
+        # Les empreintes ne dépendent ni de l'ordre ni de la forme (instance ou payload)
+        local = resume_local(self.du, self.au)
+        self.assertEqual(local, resumer(reversed(list(self.portail.values()))))
+        self.assertEqual(local['jours']['2030-01-07']['n'], 3)
+
+        ecarts, echanges = comparer(resume_local, self.distant, self.du, self.au)
+        self.assertEqual(ecarts, {'manquants': [], 'perimes': [], 'en_trop': []})
+        # Aucun jour différent : on ne descend pas dans l'arbre
+        self.assertEqual(echanges, {'jours': 3, 'creneaux': 0, 'lignes': 0})
+
+    def test_empreintes_divergentes(self):
+        manquant, perime, deplace, _, _ = self.rdvs
+        en_trop = {**self.portail[str(self.rdvs[3].code_unique)], 'code_unique': str(uuid.uuid4())}
+        self.portail[en_trop['code_unique']] = en_trop
+        del self.portail[str(manquant.code_unique)]
+        RendezVous.objects.filter(pk=perime.pk).update(statut='annule')
+        RendezVous.objects.filter(pk=deplace.pk).update(date_rdv=date(2030, 1, 9))
+
+        local = resume_local(self.du, self.au)
+        distant = self.distant(self.du, self.au, None, None)
+        self.assertNotEqual(local['jours']['2030-01-07'], distant['jours']['2030-01-07'])
+        self.assertEqual(local['jours']['2030-01-08']['n'], distant['jours']['2030-01-08']['n'] - 1)
+
+        ecarts, echanges = comparer(resume_local, self.distant, self.du, self.au)
+        self.assertEqual(ecarts, {
+            'manquants': [str(manquant.code_unique)],
+            'perimes': sorted([str(perime.code_unique), str(deplace.code_unique)]),
+            'en_trop': [en_trop['code_unique']],
+        })
+        # Le créneau de 08:00 du 9, identique des deux côtés, n'est pas détaillé
+        self.assertEqual(echanges, {'jours': 3, 'creneaux': 4, 'lignes': 4})
+
+    def test_endpoint(self):
+        url = '/api/reconciliation/?du=2030-01-01&au=2030-01-31'
+        self.assertEqual(self.client.get(url).status_code, 403)
+        entete = {'HTTP_AUTHORIZATION': 'Bearer jeton-synchro'}
+        self.assertEqual(self.client.get(url, **entete).json(), self.distant(self.du, self.au, None, None))
+        response = self.client.get('/api/reconciliation/?date=2030-01-07&heure=08:00', **entete)
+        self.assertEqual(response.json(), self.distant(None, None, date(2030, 1, 7), time(8)))
+        self.assertEqual(len(response.json()['lignes']), 2)
+        self.assertEqual(self.client.get('/api/reconciliation/?du=2030-01-31&au=2030-01-01',
+                                         **entete).status_code, 400)
+
+
+class FrontendTests(SimpleTestCase):
+    ASSET = 'assets/app.0123456789ab.js'
+
+    def setUp(self):
+        dist = tempfile.TemporaryDirectory()
+        self.addCleanup(dist.cleanup)
+        os.mkdir(os.path.join(dist.name, 'assets'))
+        for nom, contenu in (('index.html', b'<html>'), ('index.html.gz', b'index-gzip'),
+                             (self.ASSET, b'code'), (self.ASSET + '.br', b'code-br'),
+                             (self.ASSET + '.gz', b'code-gzip')):
+            with open(os.path.join(dist.name, nom), 'wb') as f:
+                f.write(contenu)
+        reglages = override_settings(FRONTEND_DIST=dist.name)
+        reglages.enable()
+        self.addCleanup(reglages.disable)
+
+    def lire(self, chemin, accept_encoding=None):
+        entetes = {'HTTP_ACCEPT_ENCODING': accept_encoding} if accept_encoding is not None else {}
+        response = self.client.get('/' + chemin, **entetes)
+        contenu = b''.join(response.streaming_content) if response.streaming else response.content
+        return response, contenu
+
+    def test_variante_selon_accept_encoding(self):
+        for accept_encoding, attendu, encodage in (
+            ('gzip, deflate, br', b'code-br', 'br'),
+            ('gzip', b'code-gzip', 'gzip'),
+            ('br;q=0, gzip;q=0.5', b'code-gzip', 'gzip'),
+            ('*', b'code-br', 'br'),
+            ('identity', b'code', None),
+            ('', b'code', None),
+        ):
+            with self.subTest(accept_encoding=accept_encoding):
+                response, contenu = self.lire(self.ASSET, accept_encoding)
+                self.assertEqual(contenu, attendu)
+                self.assertEqual(response.get('Content-Encoding'), encodage)
+                self.assertTrue(has_vary_header(response, 'Accept-Encoding'))
+                self.assertIn('javascript', response['Content-Type'])
+                self.assertEqual(response['Cache-Control'], 'public, max-age=31536000, immutable')
+
+    def test_etag_par_variante(self):
+        etag_br = self.lire(self.ASSET, 'br')[0]['ETag']
+        self.assertNotEqual(etag_br, self.lire(self.ASSET, 'gzip')[0]['ETag'])
+        response = self.client.get('/' + self.ASSET, HTTP_ACCEPT_ENCODING='br', HTTP_IF_NONE_MATCH=etag_br)
+        self.assertEqual(response.status_code, 304)
+        self.assertTrue(has_vary_header(response, 'Accept-Encoding'))
+        # Un cache qui a la variante br ne la resert pas à un client gzip
+        response = self.client.get('/' + self.ASSET, HTTP_ACCEPT_ENCODING='gzip', HTTP_IF_NONE_MATCH=etag_br)
+        self.assertEqual(response.status_code, 200)
+
+    def test_routes_de_l_application(self):
+        response, contenu = self.lire('rendez-vous/nouveau', 'br, gzip')
+        # Pas de variante .br pour index.html : la .gz est servie
+        self.assertEqual((contenu, response['Content-Encoding']), (b'index-gzip', 'gzip'))
+        self.assertEqual(response['Cache-Control'], 'no-cache')
+        self.assertTrue(has_vary_header(response, 'Accept-Encoding'))
+        self.assertEqual(self.lire('', 'br')[1], b'<html>')
+        self.assertEqual(self.client.get('/assets/absent.0123456789ab.js').status_code, 404)
+        self.assertEqual(self.client.get('/favicon.ico').status_code, 404)
+        self.assertEqual(self.client.get('/assets/..%2F..%2Fsettings.py').status_code, 404)
+
+
+@override_settings(PORTAIL_INTERNE_URL='')
+class GcQrcodesTests(RendezVousTestCase):
+    def setUp(self):
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        reglages = override_settings(MEDIA_ROOT=media.name)
+        reglages.enable()
+        self.addCleanup(reglages.disable)
+        self.media = media.name
+        # QR code écrit au commit
+        with self.captureOnCommitCallbacks(execute=True):
+            self.rdv = self.creer_rdv()
+        self.reference = os.path.join(self.media, self.rdv.qr_code.name)
+
+    def fichier(self, nom, age):
+        chemin = os.path.join(self.media, 'qr_codes', nom)
+        os.makedirs(os.path.dirname(chemin), exist_ok=True)
+        with open(chemin, 'wb') as f:
+            f.write(b'png')
+        os.utime(chemin, (datetime.now().timestamp() - age,) * 2)
+        return chemin
+
+    def gc(self, *arguments):
+        sortie = io.StringIO()
+        call_command('gc_qrcodes', *arguments, stdout=sortie)
+        return sortie.getvalue()
+
+    def test_simulation_puis_suppression(self):
+        os.utime(self.reference, (datetime.now().timestamp() - 7200,) * 2)
+        ancien = self.fichier('qr_code_ancien.png', 7200)
+        ancien_sous_dossier = self.fichier('2029/qr_code_archive.png', 7200)
+        recent = self.fichier('qr_code_recent.png', 60)
+
+        sortie = self.gc('--dry-run')
+        self.assertIn('  qr_codes/qr_code_ancien.png\n', sortie)
+        self.assertIn('  qr_codes/2029/qr_code_archive.png\n', sortie)
+        self.assertNotIn('qr_code_recent', sortie)
+        self.assertNotIn(self.rdv.qr_code.name, sortie)
+        self.assertIn('4 fichiers parcourus, 2 orphelins (0.0 Mo), 1 orphelins récents ignorés', sortie)
+        self.assertIn('Simulation : aucun fichier supprimé.', sortie)
+        self.assertTrue(all(map(os.path.exists, (self.reference, ancien, ancien_sous_dossier, recent))))
+
+        self.assertIn('2 fichiers supprimés.', self.gc('--lot', '1'))
+        self.assertFalse(os.path.exists(ancien) or os.path.exists(ancien_sous_dossier))
+        self.assertTrue(os.path.exists(self.reference) and os.path.exists(recent))
+
+        self.assertIn('1 fichiers supprimés.', self.gc('--age-min', '0'))
+        self.assertEqual(sorted(os.listdir(os.path.join(self.media, 'qr_codes'))),
+                         sorted([os.path.basename(self.reference), '2029']))
+
+    def test_suppression_apres_commit(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.rdv.delete()
+            attendre_suppressions()
+            # Transaction en cours : le fichier est toujours là
+            self.assertTrue(os.path.exists(self.reference))
+        attendre_suppressions()
+        self.assertFalse(os.path.exists(self.reference))
+
+    def test_rien_supprime_si_transaction_annulee(self):
+        pk = self.rdv.pk
+        with self.captureOnCommitCallbacks(execute=True) as rappels:
+            with self.assertRaises(DatabaseError), transaction.atomic():
+                self.rdv.delete()
+                raise DatabaseError
+        attendre_suppressions()
+        self.assertEqual(rappels, [])
+        self.assertTrue(os.path.exists(self.reference))
+        self.assertTrue(RendezVous.objects.filter(pk=pk).exists())
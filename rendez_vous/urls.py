@@ -1,16 +1,23 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
+from . import views_async
 from .views import (
     RendezVousViewSet, 
     RendezVousPublicViewSet, 
     RegisterView, 
-    MesRendezVousView, 
     ModifierRendezVousView, 
     SupprimerRendezVousView, 
     ProfilUtilisateurView, 
+    TableauDeBordView,
     test_api, 
-    creneaux_pleins,
-    ChangePasswordView
+    ChangePasswordView,
+    ImportComptesView,
+    StatistiquesView,
+    ChargeView,
+    ProfilsView,
+    ProfilFichierView,
+    changements_synchro,
+    reconciliation
 )
 
 router = DefaultRouter()
@@ -18,13 +25,28 @@ router.register(r'rendez-vous', RendezVousViewSet, basename='rendezvous')
 router.register(r'public/rendez-vous', RendezVousPublicViewSet, basename='public-rendez-vous')
 
 urlpatterns = [
+    # Lectures fréquentes : vues asynchrones natives, avant les routes du routeur
+    path('rendez-vous/aujourd_hui/', views_async.AujourdHuiView.as_view(), name='rendezvous-aujourd-hui'),
+    path('rendez-vous/prochains/', views_async.ProchainsView.as_view(), name='rendezvous-prochains'),
+    path('rendez-vous/par_date/', views_async.ParDateView.as_view(), name='rendezvous-par-date'),
     path('', include(router.urls)),
     path('auth/register/', RegisterView.as_view(), name='register'),
     path('auth/change-password/', ChangePasswordView.as_view(), name='change-password'),
-    path('mes-rendez-vous/', MesRendezVousView.as_view(), name='mes-rendez-vous'),
+    path('mes-rendez-vous/', views_async.MesRendezVousView.as_view(), name='mes-rendez-vous'),
     path('modifier-rendez-vous/<int:pk>/', ModifierRendezVousView.as_view(), name='modifier-rendez-vous'),
     path('supprimer-rendez-vous/<int:pk>/', SupprimerRendezVousView.as_view(), name='supprimer-rendez-vous'),
     path('profil/', ProfilUtilisateurView.as_view(), name='profil'),
+    path('me/', TableauDeBordView.as_view(), name='tableau-de-bord'),
     path('test/', test_api, name='test-api'),
-    path('rdv/creneaux-pleins/', creneaux_pleins, name='creneaux-pleins'),
+    path('rdv/creneaux-pleins/', views_async.CreneauxPleinsView.as_view(), name='creneaux-pleins'),
+    path('rdv/creneaux/flux/', views_async.FluxCreneauxView.as_view(), name='creneaux-flux'),
+    path('rdv/prochains-creneaux/', views_async.ProchainsCreneauxView.as_view(), name='prochains-creneaux'),
+    path('file-attente/', views_async.FileAttenteView.as_view(), name='file-attente'),
+    path('comptes/import/', ImportComptesView.as_view(), name='import-comptes'),
+    path('stats/', StatistiquesView.as_view(), name='statistiques'),
+    path('stats/charge/', ChargeView.as_view(), name='statistiques-charge'),
+    path('sync/changes/', changements_synchro, name='synchro-changements'),
+    path('reconciliation/', reconciliation, name='reconciliation'),
+    path('profils/', ProfilsView.as_view(), name='profils'),
+    path('profils/<str:identifiant>/<str:type_fichier>/', ProfilFichierView.as_view(), name='profil-fichier'),
 ] 
\ No newline at end of file
@@ -1,26 +1,43 @@
-from rest_framework import viewsets, status
-from rest_framework.decorators import action
-from rest_framework.response import Response
-from rest_framework.permissions import AllowAny, IsAuthenticated
-from django.shortcuts import get_object_or_404
-from .models import RendezVous
-from .serializers import RendezVousSerializer, RendezVousCreateSerializer
-from datetime import datetime, timedelta
-from django.utils import timezone
+import hashlib
+import hmac
+import json
+import mimetypes
+import os
+import re
+from datetime import datetime
+
+from django.conf import settings
 from django.contrib.auth.models import User
-from rest_framework import generics
-from rest_framework import serializers
-from .models import Profil
-import uuid
-from rest_framework_simplejwt.views import TokenObtainPairView
-from rest_framework_simplejwt.serializers import TokenObtainPairSerializer
-from rest_framework.views import APIView
-from rest_framework.permissions import IsAuthenticated
-from rest_framework_simplejwt.tokens import RefreshToken
-from django.contrib.auth.password_validation import validate_password
-from django.views.decorators.csrf import csrf_exempt
+from django.core.exceptions import SuspiciousFileOperation
+from django.db import IntegrityError, transaction
+from django.db.models import Count, Max, Q, Sum
+from django.http import FileResponse, Http404, HttpResponse, JsonResponse
+from django.utils import timezone
+from django.utils._os import safe_join
+from django.utils.cache import get_conditional_response
 from django.utils.decorators import method_decorator
-from rest_framework.decorators import api_view
+from django.utils.http import http_date
+from django.views import View
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_safe
+from prometheus_client import CONTENT_TYPE_LATEST, generate_latest
+from rest_framework import generics, serializers, status, viewsets
+from rest_framework.decorators import action, api_view
+from rest_framework.permissions import SAFE_METHODS, AllowAny, IsAdminUser, IsAuthenticated
+from rest_framework.response import Response
+from rest_framework.views import APIView
+
+from . import prevision, synchro
+from .authentication import averifier_identifiants, generer_tokens, normaliser_email, username_depuis_email
+from .idempotence import idempotent
+from .import_comptes import importer_comptes, lire_roster
+from .metriques import registre_de_collecte
+from .models import DIMENSIONS_STATISTIQUES, Profil, RendezVous, StatistiqueRendezVous
+from .profilage import chemin_capture, lire_resume, lister_identifiants
+from .reconciliation import resume_local
+from .salle_attente import file_attente
+from .serializers import RendezVousSerializer, RendezVousCreateSerializer
+
 
 class RegisterSerializer(serializers.ModelSerializer):
     password = serializers.CharField(write_only=True)
@@ -28,30 +45,27 @@ class RegisterSerializer(serializers.ModelSerializer):
     class Meta:
         model = User
         fields = ('password', 'email', 'first_name', 'last_name', 'telephone')
+        extra_kwargs = {'email': {'required': True, 'allow_blank': False}}
 
     def validate_email(self, value):
-        if User.objects.filter(email__iexact=value).exists():
-            raise serializers.ValidationError('Cet email est déjà utilisé.')
-        return value
+        # L'unicité est garantie par l'index unique sur auth_user.email
+        return normaliser_email(value)
 
     def create(self, validated_data):
         telephone = validated_data.pop('telephone')
-        email = validated_data.get('email', '')
-        # Générer un username unique basé sur l'email
-        base_username = email.split('@')[0] if email else 'user'
-        username = base_username
-        # S'assurer que le username est unique
-        i = 1
-        while User.objects.filter(username=username).exists():
-            username = f"{base_username}{uuid.uuid4().hex[:6]}"
-        user = User.objects.create_user(
-            username=username,
-            password=validated_data['password'],
-            email=email,
-            first_name=validated_data.get('first_name', ''),
-            last_name=validated_data.get('last_name', ''),
-        )
-        Profil.objects.create(user=user, telephone=telephone)
+        email = validated_data['email']
+        try:
+            with transaction.atomic():
+                user = User.objects.create_user(
+                    username=username_depuis_email(email),
+                    password=validated_data['password'],
+                    email=email,
+                    first_name=validated_data.get('first_name', ''),
+                    last_name=validated_data.get('last_name', ''),
+                )
+                Profil.objects.create(user=user, telephone=telephone)
+        except IntegrityError:
+            raise serializers.ValidationError({'email': ['Cet email est déjà utilisé.']})
         return user
 
 @method_decorator(csrf_exempt, name='dispatch')
@@ -60,6 +74,9 @@ class RegisterView(generics.CreateAPIView):
     permission_classes = (AllowAny,)
     serializer_class = RegisterSerializer
 
+    def get_portee_limitation(self, request):
+        return 'inscription'
+
 class RendezVousViewSet(viewsets.ModelViewSet):
     """
     ViewSet pour gérer les rendez-vous des chauffeurs
@@ -76,8 +93,18 @@ class RendezVousViewSet(viewsets.ModelViewSet):
             return RendezVousCreateSerializer
         return RendezVousSerializer
     
+    def get_portee_limitation(self, request):
+        if self.action in ('par_plaque', 'par_cin'):
+            return 'recherche'
+        if self.action in ('valider', 'annuler', 'terminer'):
+            # Débit des portiques, pas celui d'un client isolé
+            return 'portique'
+        return 'liste' if request.method in SAFE_METHODS else 'ecriture'
+    
+    @file_attente
+    @idempotent
     def create(self, request, *args, **kwargs):
-        """Créer un nouveau rendez-vous"""
+        """Créer un nouveau rendez-vous (rejouable avec Idempotency-Key)"""
         serializer = self.get_serializer(data=request.data)
         if serializer.is_valid():
             # Lier le rendez-vous à l'utilisateur connecté s'il est authentifié
@@ -173,61 +200,13 @@ class RendezVousViewSet(viewsets.ModelViewSet):
         serializer = self.get_serializer(rendez_vous, many=True)
         return Response(serializer.data)
     
-    @action(detail=False, methods=['get'])
-    def par_date(self, request):
-        """Rechercher les rendez-vous par date"""
-        date_str = request.query_params.get('date')
-        if not date_str:
-            return Response({
-                'error': 'Le paramètre "date" est requis (format: YYYY-MM-DD)'
-            }, status=status.HTTP_400_BAD_REQUEST)
-        
-        try:
-            date = datetime.strptime(date_str, '%Y-%m-%d').date()
-        except ValueError:
-            return Response({
-                'error': 'Format de date invalide. Utilisez YYYY-MM-DD'
-            }, status=status.HTTP_400_BAD_REQUEST)
-        
-        rendez_vous = RendezVous.objects.filter(
-            date_rdv=date
-        ).order_by('heure_rdv')
-        
-        serializer = self.get_serializer(rendez_vous, many=True)
-        return Response(serializer.data)
-    
-    @action(detail=False, methods=['get'])
-    def aujourd_hui(self, request):
-        """Obtenir tous les rendez-vous d'aujourd'hui"""
-        aujourd_hui = timezone.now().date()
-        rendez_vous = RendezVous.objects.filter(
-            date_rdv=aujourd_hui
-        ).order_by('heure_rdv')
-        
-        serializer = self.get_serializer(rendez_vous, many=True)
-        return Response(serializer.data)
-    
-    @action(detail=False, methods=['get'])
-    def prochains(self, request):
-        """Obtenir les prochains rendez-vous (aujourd'hui et demain)"""
-        aujourd_hui = timezone.now().date()
-        demain = aujourd_hui + timedelta(days=1)
-        
-        rendez_vous = RendezVous.objects.filter(
-            date_rdv__in=[aujourd_hui, demain],
-            statut__in=['en_attente', 'valide']
-        ).order_by('date_rdv', 'heure_rdv')
-        
-        serializer = self.get_serializer(rendez_vous, many=True)
-        return Response(serializer.data)
-    
     @action(detail=True, methods=['get'])
     def qr_code(self, request, pk=None):
         """Obtenir le QR code d'un rendez-vous"""
         rendez_vous = self.get_object()
         if rendez_vous.qr_code:
             return Response({
-                'qr_code_url': request.build_absolute_uri(rendez_vous.qr_code.url),
+                'qr_code_url': rendez_vous.get_qr_code_url(request),
                 'code_unique': rendez_vous.code_unique
             })
         else:
@@ -243,6 +222,12 @@ class RendezVousPublicViewSet(viewsets.ReadOnlyModelViewSet):
     serializer_class = RendezVousSerializer
     permission_classes = [AllowAny]
     
+    def get_portee_limitation(self, request):
+        # Les filtres plaque/CIN (icontains) coûtent un parcours de table
+        if 'plaque' in request.query_params or 'cin' in request.query_params:
+            return 'recherche'
+        return 'liste'
+    
     def get_queryset(self):
         """Filtrer les rendez-vous selon les paramètres"""
         queryset = RendezVous.objects.all()
@@ -277,37 +262,8 @@ class EmailTokenObtainPairSerializer(serializers.Serializer):
     email = serializers.EmailField()
     password = serializers.CharField(write_only=True)
 
-    def validate(self, attrs):
-        email = attrs.get('email')
-        password = attrs.get('password')
-        
-        from django.contrib.auth import get_user_model
-        User = get_user_model()
-        try:
-            # Utiliser filter().first() au lieu de get() pour éviter MultipleObjectsReturned
-            user = User.objects.filter(email=email).first()
-            if not user:
-                raise serializers.ValidationError({'detail': 'Email ou mot de passe invalide.'})
-        except Exception as e:
-            raise serializers.ValidationError({'detail': 'Email ou mot de passe invalide.'})
-        
-        if not user.check_password(password):
-            raise serializers.ValidationError({'detail': 'Email ou mot de passe invalide.'})
-        
-        if not user.is_active:
-            raise serializers.ValidationError({'detail': 'Ce compte est inactif.'})
-
-        # Générer les tokens JWT
-        refresh = RefreshToken.for_user(user)
-        
-        # Retourner les données
-        return {
-            'refresh': str(refresh),
-            'access': str(refresh.access_token),
-            'email': user.email,
-            'first_name': user.first_name,
-            'last_name': user.last_name,
-        }
+    def validate_email(self, value):
+        return normaliser_email(value)
 
 class ProfilUtilisateurView(generics.RetrieveAPIView):
     """Vue pour récupérer les informations du profil utilisateur"""
@@ -320,9 +276,8 @@ class ProfilUtilisateurView(generics.RetrieveAPIView):
     def retrieve(self, request, *args, **kwargs):
         user = self.get_object()
         try:
-            profil = user.profil
-            telephone = profil.telephone
-        except:
+            telephone = user.profil.telephone
+        except Profil.DoesNotExist:
             telephone = "Non renseigné"
         
         data = {
@@ -333,22 +288,89 @@ class ProfilUtilisateurView(generics.RetrieveAPIView):
         }
         return Response(data)
 
-class EmailTokenObtainPairView(TokenObtainPairView):
-    serializer_class = EmailTokenObtainPairSerializer
-
-class MesRendezVousView(APIView):
+class TableauDeBordView(APIView):
+    """
+    Écran d'accueil en une requête : profil, compteurs par statut,
+    prochains rendez-vous et historique récent. Supporte If-None-Match.
+    """
     permission_classes = [IsAuthenticated]
+    NOMBRE_PROCHAINS = 5
+    NOMBRE_HISTORIQUE = 10
+
     def get(self, request):
-        # Récupérer les rendez-vous de l'utilisateur connecté
-        rdvs = RendezVous.objects.filter(user=request.user).order_by('-date_creation')
-        serializer = RendezVousSerializer(rdvs, many=True, context={'request': request})
-        return Response(serializer.data)
+        user = User.objects.select_related('profil').get(pk=request.user.pk)
+        rdvs = RendezVous.objects.filter(user_id=user.pk)
+        compteurs = rdvs.aggregate(
+            total=Count('id'),
+            derniere_modification=Max('date_modification'),
+            **{statut: Count('id', filter=Q(statut=statut)) for statut, _ in RendezVous.STATUT_CHOICES}
+        )
+        derniere_modification = compteurs.pop('derniere_modification')
+        try:
+            telephone = user.profil.telephone
+        except Profil.DoesNotExist:
+            telephone = "Non renseigné"
+        profil = {
+            'email': user.email,
+            'first_name': user.first_name,
+            'last_name': user.last_name,
+            'telephone': telephone,
+        }
+        aujourd_hui = timezone.localdate()
+
+        # Les listes ne changent que si le profil, un rendez-vous ou la date changent
+        empreinte = repr((profil, compteurs, derniere_modification, aujourd_hui))
+        etag = f'"{hashlib.md5(empreinte.encode()).hexdigest()}"'
+        not_modified = get_conditional_response(request, etag=etag)
+        if not_modified is not None:
+            return not_modified
+
+        prochains = rdvs.filter(
+            date_rdv__gte=aujourd_hui,
+            statut__in=['en_attente', 'valide']
+        ).order_by('date_rdv', 'heure_rdv')[:self.NOMBRE_PROCHAINS]
+        historique = rdvs.order_by('-date_creation')[:self.NOMBRE_HISTORIQUE]
+        contexte = {'request': request}
+        response = Response({
+            'profil': profil,
+            'compteurs': compteurs,
+            'prochains': RendezVousSerializer(prochains, many=True, context=contexte).data,
+            'historique': RendezVousSerializer(historique, many=True, context=contexte).data,
+        })
+        response['ETag'] = etag
+        response['Cache-Control'] = 'private, no-cache'
+        return response
+
+@method_decorator(csrf_exempt, name='dispatch')
+class EmailTokenObtainPairView(View):
+    """Connexion par email, asynchrone pour sortir le hachage du mot de passe du worker"""
+    http_method_names = ['post']
+
+    async def post(self, request):
+        if request.content_type == 'application/json':
+            try:
+                data = json.loads(request.body or b'{}')
+            except ValueError:
+                return JsonResponse({'detail': 'Corps de requête JSON invalide.'}, status=400)
+        else:
+            data = request.POST
+        serializer = EmailTokenObtainPairSerializer(data=data)
+        if not serializer.is_valid():
+            return JsonResponse(serializer.errors, status=400)
+
+        user = await averifier_identifiants(**serializer.validated_data)
+        if user is None:
+            return JsonResponse({'detail': 'Email ou mot de passe invalide.'}, status=400)
+        if not user.is_active:
+            return JsonResponse({'detail': 'Ce compte est inactif.'}, status=400)
+        return JsonResponse(generer_tokens(user))
 
 class ModifierRendezVousView(APIView):
     permission_classes = [IsAuthenticated]
     
+    @idempotent
     def put(self, request, pk):
-        """Modifier un rendez-vous existant"""
+        """Modifier un rendez-vous existant (rejouable avec Idempotency-Key)"""
         try:
             # Vérifier que le rendez-vous appartient à l'utilisateur
             rendez_vous = RendezVous.objects.get(
@@ -429,7 +451,8 @@ class ChangePasswordView(APIView):
     permission_classes = [IsAuthenticated]
 
     def post(self, request):
-        user = request.user
+        # request.user est reconstruit depuis le cache JWT, sans mot de passe
+        user = User.objects.get(pk=request.user.pk)
         old_password = request.data.get('old_password')
         new_password = request.data.get('new_password')
         new_password_confirm = request.data.get('new_password_confirm')
@@ -443,7 +466,126 @@ class ChangePasswordView(APIView):
         # Suppression de la validation du mot de passe
         user.set_password(new_password)
         user.save()
-        return Response({'detail': 'Mot de passe changé avec succès.'})
+        # Les tokens précédents sont révoqués : renvoyer une nouvelle paire
+        tokens = generer_tokens(user)
+        return Response({
+            'detail': 'Mot de passe changé avec succès.',
+            'access': tokens['access'],
+            'refresh': tokens['refresh'],
+        })
+
+class ImportComptesView(APIView):
+    """Import en masse de comptes transporteurs (roster CSV/JSON), réservé aux administrateurs"""
+    permission_classes = [IsAdminUser]
+
+    def post(self, request):
+        fichier = request.FILES.get('fichier')
+        try:
+            if fichier:
+                lignes = lire_roster(fichier.read())
+            elif isinstance(request.data, list):
+                lignes = request.data
+            else:
+                lignes = request.data.get('comptes')
+        except ValueError as e:
+            return Response({'error': f'Roster illisible : {e}'}, status=status.HTTP_400_BAD_REQUEST)
+        if not isinstance(lignes, list):
+            return Response({
+                'error': 'Envoyer un fichier "fichier" (CSV ou JSON) ou une liste "comptes"'
+            }, status=status.HTTP_400_BAD_REQUEST)
+        return Response(importer_comptes(lignes))
+
+class StatistiquesView(APIView):
+    """
+    Compteurs de rendez-vous sur une période, lus dans StatistiqueRendezVous :
+    le coût dépend du nombre de jours et de créneaux, pas du volume de rendez-vous.
+
+    ?du=YYYY-MM-DD&au=YYYY-MM-DD (défaut : aujourd'hui), grouper=date_rdv,heure_rdv
+    (n'importe quelles dimensions), filtres operation, sens_trafic, type_conteneur
+    et statut (valeurs séparées par des virgules).
+    """
+    permission_classes = [IsAdminUser]
+    GROUPER_DEFAUT = ['date_rdv', 'heure_rdv']
+    FILTRES = ['operation', 'sens_trafic', 'type_conteneur', 'statut']
+
+    def get(self, request):
+        try:
+            du = datetime.strptime(request.GET.get('du') or timezone.localdate().isoformat(), '%Y-%m-%d').date()
+            au = datetime.strptime(request.GET['au'], '%Y-%m-%d').date() if request.GET.get('au') else du
+        except ValueError:
+            return Response({
+                'error': 'Format de date invalide. Utilisez YYYY-MM-DD'
+            }, status=status.HTTP_400_BAD_REQUEST)
+        if du > au:
+            return Response({'error': '"du" doit précéder "au"'}, status=status.HTTP_400_BAD_REQUEST)
+
+        grouper = request.GET['grouper'].split(',') if 'grouper' in request.GET else self.GROUPER_DEFAUT
+        grouper = [champ for champ in grouper if champ]
+        inconnus = set(grouper) - set(DIMENSIONS_STATISTIQUES)
+        if inconnus:
+            return Response({
+                'error': f'Dimensions inconnues : {", ".join(sorted(inconnus))}. '
+                         f'Possibles : {", ".join(DIMENSIONS_STATISTIQUES)}'
+            }, status=status.HTTP_400_BAD_REQUEST)
+
+        compteurs = StatistiqueRendezVous.objects.filter(date_rdv__range=(du, au), nombre__gt=0)
+        for champ in self.FILTRES:
+            if request.GET.get(champ):
+                compteurs = compteurs.filter(**{f'{champ}__in': request.GET[champ].split(',')})
+
+        par_statut = compteurs.aggregate(**{
+            statut: Sum('nombre', filter=Q(statut=statut), default=0) for statut, _ in RendezVous.STATUT_CHOICES
+        })
+        lignes = compteurs.values(*grouper).annotate(nombre=Sum('nombre')).order_by(*grouper) if grouper else []
+        return Response({
+            'du': du,
+            'au': au,
+            'grouper': grouper,
+            'total': sum(par_statut.values()),
+            'par_statut': par_statut,
+            'lignes': list(lignes),
+        })
+
+class ChargeView(APIView):
+    """
+    Charge historique par jour de semaine × créneau × opération (réservations,
+    taux d'annulation et d'absence) et prévision des semaines à venir
+    (administrateurs). ?jours=365 d'historique, ?semaines=4 de prévision,
+    ?recalculer=1 pour ignorer l'artefact en cache.
+    """
+    permission_classes = [IsAdminUser]
+
+    def get(self, request):
+        try:
+            jours = int(request.GET.get('jours') or 365)
+            semaines = int(request.GET.get('semaines') or 4)
+        except ValueError:
+            return Response({'error': '"jours" et "semaines" doivent être des entiers'},
+                            status=status.HTTP_400_BAD_REQUEST)
+        if not 7 <= jours <= settings.ANALYSE_JOURS_MAX or not 1 <= semaines <= settings.ANALYSE_SEMAINES_MAX:
+            return Response({
+                'error': f'"jours" entre 7 et {settings.ANALYSE_JOURS_MAX}, '
+                         f'"semaines" entre 1 et {settings.ANALYSE_SEMAINES_MAX}'
+            }, status=status.HTTP_400_BAD_REQUEST)
+        resultat = prevision.analyse(jours, semaines, recalculer=request.GET.get('recalculer') == '1')
+        return Response(prevision.en_json(resultat))
+
+class ProfilsView(APIView):
+    """Captures de profilage disponibles, les plus récentes d'abord (administrateurs)"""
+    permission_classes = [IsAdminUser]
+
+    def get(self, request):
+        return Response([lire_resume(identifiant) for identifiant in lister_identifiants()])
+
+class ProfilFichierView(APIView):
+    """Téléchargement d'une capture : 'prof' (pstats) ou 'sql' (requête et trace SQL)"""
+    permission_classes = [IsAdminUser]
+
+    def get(self, request, identifiant, type_fichier):
+        chemin = chemin_capture(identifiant, type_fichier)
+        if chemin is None or not os.path.exists(chemin):
+            raise Http404
+        return FileResponse(open(chemin, 'rb'), as_attachment=True, filename=os.path.basename(chemin))
 
 @api_view(['GET', 'POST'])
 def test_api(request):
@@ -458,3 +600,211 @@ def test_api(request):
         'message': 'API fonctionne !',
         'method': 'GET'
     })
+
+PLAGE_OCTETS = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+@require_safe
+def servir_qr_code(request, nom):
+    """
+    Sert un QR code. Le nom contient l'UUID du rendez-vous : le fichier est
+    immuable et peut être mis en cache indéfiniment. Selon MEDIA_SENDFILE,
+    l'envoi est délégué au serveur web (X-Accel-Redirect / X-Sendfile),
+    sinon FileResponse laisse le serveur WSGI utiliser sendfile.
+    """
+    chemin = os.path.join(settings.MEDIA_ROOT, 'qr_codes', nom)
+    try:
+        stat = os.stat(chemin)
+    except FileNotFoundError:
+        raise Http404('QR code non disponible')
+
+    etag = f'"{stat.st_size:x}-{int(stat.st_mtime):x}"'
+    response = get_conditional_response(request, etag=etag, last_modified=int(stat.st_mtime))
+    if response is None:
+        if settings.MEDIA_SENDFILE == 'x-accel-redirect':
+            response = HttpResponse(content_type='image/png')
+            response['X-Accel-Redirect'] = f"{settings.MEDIA_SENDFILE_PREFIXE}qr_codes/{nom}"
+        elif settings.MEDIA_SENDFILE == 'x-sendfile':
+            response = HttpResponse(content_type='image/png')
+            response['X-Sendfile'] = chemin
+        else:
+            response = _reponse_fichier(request, chemin, stat.st_size, etag)
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(stat.st_mtime)
+    response['Cache-Control'] = 'public, max-age=31536000, immutable'
+    return response
+
+
+def _reponse_fichier(request, chemin, taille, etag):
+    """FileResponse complète, ou réponse 206 pour une plage d'octets unique"""
+    plage = PLAGE_OCTETS.match(request.headers.get('Range', ''))
+    if_range = request.headers.get('If-Range')
+    if not plage or (if_range and if_range != etag):
+        response = FileResponse(open(chemin, 'rb'), content_type='image/png')
+        response['Accept-Ranges'] = 'bytes'
+        return response
+
+    debut, fin = plage.groups()
+    if debut:
+        debut, fin = int(debut), min(int(fin) if fin else taille - 1, taille - 1)
+    elif fin:
+        debut, fin = max(taille - int(fin), 0), taille - 1
+    else:
+        debut, fin = taille, 0
+    if debut > fin:
+        response = HttpResponse(status=416)
+        response['Content-Range'] = f'bytes */{taille}'
+        return response
+    with open(chemin, 'rb') as f:
+        f.seek(debut)
+        response = HttpResponse(f.read(fin - debut + 1), status=206, content_type='image/png')
+    response['Content-Range'] = f'bytes {debut}-{fin}/{taille}'
+    response['Accept-Ranges'] = 'bytes'
+    return response
+
+
+# Fichiers du build webpack versionnés par leur contenu (voir frontend/webpack.config.js)
+ASSET_VERSIONNE = re.compile(r'^assets/.+\.[0-9a-f]{12}\.\w+$')
+# Variantes précompressées par ordre de préférence : (Content-Encoding, suffixe)
+VARIANTES_COMPRESSEES = (('br', '.br'), ('gzip', '.gz'))
+
+
+def _encodages_acceptes(request):
+    """{encodage: q} d'après Accept-Encoding"""
+    acceptes = {}
+    for element in request.headers.get('Accept-Encoding', '').split(','):
+        nom, _, parametre = element.partition(';')
+        parametre = parametre.strip()
+        try:
+            q = float(parametre[2:]) if parametre.startswith('q=') else 1.0
+        except ValueError:
+            q = 0.0
+        if nom.strip():
+            acceptes[nom.strip().lower()] = q
+    return acceptes
+
+
+@require_safe
+def servir_frontend(request, chemin=''):
+    """
+    Sert le frontend construit (FRONTEND_DIST) sur la même origine que l'API.
+    Les fichiers versionnés (assets/*.<hash>.*) sont immuables ; index.html,
+    servi aussi pour les routes React, est revalidé à chaque chargement. La
+    variante .br ou .gz est choisie selon Accept-Encoding.
+    """
+    try:
+        fichier = safe_join(settings.FRONTEND_DIST, chemin or 'index.html')
+    except SuspiciousFileOperation:
+        raise Http404
+    if not os.path.isfile(fichier):
+        if chemin.startswith('assets/') or '.' in os.path.basename(chemin):
+            raise Http404
+        # Route de l'application (BrowserRouter)
+        fichier, chemin = os.path.join(settings.FRONTEND_DIST, 'index.html'), 'index.html'
+        if not os.path.isfile(fichier):
+            raise Http404('Frontend non construit : cd frontend && npm run build')
+
+    acceptes = _encodages_acceptes(request)
+    encodage, source = None, fichier
+    for nom, suffixe in VARIANTES_COMPRESSEES:
+        if acceptes.get(nom, acceptes.get('*', 0)) > 0 and os.path.isfile(fichier + suffixe):
+            encodage, source = nom, fichier + suffixe
+            break
+    stat = os.stat(source)
+    etag = f'"{stat.st_size:x}-{int(stat.st_mtime):x}{"-" + encodage if encodage else ""}"'
+    response = get_conditional_response(request, etag=etag, last_modified=int(stat.st_mtime))
+    if response is None:
+        type_contenu = mimetypes.guess_type(fichier)[0] or 'application/octet-stream'
+        response = FileResponse(open(source, 'rb'), content_type=type_contenu, filename=os.path.basename(fichier))
+        if encodage:
+            response['Content-Encoding'] = encodage
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(stat.st_mtime)
+    response['Vary'] = 'Accept-Encoding'
+    if ASSET_VERSIONNE.match(chemin):
+        response['Cache-Control'] = 'public, max-age=31536000, immutable'
+    else:
+        response['Cache-Control'] = 'no-cache'
+    return response
+
+
+def _bearer_valide(request, jeton):
+    """En-tête Authorization: Bearer <jeton>, comparé en temps constant"""
+    return hmac.compare_digest(request.headers.get('Authorization', '').encode(), f'Bearer {jeton}'.encode())
+
+
+@require_safe
+def metriques(request):
+    """Métriques au format texte Prometheus (jeton Bearer METRIQUES_JETON ; libre seulement en DEBUG)"""
+    jeton = settings.METRIQUES_JETON
+    if jeton or not settings.DEBUG:
+        if not jeton or not _bearer_valide(request, jeton):
+            return HttpResponse(status=403)
+    return HttpResponse(generate_latest(registre_de_collecte()), content_type=CONTENT_TYPE_LATEST)
+
+
+def _jeton_synchro_valide(request):
+    jeton = settings.SYNCHRO_JETON
+    return bool(jeton) and _bearer_valide(request, jeton)
+
+
+@require_safe
+def changements_synchro(request):
+    """
+    Journal des changements de rendez-vous pour le portail interne (jeton Bearer
+    SYNCHRO_JETON, endpoint fermé s'il est vide).
+
+    ?since=<sequence> (0 au départ) &limit=<n> : événements suivants dans l'ordre,
+    `curseur` à renvoyer au prochain appel, `suite` s'il en reste. 410 si des
+    événements postérieurs à `since` ont été purgés (resynchronisation complète) :
+    `since` est la dernière séquence traitée, rien n'est perdu si la plus
+    ancienne conservée est `since + 1`.
+    """
+    if not _jeton_synchro_valide(request):
+        return JsonResponse({'detail': 'Jeton de synchronisation requis.'}, status=403)
+    try:
+        depuis = int(request.GET.get('since') or 0)
+        limite = min(int(request.GET.get('limit') or settings.SYNCHRO_TAILLE_LOT), settings.SYNCHRO_TAILLE_LOT_MAX)
+    except ValueError:
+        return JsonResponse({'error': '"since" et "limit" doivent être des entiers'}, status=400)
+    if depuis < 0 or limite < 1:
+        return JsonResponse({'error': '"since" doit être positif et "limit" au moins 1'}, status=400)
+    plus_ancienne = synchro.plus_ancienne_sequence()
+    if depuis and plus_ancienne is not None and depuis < plus_ancienne - 1:
+        return JsonResponse({
+            'error': 'Événements purgés depuis ce curseur : resynchronisation complète nécessaire',
+            'plus_ancienne_sequence': plus_ancienne,
+        }, status=410)
+    evenements, suite = synchro.lire(depuis, limite)
+    return JsonResponse({
+        'evenements': evenements,
+        'curseur': evenements[-1]['sequence'] if evenements else depuis,
+        'suite': suite,
+    })
+
+
+@require_safe
+def reconciliation(request):
+    """
+    Empreintes hiérarchiques des rendez-vous (voir reconciliation.py), jeton
+    SYNCHRO_JETON : ?du=&au= par jour, ?date= par créneau, ?date=&heure=
+    par rendez-vous.
+    """
+    if not _jeton_synchro_valide(request):
+        return JsonResponse({'detail': 'Jeton de synchronisation requis.'}, status=403)
+    try:
+        if request.GET.get('date'):
+            date_rdv = datetime.strptime(request.GET['date'], '%Y-%m-%d').date()
+            heure = datetime.strptime(request.GET['heure'], '%H:%M').time() if request.GET.get('heure') else None
+            return JsonResponse(resume_local(date_rdv=date_rdv, heure_rdv=heure))
+        du = datetime.strptime(request.GET['du'], '%Y-%m-%d').date()
+        au = datetime.strptime(request.GET['au'], '%Y-%m-%d').date()
+    except (KeyError, ValueError):
+        return JsonResponse({
+            'error': 'Paramètres attendus : du et au, ou date (YYYY-MM-DD) et heure (HH:MM)'
+        }, status=400)
+    if not 0 <= (au - du).days < settings.RECONCILIATION_JOURS_MAX:
+        return JsonResponse({
+            'error': f'Période de 1 à {settings.RECONCILIATION_JOURS_MAX} jours, "du" avant "au"'
+        }, status=400)
+    return JsonResponse(resume_local(du, au))
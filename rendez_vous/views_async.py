@@ -0,0 +1,239 @@
+"""
+Vues de lecture asynchrones natives (ORM asynchrone de Django).
+
+Sous ASGI elles ne monopolisent pas de thread pendant les accès à la base ;
+sous WSGI elles fonctionnent aussi, exécutées dans une boucle par requête.
+"""
+from datetime import datetime, timedelta
+
+import asyncio
+import math
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
+from django.db.models import Count
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
+from django.utils import timezone
+from django.views import View
+from rest_framework.exceptions import APIException, Throttled
+from rest_framework.utils.encoders import JSONEncoder
+
+from .authentication import JWTAuthenticationCache
+from .creneaux import prochains_creneaux
+from .diffusion import diffuseur, evenement, instantane
+from .instrumentation import mesurer
+from .limitation import attente_requise, entete_retry_after
+from .models import RendezVous
+from .salle_attente import etat_file, file_attente, jeton_passage, lire_ticket, salle
+from .serializers import RendezVousSerializer
+
+
+def _json(data, status=200):
+    with mesurer('rendu'):
+        return JsonResponse(data, status=status, safe=False, encoder=JSONEncoder)
+
+
+class VueLectureAsync(View):
+    """Base des vues de lecture asynchrones : GET uniquement, réponses JSON, débit limité"""
+    http_method_names = ['get', 'options']
+    portee_limitation = 'liste'
+    # Renseigné par VueAuthentifieeAsync ; request.user serait ici l'utilisateur de
+    # session, chargé en base de façon synchrone
+    utilisateur = None
+
+    async def dispatch(self, request, *args, **kwargs):
+        # Hors DRF : même seau que LimitationSeaux
+        attente = attente_requise(request, self.portee_limitation, self.utilisateur)
+        if attente:
+            response = _json({'detail': Throttled(attente).detail}, status=429)
+            response['Retry-After'] = entete_retry_after(attente)
+            return response
+        return await super().dispatch(request, *args, **kwargs)
+
+    async def liste(self, request, queryset):
+        rendez_vous = [rdv async for rdv in queryset]
+        return _json(RendezVousSerializer(rendez_vous, many=True, context={'request': request}).data)
+
+
+class VueAuthentifieeAsync(VueLectureAsync):
+    """Vue asynchrone réservée aux utilisateurs authentifiés par JWT"""
+    authentification = JWTAuthenticationCache()
+
+    async def dispatch(self, request, *args, **kwargs):
+        try:
+            resultat = await sync_to_async(self.authentification.authenticate)(request)
+        except APIException as e:
+            resultat = None
+            data = e.detail if isinstance(e.detail, dict) else {'detail': e.detail}
+        else:
+            data = {'detail': "Informations d'authentification non fournies."}
+        if resultat is None:
+            response = _json(data, status=401)
+            response['WWW-Authenticate'] = self.authentification.authenticate_header(request)
+            return response
+        request.user = self.utilisateur = resultat[0]
+        return await super().dispatch(request, *args, **kwargs)
+
+
+class AujourdHuiView(VueLectureAsync):
+    async def get(self, request):
+        """Obtenir tous les rendez-vous d'aujourd'hui"""
+        aujourd_hui = timezone.now().date()
+        return await self.liste(request, RendezVous.objects.filter(
+            date_rdv=aujourd_hui
+        ).order_by('heure_rdv'))
+
+
+class ProchainsView(VueLectureAsync):
+    async def get(self, request):
+        """Obtenir les prochains rendez-vous (aujourd'hui et demain)"""
+        aujourd_hui = timezone.now().date()
+        demain = aujourd_hui + timedelta(days=1)
+        return await self.liste(request, RendezVous.objects.filter(
+            date_rdv__in=[aujourd_hui, demain],
+            statut__in=['en_attente', 'valide']
+        ).order_by('date_rdv', 'heure_rdv'))
+
+
+class ParDateView(VueLectureAsync):
+    async def get(self, request):
+        """Rechercher les rendez-vous par date"""
+        date_str = request.GET.get('date')
+        if not date_str:
+            return _json({
+                'error': 'Le paramètre "date" est requis (format: YYYY-MM-DD)'
+            }, status=400)
+        try:
+            date = datetime.strptime(date_str, '%Y-%m-%d').date()
+        except ValueError:
+            return _json({
+                'error': 'Format de date invalide. Utilisez YYYY-MM-DD'
+            }, status=400)
+        return await self.liste(request, RendezVous.objects.filter(
+            date_rdv=date
+        ).order_by('heure_rdv'))
+
+
+class MesRendezVousView(VueAuthentifieeAsync):
+    async def get(self, request):
+        """Rendez-vous de l'utilisateur connecté"""
+        return await self.liste(request, RendezVous.objects.filter(
+            user_id=request.user.pk
+        ).order_by('-date_creation'))
+
+
+class CreneauxPleinsView(VueLectureAsync):
+    @file_attente
+    async def get(self, request):
+        """Retourne les heures de début des créneaux complets pour une date"""
+        try:
+            date = datetime.strptime(request.GET.get('date') or '', '%Y-%m-%d').date()
+        except ValueError:
+            return _json({
+                'error': 'Le paramètre "date" est requis (format: YYYY-MM-DD)'
+            }, status=400)
+        pleins = RendezVous.objects.filter(
+            date_rdv=date,
+            statut__in=['en_attente', 'valide']
+        ).values('heure_rdv').annotate(
+            nombre=Count('id')
+        ).filter(nombre__gte=settings.CAPACITE_CRENEAU).order_by('heure_rdv')
+        return _json([c['heure_rdv'].strftime('%H:%M') async for c in pleins])
+
+
+class ProchainsCreneauxView(VueAuthentifieeAsync):
+    @file_attente
+    async def get(self, request):
+        """
+        Premiers créneaux réservables à partir de ?date= (défaut : aujourd'hui),
+        ni complets ni en conflit avec les rendez-vous du camion ?plaque=.
+        ?operation= applique aussi CAPACITE_CRENEAU_PAR_OPERATION ; ?n= (défaut 5).
+        """
+        aujourd_hui = timezone.localdate()
+        try:
+            du = datetime.strptime(request.GET['date'], '%Y-%m-%d').date() if request.GET.get('date') else aujourd_hui
+            nombre = int(request.GET.get('n') or 5)
+        except ValueError:
+            return _json({'error': 'Paramètres invalides : date au format YYYY-MM-DD, n entier'}, status=400)
+        if not 1 <= nombre <= settings.PROCHAINS_CRENEAUX_MAX:
+            return _json({'error': f'n doit être compris entre 1 et {settings.PROCHAINS_CRENEAUX_MAX}'}, status=400)
+        operation = request.GET.get('operation') or None
+        if operation is not None and operation not in dict(RendezVous.OPERATION_CHOICES):
+            return _json({'error': 'Opération invalide (import ou export)'}, status=400)
+        creneaux = await prochains_creneaux(
+            nombre, max(du, aujourd_hui), operation, (request.GET.get('plaque') or '').strip().upper() or None,
+        )
+        return _json({'creneaux': creneaux, 'jours': settings.PROCHAINS_CRENEAUX_JOURS})
+
+
+class FileAttenteView(VueLectureAsync):
+    async def get(self, request):
+        """
+        Position d'un ticket de la salle d'attente. Quand son tour vient, la
+        réponse porte le jeton `passage` à renvoyer dans l'en-tête
+        X-Salle-Attente en rejouant la requête. 410 si le tour est passé.
+        """
+        ticket = lire_ticket(request.GET.get('jeton') or '')
+        if ticket is None:
+            return _json({'error': 'Jeton de file d\'attente invalide ou expiré'}, status=400)
+        decision = salle().consulter(ticket)
+        if decision.entree is not None:
+            return _json({'admis': True, 'passage': jeton_passage(ticket, decision.entree)})
+        if decision.position is None:
+            return _json({'error': 'Tour passé, renouvelez votre demande'}, status=410)
+        etat = etat_file(decision)
+        response = _json({'admis': False, **etat})
+        response['Retry-After'] = str(math.ceil(etat['consulter_dans']))
+        return response
+
+
+class FluxCreneauxView(VueLectureAsync):
+    """
+    Occupation des créneaux d'une date en Server-Sent Events : `instantane`
+    (tous les créneaux) puis `occupation` (créneaux modifiés) à chaque commit.
+    La connexion est fermée après DIFFUSION_DUREE_MAX secondes ; EventSource
+    se reconnecte seul et repart d'un nouvel instantané.
+    """
+
+    async def get(self, request):
+        try:
+            date = datetime.strptime(request.GET.get('date') or '', '%Y-%m-%d').date()
+        except ValueError:
+            return _json({
+                'error': 'Le paramètre "date" est requis (format: YYYY-MM-DD)'
+            }, status=400)
+        if not isinstance(request, ASGIRequest):
+            # Sous WSGI un flux bloquerait un thread par client : instantané
+            # seul, le navigateur revient après `retry`
+            corps = f'retry: {settings.DIFFUSION_BATTEMENT * 1000}\n\n'.encode()
+            corps += evenement('instantane', self.donnees(date, await instantane(date)))
+            return self.entetes(HttpResponse(corps, content_type='text/event-stream'))
+        abonnement = diffuseur.abonner(date.isoformat())
+        return self.entetes(StreamingHttpResponse(self.flux(abonnement, date), content_type='text/event-stream'))
+
+    def donnees(self, date, creneaux):
+        return {'date': date.isoformat(), 'capacite': settings.CAPACITE_CRENEAU, 'creneaux': creneaux}
+
+    async def flux(self, abonnement, date):
+        boucle = asyncio.get_running_loop()
+        fin = boucle.time() + settings.DIFFUSION_DUREE_MAX
+        try:
+            # Abonné avant de lire l'instantané : aucun changement ne passe entre les deux
+            yield evenement('instantane', self.donnees(date, await instantane(date)))
+            while (reste := fin - boucle.time()) > 0:
+                creneaux = await abonnement.attendre(min(settings.DIFFUSION_BATTEMENT, reste))
+                if creneaux:
+                    yield evenement('occupation', self.donnees(date, creneaux))
+                else:
+                    # Garde la connexion ouverte à travers les proxys
+                    yield b': battement\n\n'
+        finally:
+            diffuseur.desabonner(abonnement)
+
+    @staticmethod
+    def entetes(response):
+        response['Cache-Control'] = 'no-cache'
+        # nginx : pas de mise en tampon du flux
+        response['X-Accel-Buffering'] = 'no'
+        return response